@@ -0,0 +1,81 @@
+"""
+Микробенчмарк разбора и валидации payload от 1F (POST /api/v1/ka-bot/requests).
+
+before: Dict[str, Any] + ручные .get()/str()/int() + проверка телефона + jsonable_encoder/json
+after:  вложенные строгие модели (один проход валидации) + orjson
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_ingest_parse [--n 50000]
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import timeit
+from typing import Any, Dict
+
+import orjson
+from fastapi.encoders import jsonable_encoder
+from pydantic import BaseModel
+
+from receive_from_1f import CreateRequestIn
+
+RAW = json.dumps({
+    "ID": 123456,
+    "User": {"FullName": "Иванов Иван", "DateOfBirth": "1990-01-02", "Phonenumber": "+992900123456"},
+    "Car": {
+        "CarId": 77, "Brand": "Toyota", "Model": "Camry", "Motor": "2.5",
+        "Price": "250000", "Currency": "TJS", "Year": 2021, "Color": "white",
+    },
+}, ensure_ascii=False).encode("utf-8")
+
+
+class LegacyCreateRequestIn(BaseModel):
+    ID: int
+    User: Dict[str, Any]
+    Car: Dict[str, Any]
+
+
+def before() -> bytes:
+    payload = LegacyCreateRequestIn.model_validate(json.loads(RAW))
+    full_name = str(payload.User.get("FullName", "")).strip()
+    phone = str(payload.User.get("Phonenumber", "")).strip()
+    if not phone.startswith("+992"):
+        raise ValueError("phone")
+    car = payload.Car
+    values = dict(
+        user_full_name=full_name,
+        user_phone=phone,
+        car_brand=car.get("Brand", ""),
+        car_model=car.get("Model", ""),
+        car_year=int(car.get("Year", 0) or 0),
+        car_color=car.get("Color", ""),
+        car_motor=car.get("Motor", ""),
+        car_price=str(car.get("Price", "")),
+        car_currency=str(car.get("Currency", "")),
+    )
+    result = {"ok": True, "request_id": payload.ID, "status": "NEW", "sent_to_group": True, "values": values}
+    return json.dumps(jsonable_encoder(result), ensure_ascii=False).encode("utf-8")
+
+
+def after() -> bytes:
+    payload = CreateRequestIn.model_validate_json(RAW)
+    car = payload.Car.model_dump()
+    values = dict(user_full_name=payload.User.FullName, user_phone=payload.User.Phonenumber, **car)
+    result = {"ok": True, "request_id": payload.ID, "status": "NEW", "sent_to_group": True, "values": values}
+    return orjson.dumps(result)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=50_000)
+    args = parser.parse_args()
+
+    for name, fn in (("before", before), ("after", after)):
+        fn()
+        best = min(timeit.repeat(fn, number=args.n, repeat=3))
+        print(f"{name:<7} {args.n / best:>12,.0f} payloads/s  {best / args.n * 1e6:8.2f} us/payload")
+
+
+if __name__ == "__main__":
+    main()
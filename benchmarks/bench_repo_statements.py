@@ -0,0 +1,88 @@
+"""
+Python-накладные расходы на вызов горячих функций repo/requests_repo:
+«legacy» (конструкция select()/update() собирается на каждый вызов)
+против заранее собранных statements с bindparam.
+
+In-memory SQLite, без pragmas — чтобы разница была в Python, а не в I/O.
+Запуск из корня репозитория:
+    python -m benchmarks.bench_repo_statements [--n 5000]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import time
+
+from sqlalchemy import select, update
+
+from db import init_db, make_engine, make_sessionmaker
+from models import Request
+from repo.requests_repo import create_if_not_exists, get_by_external_id, get_onef_error_requests, try_mark_in_progress
+
+
+async def legacy_get_by_external_id(session, external_id: int):
+    res = await session.execute(select(Request).where(Request.external_id == external_id))
+    return res.scalar_one_or_none()
+
+
+async def legacy_try_mark_in_progress(session, external_id: int, executor_tg_id: int):
+    result = await session.execute(
+        update(Request)
+        .where(
+            Request.external_id == external_id,
+            Request.status == "ASSIGNED",
+            Request.assigned_to_tg_id == executor_tg_id,
+        )
+        .values(status="IN_PROGRESS")
+    )
+    await session.commit()
+    return (result.rowcount or 0) == 1, await legacy_get_by_external_id(session, external_id)
+
+
+async def legacy_get_onef_error_requests(session, limit: int = 50):
+    res = await session.execute(
+        select(Request).where(Request.status == "ERROR_ONEF").order_by(Request.created_at.asc()).limit(limit)
+    )
+    return list(res.scalars().all())
+
+
+async def _timeit(name: str, n: int, fn) -> None:
+    await fn(0)
+    started = time.perf_counter()
+    for i in range(n):
+        await fn(i)
+    elapsed = time.perf_counter() - started
+    print(f"{name:<36} {elapsed / n * 1e6:9.1f} us/call")
+
+
+async def main_async(n: int) -> None:
+    engine = make_engine("sqlite+aiosqlite://", sqlite_profile=False)
+    sessionmaker = make_sessionmaker(engine, sqlite_profile=False)
+    await init_db(engine)
+
+    async with sessionmaker() as session:
+        for i in range(1, 1001):
+            await create_if_not_exists(session, i, "Bench", "+992900000000", {"Brand": "B"})
+
+        ids = lambda i: 1 + i % 1000  # noqa: E731
+
+        await _timeit("get_by_external_id legacy", n, lambda i: legacy_get_by_external_id(session, ids(i)))
+        await _timeit("get_by_external_id prebuilt", n, lambda i: get_by_external_id(session, ids(i)))
+        # статус NEW -> условие не совпадает, меряется чистый UPDATE + commit + SELECT
+        await _timeit("try_mark_in_progress legacy", n, lambda i: legacy_try_mark_in_progress(session, ids(i), 1))
+        await _timeit("try_mark_in_progress prebuilt", n, lambda i: try_mark_in_progress(session, ids(i), 1))
+        await _timeit("get_onef_error_requests legacy", n, lambda i: legacy_get_onef_error_requests(session))
+        await _timeit("get_onef_error_requests prebuilt", n, lambda i: get_onef_error_requests(session))
+
+    await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=5000)
+    args = parser.parse_args()
+    asyncio.run(main_async(args.n))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,176 @@
+"""
+run_all.py (один процесс, uvloop) против двух процессов (main.py + uvicorn receive_from_1f:app):
+латентность POST /api/v1/ka-bot/requests и суммарный RSS процессов под нагрузкой.
+
+Telegram подменяется фейковым Bot API в этом же процессе (TELEGRAM_API_URL),
+БД — временный SQLite-файл. Только Linux (RSS читается из /proc).
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_runner [--requests 2000] [--concurrency 20]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import signal
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import aiohttp
+from aiohttp import web
+
+FAKE_API_PORT = 8781
+APP_PORT = 8782
+
+CAR = {"Brand": "Toyota", "Model": "Camry", "Motor": "2.5", "Price": "25000", "Currency": "USD", "Year": 2021, "Color": "white"}
+
+
+def _fake_bot_api() -> web.Application:
+    message_id = 0
+
+    async def handle(request: web.Request) -> web.Response:
+        nonlocal message_id
+        method = request.match_info["method"].lower()
+        data = dict(await request.post()) if request.can_read_body else {}
+
+        if method == "getme":
+            result = {"id": 1, "is_bot": True, "first_name": "KA Bot", "username": "ka_bot"}
+        elif method == "getupdates":
+            await asyncio.sleep(min(float(data.get("timeout") or 0), 1.0))
+            result = []
+        elif method == "sendmessage":
+            message_id += 1
+            result = {
+                "message_id": message_id,
+                "date": int(datetime.now().timestamp()),
+                "chat": {"id": int(data.get("chat_id", 0)), "type": "supergroup"},
+                "text": data.get("text", ""),
+            }
+        else:
+            result = True
+        return web.json_response({"ok": True, "result": result})
+
+    app = web.Application()
+    app.router.add_post("/bot{token}/{method}", handle)
+    return app
+
+
+def _rss_kb(pids: list[int]) -> int:
+    total = 0
+    for pid in pids:
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except FileNotFoundError:
+            pass
+    return total
+
+
+async def _wait_ready(http: aiohttp.ClientSession, procs: list[subprocess.Popen]) -> None:
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        for p in procs:
+            if p.poll() is not None:
+                raise RuntimeError(f"process exited early: {p.args}")
+        try:
+            async with http.get(f"http://127.0.0.1:{APP_PORT}/openapi.json") as resp:
+                if resp.status == 200:
+                    # polling-процессу тоже нужно время на старт
+                    await asyncio.sleep(2)
+                    return
+        except aiohttp.ClientError:
+            pass
+        await asyncio.sleep(0.2)
+    raise RuntimeError("app did not start")
+
+
+async def _load(http: aiohttp.ClientSession, first_id: int, n: int, concurrency: int) -> list[float]:
+    latencies: list[float] = []
+    sem = asyncio.Semaphore(concurrency)
+
+    async def one(external_id: int) -> None:
+        payload = {"ID": external_id, "User": {"FullName": "Bench User", "Phonenumber": "+992900000000"}, "Car": CAR}
+        async with sem:
+            started = time.perf_counter()
+            async with http.post(f"http://127.0.0.1:{APP_PORT}/api/v1/ka-bot/requests", json=payload) as resp:
+                await resp.read()
+                resp.raise_for_status()
+            latencies.append((time.perf_counter() - started) * 1000)
+
+    await asyncio.gather(*(one(first_id + i) for i in range(n)))
+    return latencies
+
+
+async def run(mode: str, n: int, concurrency: int) -> None:
+    db_path = tempfile.mktemp(suffix=".db")
+    env = {
+        **os.environ,
+        "DATABASE_URL": f"sqlite+aiosqlite:///{db_path}",
+        "TELEGRAM_API_URL": f"http://127.0.0.1:{FAKE_API_PORT}",
+        "API_PORT": str(APP_PORT),
+    }
+    if mode == "single":
+        commands = [[sys.executable, "run_all.py"]]
+    else:
+        commands = [
+            [sys.executable, "main.py"],
+            [sys.executable, "-m", "uvicorn", "receive_from_1f:app", "--port", str(APP_PORT), "--log-level", "warning"],
+        ]
+
+    procs = [subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL) for cmd in commands]
+    try:
+        async with aiohttp.ClientSession() as http:
+            await _wait_ready(http, procs)
+            await _load(http, 1, max(20, n // 10), concurrency)  # прогрев
+            started = time.perf_counter()
+            latencies = sorted(await _load(http, 1_000_000, n, concurrency))
+            elapsed = time.perf_counter() - started
+            rss_mb = _rss_kb([p.pid for p in procs]) / 1024
+
+        p = lambda q: latencies[min(len(latencies) - 1, int(len(latencies) * q))]  # noqa: E731
+        print(
+            f"{mode:<8} procs={len(procs)}  {n / elapsed:7.1f} req/s  "
+            f"p50={p(0.5):6.1f}ms p95={p(0.95):6.1f}ms p99={p(0.99):6.1f}ms "
+            f"mean={statistics.mean(latencies):6.1f}ms  rss={rss_mb:6.1f} MB"
+        )
+    finally:
+        for proc in procs:
+            proc.send_signal(signal.SIGINT)
+        for proc in procs:
+            try:
+                proc.wait(timeout=15)
+            except subprocess.TimeoutExpired:
+                proc.kill()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(db_path + suffix):
+                os.remove(db_path + suffix)
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    runner = web.AppRunner(_fake_bot_api(), access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, "127.0.0.1", FAKE_API_PORT).start()
+    try:
+        for mode in ("two", "single"):
+            await run(mode, args.requests, args.concurrency)
+    finally:
+        await runner.cleanup()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=20)
+    args = parser.parse_args()
+    asyncio.run(main_async(args))
+
+
+if __name__ == "__main__":
+    main()
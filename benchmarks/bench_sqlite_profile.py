@@ -0,0 +1,91 @@
+"""
+Сравнение SQLite-профиля (WAL + pragmas + сериализация писателей) с настройками
+по умолчанию на конкурентных accept / in_progress / decision + audit_log и чтениях.
+
+Запуск из корня репозитория:
+    python -m benchmarks.bench_sqlite_profile [--requests 500] [--concurrency 50]
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+
+from db import init_db, make_engine, make_sessionmaker
+from repo.audit_repo import add_audit_log
+from repo.requests_repo import (
+    create_if_not_exists,
+    get_by_external_id,
+    mark_decision,
+    try_accept_request,
+    try_mark_in_progress,
+)
+
+CAR = {"Brand": "Toyota", "Model": "Camry", "Year": 2021, "Color": "white", "Motor": "2.5", "Price": "1", "Currency": "TJS"}
+
+
+async def _flow(sessionmaker, external_id: int, errors: list[str]) -> None:
+    executor = 1000 + external_id
+    try:
+        async with sessionmaker() as session:
+            await try_accept_request(session, external_id, executor, "bench")
+        async with sessionmaker() as session:
+            await add_audit_log(session, action="ACCEPT", entity="request", entity_id=str(external_id), actor_tg_id=executor)
+        async with sessionmaker() as session:
+            await try_mark_in_progress(session, external_id, executor)
+        async with sessionmaker() as session:
+            await get_by_external_id(session, external_id)
+        async with sessionmaker() as session:
+            await mark_decision(session, external_id, executor, "APPROVED", "ok")
+        async with sessionmaker() as session:
+            await add_audit_log(session, action="DECISION", entity="request", entity_id=str(external_id), actor_tg_id=executor)
+    except Exception as e:
+        errors.append(type(e).__name__ + ": " + str(e).splitlines()[0][:80])
+
+
+async def run(profile: bool, n: int, concurrency: int) -> None:
+    path = tempfile.mktemp(suffix=".db")
+    engine = make_engine(f"sqlite+aiosqlite:///{path}", sqlite_profile=profile)
+    sessionmaker = make_sessionmaker(engine, sqlite_profile=profile)
+    try:
+        await init_db(engine)
+        async with sessionmaker() as session:
+            for i in range(1, n + 1):
+                await create_if_not_exists(session, i, "Bench User", "+992900000000", CAR)
+
+        errors: list[str] = []
+        sem = asyncio.Semaphore(concurrency)
+
+        async def one(i: int) -> None:
+            async with sem:
+                await _flow(sessionmaker, i, errors)
+
+        started = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(1, n + 1)))
+        elapsed = time.perf_counter() - started
+
+        name = "tuned" if profile else "default"
+        print(f"{name:<8} {n / elapsed:8.1f} flows/s  {elapsed:6.2f}s  errors={len(errors)}")
+        for e in sorted(set(errors))[:3]:
+            print(f"         {e}")
+    finally:
+        await engine.dispose()
+        for suffix in ("", "-wal", "-shm", "-journal"):
+            if os.path.exists(path + suffix):
+                os.remove(path + suffix)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--concurrency", type=int, default=50)
+    args = parser.parse_args()
+
+    for profile in (False, True):
+        asyncio.run(run(profile, args.requests, args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,211 @@
+"""
+Replay захваченных payload'ов 1F из JSONL в endpoint приёма заявок
+(POST /api/v1/ka-bot/requests).
+
+Строка файла — либо сам payload ({"ID": ..., "User": ..., "Car": ...}),
+либо конверт {"ts": <unix-время или ISO-8601>, "payload": {...}}.
+Файл читается построчно, поэтому многогигабайтные захваты не грузятся в память.
+
+Режимы темпа:
+    (по умолчанию)   максимальная пропускная способность (ограничена --concurrency)
+    --rate 50        постоянные 50 запросов/с
+    --recorded       по записанным ts (--speed 2 — в два раза быстрее)
+
+ID переписываются (ID + --id-offset), чтобы прогоны не пересекались между собой
+и с реальными заявками; по умолчанию offset — (unix-время % 1000) * 1e6, чтобы ID
+оставались в int4. Строки, у которых ID + offset не влезает в int4, считаются bad_lines.
+
+Запуск из корня репозитория:
+    python -m benchmarks.replay capture.jsonl --url http://127.0.0.1:8000 --rate 20 --concurrency 10
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+from array import array
+from collections import Counter
+from collections.abc import Iterator
+from datetime import datetime
+from typing import Any
+
+import aiohttp
+
+DEFAULT_PATH = "/api/v1/ka-bot/requests"
+# requests.external_id — Integer (int4 в Postgres)
+INT4_MAX = 2**31
+
+
+def _parse_ts(value: Any) -> float | None:
+    if value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return float(value)
+    return datetime.fromisoformat(str(value)).timestamp()
+
+
+def iter_capture(path: str, limit: int | None = None) -> Iterator[tuple[float | None, dict | None]]:
+    """(ts, payload) по строкам файла; битая строка -> (None, None)."""
+    with open(path, "r", encoding="utf-8") as f:
+        count = 0
+        for line in f:
+            if not line.strip():
+                continue
+            if limit is not None and count >= limit:
+                return
+            count += 1
+            try:
+                obj = json.loads(line)
+                if "payload" in obj:
+                    yield _parse_ts(obj.get("ts")), obj["payload"]
+                elif "ID" in obj:
+                    yield None, obj
+                else:
+                    yield None, None
+            except (ValueError, TypeError):
+                yield None, None
+
+
+class Report:
+    def __init__(self) -> None:
+        self.latencies_ms = array("d")
+        self.errors: Counter[str] = Counter()
+        self.statuses: Counter[str] = Counter()
+        self.bad_lines = 0
+        self.sent = 0
+
+    def add_ok(self, latency_ms: float, status: str) -> None:
+        self.latencies_ms.append(latency_ms)
+        self.statuses[status] += 1
+
+    def add_error(self, latency_ms: float, kind: str) -> None:
+        self.latencies_ms.append(latency_ms)
+        self.errors[kind] += 1
+
+    def print(self, elapsed: float) -> None:
+        lat = sorted(self.latencies_ms)
+        ok = sum(self.statuses.values())
+        print(f"sent={self.sent} ok={ok} errors={sum(self.errors.values())} bad_lines={self.bad_lines}")
+        print(f"elapsed={elapsed:.2f}s  throughput={self.sent / elapsed if elapsed else 0:.1f} req/s")
+        if lat:
+            pct = {p: lat[min(len(lat) - 1, int(len(lat) * p / 100))] for p in (50, 90, 95, 99)}
+            print(
+                "latency ms: "
+                + "  ".join(f"p{p}={v:.1f}" for p, v in pct.items())
+                + f"  max={lat[-1]:.1f}"
+            )
+        for status, n in self.statuses.most_common():
+            print(f"  status {status:<16} {n}")
+        for kind, n in self.errors.most_common():
+            print(f"  error  {kind:<16} {n}")
+
+
+async def _send(
+    http: aiohttp.ClientSession,
+    url: str,
+    payload: dict,
+    headers: dict[str, str],
+    report: Report,
+) -> None:
+    started = time.perf_counter()
+    try:
+        async with http.post(url, json=payload, headers=headers) as resp:
+            body = await resp.read()
+            latency_ms = (time.perf_counter() - started) * 1000
+            if resp.status != 200:
+                report.add_error(latency_ms, f"http {resp.status}")
+                return
+            try:
+                status = str(json.loads(body).get("status"))
+            except ValueError:
+                status = "?"
+            report.add_ok(latency_ms, status)
+    except Exception as e:
+        report.add_error((time.perf_counter() - started) * 1000, type(e).__name__)
+
+
+async def replay(args: argparse.Namespace) -> Report:
+    report = Report()
+    url = args.url.rstrip("/") + args.path
+    headers = {"Authorization": f"Bearer {args.token}"} if args.token else {}
+    # сдвиг по умолчанию < 1e9: ID остаются в requests.external_id (int4, < 2**31)
+    id_offset = args.id_offset if args.id_offset is not None else (int(time.time()) % 1000) * 1_000_000
+
+    sem = asyncio.Semaphore(args.concurrency)
+    tasks: set[asyncio.Task] = set()
+    loop = asyncio.get_running_loop()
+
+    timeout = aiohttp.ClientTimeout(total=args.timeout)
+    connector = aiohttp.TCPConnector(limit=args.concurrency)
+    async with aiohttp.ClientSession(timeout=timeout, connector=connector) as http:
+        started = loop.time()
+        first_ts: float | None = None
+
+        for ts, payload in iter_capture(args.file, args.limit):
+            if payload is None:
+                report.bad_lines += 1
+                continue
+            if isinstance(payload.get("ID"), int):
+                if payload["ID"] + id_offset >= INT4_MAX:
+                    report.bad_lines += 1
+                    continue
+                payload["ID"] += id_offset
+
+            # темп: момент отправки очередного запроса относительно старта
+            # (считаем только отправленные — пропущенные строки темп не сдвигают)
+            due = None
+            if args.rate:
+                due = started + report.sent / args.rate
+            elif args.recorded and ts is not None:
+                first_ts = ts if first_ts is None else first_ts
+                due = started + (ts - first_ts) / args.speed
+            if due is not None:
+                delay = due - loop.time()
+                if delay > 0:
+                    await asyncio.sleep(delay)
+
+            # не читаем файл дальше, пока все слоты заняты
+            await sem.acquire()
+            report.sent += 1
+
+            task = asyncio.create_task(_send(http, url, payload, headers, report))
+            tasks.add(task)
+            task.add_done_callback(lambda t: (tasks.discard(t), sem.release()))
+
+        if tasks:
+            await asyncio.gather(*tasks)
+
+    report.print(loop.time() - started)
+    return report
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="Replay 1F payloads from JSONL")
+    parser.add_argument("file")
+    parser.add_argument("--url", default="http://127.0.0.1:8000")
+    parser.add_argument("--path", default=DEFAULT_PATH)
+    parser.add_argument("--token", help="Bearer-токен для Authorization")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--rate", type=float, help="постоянный темп, запросов/с")
+    mode.add_argument("--recorded", action="store_true", help="темп по записанным ts")
+    parser.add_argument("--speed", type=float, default=1.0, help="ускорение для --recorded")
+    parser.add_argument("--concurrency", type=int, default=20)
+    parser.add_argument("--timeout", type=float, default=30.0)
+    parser.add_argument("--limit", type=int, help="не больше N строк")
+    parser.add_argument(
+        "--id-offset", type=int, help="прибавить к ID (по умолчанию — (unix-время %% 1000) * 1e6)"
+    )
+    args = parser.parse_args()
+
+    if args.rate is not None and args.rate <= 0:
+        parser.error("--rate must be positive")
+    if args.speed <= 0:
+        parser.error("--speed must be positive")
+
+    report = asyncio.run(replay(args))
+    raise SystemExit(1 if report.errors else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,46 @@
+"""
+Локальная "реплика" SQLite для проверки READ_DATABASE_URL: раз в --every секунд
+копирует основной файл в файл реплики (sqlite3 backup API). Отставание реплики —
+до --every секунд; поставьте его больше READ_REPLICA_MAX_LAG_SECONDS, чтобы
+увидеть переключение чтения на основную БД.
+
+Запуск из корня репозитория:
+    python -m benchmarks.sqlite_replica data/ka_bot.db /tmp/ka_bot_replica.db [--every 5]
+
+    DATABASE_URL=sqlite+aiosqlite:///data/ka_bot.db \\
+    READ_DATABASE_URL=sqlite+aiosqlite:////tmp/ka_bot_replica.db python run_all.py
+"""
+from __future__ import annotations
+
+import argparse
+import sqlite3
+import time
+
+
+def copy_once(primary: str, replica: str) -> float:
+    started = time.perf_counter()
+    src = sqlite3.connect(primary)
+    dst = sqlite3.connect(replica, timeout=30)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("primary")
+    parser.add_argument("replica")
+    parser.add_argument("--every", type=float, default=5.0, help="секунд между копиями")
+    args = parser.parse_args()
+
+    while True:
+        seconds = copy_once(args.primary, args.replica)
+        print(f"{time.strftime('%H:%M:%S')} copied in {seconds * 1000:.0f} ms", flush=True)
+        time.sleep(args.every)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,370 @@
+"""
+Микробенчмарки горячих путей бота на in-memory SQLite и фейковой сессии Telegram:
+repo-функции, render-функции services/bot_functions и полный dispatch
+callback_query через aiogram Dispatcher (те же middleware и роутеры, что в main.py).
+
+Результаты (медиана us/call по раундам) сохраняются в JSON-baseline;
+при сравнении кейсы медленнее baseline больше чем на threshold помечаются
+как REGRESSION, а скрипт завершается с кодом 1; без baseline (и без --save) — код 2.
+
+Запуск из корня репозитория:
+    python -m benchmarks.suite --save                 # записать baseline
+    python -m benchmarks.suite                        # сравнить с baseline
+    python -m benchmarks.suite --only dispatch --threshold 0.3
+"""
+from __future__ import annotations
+
+import os
+
+# до импорта db: suite никогда не трогает рабочую БД
+os.environ["DATABASE_URL"] = "sqlite+aiosqlite://"
+
+import argparse
+import asyncio
+import json
+import logging
+import platform
+import statistics
+import sys
+import time
+from dataclasses import dataclass
+from datetime import datetime
+from pathlib import Path
+from typing import Any, AsyncGenerator, Awaitable, Callable
+
+from aiogram import Bot
+from aiogram.client.session.base import BaseSession
+from aiogram.methods import SendMessage, TelegramMethod
+from aiogram.types import Chat, Message
+
+from db import SessionLocal, engine, init_db
+from main import build_dispatcher
+from repo.audit_repo import add_audit_log
+from repo.permitted_users_repo import is_user_permitted, upsert_permitted_user
+from repo.requests_repo import (
+    create_if_not_exists,
+    mark_decision,
+    mark_group_sent,
+    try_accept_request,
+    try_mark_in_progress,
+)
+from services.bot_functions import (
+    executor_keyboard,
+    render_executor_confirm_text,
+    render_in_progress_text,
+    render_request_text,
+)
+
+DEFAULT_BASELINE = Path(__file__).parent / "baselines" / "suite.json"
+
+GROUP_CHAT_ID = -100500
+EXECUTOR_TG_ID = 777
+CAR = {"Brand": "Toyota", "Model": "Camry", "Year": 2021, "Color": "white", "Motor": "2.5", "Price": "25000", "Currency": "USD"}
+
+
+class FakeSession(BaseSession):
+    """Сессия бота без сети: sendMessage возвращает Message, остальные методы — True."""
+
+    def __init__(self) -> None:
+        super().__init__()
+        self._message_id = 0
+        self.calls = 0
+
+    async def make_request(self, bot: Bot, method: TelegramMethod[Any], timeout: int | None = None) -> Any:
+        self.calls += 1
+        if isinstance(method, SendMessage):
+            self._message_id += 1
+            return Message(
+                message_id=self._message_id,
+                date=datetime.now(),
+                chat=Chat(id=int(method.chat_id), type="private"),
+                text=method.text,
+            ).as_(bot)
+        return True
+
+    async def stream_content(self, *args: Any, **kwargs: Any) -> AsyncGenerator[bytes, None]:
+        """Файлы бенчмарки не скачивают: вызов считается, как в make_request, поток пустой."""
+        self.calls += 1
+        for chunk in ():
+            yield chunk
+
+    async def close(self) -> None:
+        pass
+
+
+@dataclass
+class Case:
+    name: str
+    op: Callable[[int], Any]
+    # подготовка count вызовов op (создание заявок в нужном статусе и т.п.)
+    setup: Callable[[int], Awaitable[None]] | None = None
+    is_async: bool = True
+
+
+class _Ids:
+    """Непересекающиеся диапазоны external_id для кейсов в одной БД."""
+
+    def __init__(self) -> None:
+        self._next = 1
+
+    def take(self, count: int) -> int:
+        start = self._next
+        self._next += count
+        return start
+
+
+async def _create_rows(start: int, count: int, status: str = "NEW") -> None:
+    async with SessionLocal() as session:
+        for external_id in range(start, start + count):
+            await create_if_not_exists(session, external_id, "Bench User", "+992900000000", CAR)
+            await mark_group_sent(session, external_id, external_id, GROUP_CHAT_ID)
+            if status in ("ASSIGNED", "IN_PROGRESS"):
+                await try_accept_request(session, external_id, EXECUTOR_TG_ID, "bench")
+            if status == "IN_PROGRESS":
+                await try_mark_in_progress(session, external_id, EXECUTOR_TG_ID)
+
+
+def _callback_update(update_id: int, data: str, chat_id: int, chat_type: str) -> dict[str, Any]:
+    user = {"id": EXECUTOR_TG_ID, "is_bot": False, "first_name": "Bench", "username": "bench"}
+    return {
+        "update_id": update_id,
+        "callback_query": {
+            "id": str(update_id),
+            "from": user,
+            "chat_instance": "bench",
+            "data": data,
+            "message": {
+                "message_id": update_id,
+                "date": int(time.time()),
+                "chat": {"id": chat_id, "type": chat_type},
+                "from": {"id": 1, "is_bot": True, "first_name": "KA Bot"},
+                "text": "🆕 Заявка",
+            },
+        },
+    }
+
+
+def build_cases(bot: Bot, dp) -> list[Case]:
+    ids = _Ids()
+    cases: list[Case] = []
+
+    # ---------------------- repo ----------------------
+    base = ids.take(1_000_000)
+
+    async def op_create(i: int) -> None:
+        async with SessionLocal() as session:
+            await create_if_not_exists(session, base + i, "Bench User", "+992900000000", CAR)
+
+    cases.append(Case("repo.create_if_not_exists", op_create))
+
+    accept_base = 0
+
+    async def setup_accept(count: int) -> None:
+        nonlocal accept_base
+        accept_base = ids.take(count)
+        await _create_rows(accept_base, count)
+
+    async def op_accept(i: int) -> None:
+        async with SessionLocal() as session:
+            await try_accept_request(session, accept_base + i, EXECUTOR_TG_ID, "bench")
+
+    cases.append(Case("repo.try_accept_request", op_accept, setup_accept))
+
+    decision_base = 0
+
+    async def setup_decision(count: int) -> None:
+        nonlocal decision_base
+        decision_base = ids.take(count)
+        await _create_rows(decision_base, count, status="IN_PROGRESS")
+
+    async def op_decision(i: int) -> None:
+        async with SessionLocal() as session:
+            await mark_decision(session, decision_base + i, EXECUTOR_TG_ID, "APPROVED", "ok")
+
+    cases.append(Case("repo.mark_decision", op_decision, setup_decision))
+
+    async def op_permitted(i: int) -> None:
+        async with SessionLocal() as session:
+            await is_user_permitted(session, EXECUTOR_TG_ID, GROUP_CHAT_ID)
+
+    cases.append(Case("repo.is_user_permitted", op_permitted))
+
+    async def op_audit(i: int) -> None:
+        async with SessionLocal() as session:
+            await add_audit_log(
+                session,
+                action="ACCEPT",
+                entity="request",
+                entity_id=str(i),
+                actor_tg_id=EXECUTOR_TG_ID,
+                payload={"assigned_to_username": "bench", "group_message_id": i},
+            )
+
+    cases.append(Case("repo.add_audit_log", op_audit))
+
+    # ---------------------- render ----------------------
+    cases.append(Case(
+        "render.request_text",
+        lambda i: render_request_text(i, "Bench User", "+992900000000", CAR),
+        is_async=False,
+    ))
+    cases.append(Case(
+        "render.executor_confirm_text",
+        lambda i: render_executor_confirm_text(i, "Bench User", "+992900000000", CAR),
+        is_async=False,
+    ))
+    cases.append(Case(
+        "render.in_progress_text",
+        lambda i: render_in_progress_text("🆕 Заявка #1", "bench", EXECUTOR_TG_ID),
+        is_async=False,
+    ))
+    cases.append(Case("render.executor_keyboard", executor_keyboard, is_async=False))
+
+    # ---------------------- dispatch ----------------------
+    update_ids = _Ids()
+    dispatch_accept_base = 0
+
+    async def setup_dispatch_accept(count: int) -> None:
+        nonlocal dispatch_accept_base
+        dispatch_accept_base = ids.take(count)
+        await _create_rows(dispatch_accept_base, count)
+
+    async def op_dispatch_accept(i: int) -> None:
+        update = _callback_update(
+            update_ids.take(1), f"ka_accept:{dispatch_accept_base + i}", GROUP_CHAT_ID, "supergroup"
+        )
+        await dp.feed_raw_update(bot, update)
+
+    cases.append(Case("dispatch.ka_accept", op_dispatch_accept, setup_dispatch_accept))
+
+    dispatch_progress_base = 0
+
+    async def setup_dispatch_progress(count: int) -> None:
+        nonlocal dispatch_progress_base
+        dispatch_progress_base = ids.take(count)
+        await _create_rows(dispatch_progress_base, count, status="ASSIGNED")
+
+    async def op_dispatch_progress(i: int) -> None:
+        update = _callback_update(
+            update_ids.take(1), f"ka_in_progress:{dispatch_progress_base + i}", EXECUTOR_TG_ID, "private"
+        )
+        await dp.feed_raw_update(bot, update)
+
+    cases.append(Case("dispatch.ka_in_progress", op_dispatch_progress, setup_dispatch_progress))
+
+    return cases
+
+
+async def _measure(case: Case, n: int, rounds: int) -> dict[str, float]:
+    warmup = max(1, n // 10)
+    total = warmup + n * rounds
+    if case.setup is not None:
+        await case.setup(total)
+
+    per_round: list[float] = []
+    i = 0
+    for _ in range(warmup):
+        result = case.op(i)
+        if case.is_async:
+            await result
+        i += 1
+
+    for _ in range(rounds):
+        started = time.perf_counter()
+        if case.is_async:
+            for _ in range(n):
+                await case.op(i)
+                i += 1
+        else:
+            for _ in range(n):
+                case.op(i)
+                i += 1
+        per_round.append((time.perf_counter() - started) / n * 1e6)
+
+    return {"us_per_call": statistics.median(per_round), "min_us_per_call": min(per_round)}
+
+
+def _compare(results: dict[str, dict[str, float]], baseline: dict[str, Any], threshold: float) -> list[str]:
+    regressions = []
+    base_cases = baseline.get("cases", {})
+    print(f"\n{'case':<32} {'baseline':>10} {'current':>10} {'delta':>8}")
+    for name, current in results.items():
+        base = base_cases.get(name)
+        if base is None:
+            print(f"{name:<32} {'-':>10} {current['us_per_call']:10.1f}      new")
+            continue
+        delta = current["us_per_call"] / base["us_per_call"] - 1
+        mark = ""
+        if delta > threshold:
+            mark = "  REGRESSION"
+            regressions.append(name)
+        elif delta < -threshold:
+            mark = "  faster"
+        print(f"{name:<32} {base['us_per_call']:10.1f} {current['us_per_call']:10.1f} {delta:+7.1%}{mark}")
+    return regressions
+
+
+async def main_async(args: argparse.Namespace) -> int:
+    baseline_path = Path(args.baseline)
+    if not args.save and not baseline_path.exists():
+        # без baseline сравнивать не с чем — не делаем вид, что регрессий нет
+        print(f"WARNING: no baseline at {baseline_path}; run with --save first", file=sys.stderr)
+        return 2
+
+    await init_db()
+
+    async with SessionLocal() as session:
+        await upsert_permitted_user(session, EXECUTOR_TG_ID, "bench", None, GROUP_CHAT_ID)
+
+    bot = Bot(token="123456:BENCH-TOKEN", session=FakeSession())
+    dp = build_dispatcher(bot)
+    cases = [c for c in build_cases(bot, dp) if not args.only or any(s in c.name for s in args.only)]
+
+    results: dict[str, dict[str, float]] = {}
+    try:
+        for case in cases:
+            n = args.n if case.is_async else args.n * 20
+            results[case.name] = await _measure(case, n, args.rounds)
+            print(f"{case.name:<32} {results[case.name]['us_per_call']:10.1f} us/call", flush=True)
+    finally:
+        await bot.session.close()
+        await engine.dispose()
+
+    if args.save:
+        baseline_path.parent.mkdir(parents=True, exist_ok=True)
+        data = {
+            "created_at": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "machine": platform.platform(),
+            "n": args.n,
+            "rounds": args.rounds,
+            "cases": results,
+        }
+        baseline_path.write_text(json.dumps(data, indent=2, ensure_ascii=False) + "\n", encoding="utf-8")
+        print(f"\nbaseline saved: {baseline_path}")
+        return 0
+
+    baseline = json.loads(baseline_path.read_text(encoding="utf-8"))
+    regressions = _compare(results, baseline, args.threshold)
+    if regressions:
+        print(f"\n{len(regressions)} regression(s) over {args.threshold:.0%}: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--n", type=int, default=300, help="вызовов на раунд (render — в 20 раз больше)")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--baseline", default=str(DEFAULT_BASELINE))
+    parser.add_argument("--save", action="store_true", help="записать результаты как новый baseline")
+    parser.add_argument("--threshold", type=float, default=0.2, help="допустимое замедление (0.2 = 20%%)")
+    parser.add_argument("--only", nargs="*", help="подстроки имён кейсов")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.WARNING)
+    sys.exit(asyncio.run(main_async(args)))
+
+
+if __name__ == "__main__":
+    main()
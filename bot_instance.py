@@ -1,6 +1,10 @@
 from aiogram import Bot
 from aiogram.client.default import DefaultBotProperties
+from aiogram.client.session.aiohttp import AiohttpSession
+from aiogram.client.telegram import TelegramAPIServer
 from aiogram.enums import ParseMode
 from config import settings
 
-bot = Bot(token=settings.bot_token.get_secret_value(), default=DefaultBotProperties(parse_mode=ParseMode.HTML))
\ No newline at end of file
+api_session = AiohttpSession(api=TelegramAPIServer.from_base(settings.telegram_api_url)) if settings.telegram_api_url else None
+
+bot = Bot(token=settings.bot_token.get_secret_value(), session=api_session, default=DefaultBotProperties(parse_mode=ParseMode.HTML))
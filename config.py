@@ -1,17 +1,68 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
-from pydantic import SecretStr
+from pydantic import BaseModel, SecretStr
 from typing import List
 
+
+class KaRoute(BaseModel):
+    """
+    Правило маршрутизации заявки в группу КА (KA_ROUTES в .env — JSON-список).
+    Заданные критерии должны совпасть все; правило без критериев —
+    участник пула, в котором заявки распределяются по hash(external_id).
+    """
+    chat_id: int
+    brands: List[str] = []
+    currencies: List[str] = []
+    price_min: float | None = None
+    price_max: float | None = None
+
+
 class Settings(BaseSettings):
     model_config = SettingsConfigDict(env_file=".env", extra="forbid")
 
     bot_token: SecretStr
+    # свой Bot API сервер (self-hosted telegram-bot-api / фейк в бенчмарках); None — api.telegram.org
+    telegram_api_url: str | None = None
     group_chat_id: int 
 
+    # Несколько групп КА; пусто — всё идёт в group_chat_id
+    ka_routes: List[KaRoute] = []
+
+    # Базовая валюта для car_price_base; retry-очереди обрабатывают дорогие заявки первыми
+    base_currency: str = "TJS"
+    retry_by_value_first: bool = True
+
     database_url: SecretStr  
+    # для SQLite: WAL/pragmas на каждое соединение и сериализация писателей (см. db.py)
+    sqlite_profile: bool = True
+    # реплика только для чтения (отчёты, выгрузки, поиск); не задана — всё идёт в основную БД.
+    # Если реплика отстала больше read_replica_max_lag_seconds (0 — не проверять), читаем из основной.
+    read_database_url: SecretStr | None = None
+    read_replica_max_lag_seconds: float = 30.0
 
     admin_ids: str = ""  # "1,2,3"
 
+    # HTTP API приёма заявок в run_all.py (единый процесс)
+    api_host: str = "0.0.0.0"
+    api_port: int = 8000
+
+    # Bearer-токен для /export; пока не задан — выгрузка через API выключена
+    export_token: SecretStr | None = None
+
+    # SLA (минуты): напоминание по NEW, авто-снятие ASSIGNED, эскалация IN_PROGRESS
+    sla_new_remind_minutes: int = 30
+    sla_assigned_release_minutes: int = 60
+    sla_in_progress_escalate_minutes: int = 240
+
+    # Retention (дни, 0 — выключено): телефон и комментарий решения у закрытых заявок,
+    # payload_json в audit_log. Чистка идёт пачками по PK с паузой между ними.
+    retention_pii_days: int = 0
+    retention_audit_payload_days: int = 0
+    retention_chunk_rows: int = 500
+    retention_chunk_pause_seconds: float = 0.5
+
+    # Порог блокировки event loop (мс), после которого пишется [SlowLoop] warning; 0 — выключено
+    slow_callback_ms: int = 200
+
     def admin_id_list(self) -> List[int]:
         if not self.admin_ids.strip():
             return []
@@ -1,18 +1,152 @@
+import asyncio
 from collections.abc import AsyncGenerator
-from sqlalchemy.ext.asyncio import create_async_engine, async_sessionmaker, AsyncSession
+from sqlalchemy import event, inspect, make_url, text
+from sqlalchemy.ext.asyncio import AsyncEngine, create_async_engine, async_sessionmaker, AsyncSession
 from sqlalchemy.orm import DeclarativeBase
 from config import settings
 
-engine = create_async_engine(settings.database_url.get_secret_value(), echo=False)
-SessionLocal = async_sessionmaker(bind=engine, class_=AsyncSession, expire_on_commit=False)
+# Профиль SQLite для продакшена (на каждое соединение)
+SQLITE_PRAGMAS = (
+    "PRAGMA journal_mode=WAL",        # читатели не блокируются писателем
+    "PRAGMA synchronous=NORMAL",      # в WAL безопасно, без fsync на каждый commit
+    "PRAGMA busy_timeout=5000",       # ждать блокировку, а не падать с "database is locked"
+    "PRAGMA mmap_size=268435456",     # 256 MB
+    "PRAGMA cache_size=-65536",       # 64 MB
+    "PRAGMA temp_store=MEMORY",
+)
+
+
+class SerializedWriteSession(AsyncSession):
+    """
+    Сессия для SQLite: пишущие транзакции процесса идут строго по одной
+    (write_lock держится от первой записи до commit/rollback/close).
+    Чтение не блокируется. Между процессами страхует busy_timeout.
+    """
+    write_lock: asyncio.Lock
+
+    _holds_write_lock = False
+
+    def _has_pending_writes(self) -> bool:
+        return bool(self.new or self.dirty or self.deleted)
+
+    async def _acquire_write(self) -> None:
+        if not self._holds_write_lock:
+            # соединение берём до lock: иначе держатель lock может ждать пул,
+            # занятый сессиями, которые сами ждут lock
+            await self.connection()
+            await self.write_lock.acquire()
+            self._holds_write_lock = True
+
+    def _release_write(self) -> None:
+        if self._holds_write_lock:
+            self._holds_write_lock = False
+            self.write_lock.release()
+
+    async def execute(self, statement, *args, **kwargs):
+        # DML или autoflush накопленных изменений — это запись
+        if getattr(statement, "is_dml", False) or self._has_pending_writes():
+            await self._acquire_write()
+        return await super().execute(statement, *args, **kwargs)
+
+    async def flush(self, objects=None) -> None:
+        if self._has_pending_writes():
+            await self._acquire_write()
+        await super().flush(objects)
+
+    async def commit(self) -> None:
+        if self._has_pending_writes():
+            await self._acquire_write()
+        try:
+            await super().commit()
+        finally:
+            self._release_write()
+
+    async def rollback(self) -> None:
+        try:
+            await super().rollback()
+        finally:
+            self._release_write()
+
+    async def close(self) -> None:
+        try:
+            await super().close()
+        finally:
+            self._release_write()
+
+
+def make_engine(url: str, sqlite_profile: bool = True) -> AsyncEngine:
+    sa_url = make_url(url)
+    if sa_url.drivername == "postgresql+asyncpg" and "prepared_statement_cache_size" not in sa_url.query:
+        # asyncpg переиспользует prepared statements горячих запросов на соединении
+        sa_url = sa_url.update_query_dict({"prepared_statement_cache_size": "500"})
+
+    new_engine = create_async_engine(sa_url, echo=False)
+
+    if sqlite_profile and new_engine.dialect.name == "sqlite":
+        @event.listens_for(new_engine.sync_engine, "connect")
+        def _apply_sqlite_pragmas(dbapi_connection, connection_record) -> None:
+            cursor = dbapi_connection.cursor()
+            for pragma in SQLITE_PRAGMAS:
+                cursor.execute(pragma)
+            cursor.close()
+
+    return new_engine
+
+
+def make_sessionmaker(bind: AsyncEngine, sqlite_profile: bool = True) -> async_sessionmaker[AsyncSession]:
+    session_cls = AsyncSession
+    if sqlite_profile and bind.dialect.name == "sqlite":
+        # свой lock на каждый движок
+        session_cls = type("SqliteSession", (SerializedWriteSession,), {"write_lock": asyncio.Lock()})
+    return async_sessionmaker(bind=bind, class_=session_cls, expire_on_commit=False)
+
+
+engine = make_engine(settings.database_url.get_secret_value(), settings.sqlite_profile)
+SessionLocal = make_sessionmaker(engine, settings.sqlite_profile)
+
+# реплика для чтения; без READ_DATABASE_URL — тот же движок (см. services/read_replica.py)
+if settings.read_database_url is not None:
+    read_engine = make_engine(settings.read_database_url.get_secret_value(), settings.sqlite_profile)
+    ReadSessionLocal = make_sessionmaker(read_engine, settings.sqlite_profile)
+else:
+    read_engine = engine
+    ReadSessionLocal = SessionLocal
 
 class Base(DeclarativeBase):
     pass
 
-async def init_db() -> None:
-    async with engine.begin() as conn:
-        await conn.run_sync(Base.metadata.create_all)
+def _add_missing_columns(sync_conn) -> None:
+    """
+    Миграций нет: новые nullable-колонки добавляем в существующие таблицы сами
+    (create_all меняет только отсутствующие таблицы).
+    """
+    inspector = inspect(sync_conn)
+    existing_tables = set(inspector.get_table_names())
+
+    for table in Base.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        existing = {c["name"] for c in inspector.get_columns(table.name)}
+        for column in table.columns:
+            if column.name in existing or not column.nullable:
+                continue
+            col_type = column.type.compile(dialect=sync_conn.dialect)
+            sync_conn.execute(text(f'ALTER TABLE {table.name} ADD COLUMN {column.name} {col_type}'))
+
+
+def _create_all(sync_conn) -> None:
+    _add_missing_columns(sync_conn)
+    Base.metadata.create_all(sync_conn)
+    # create_all не добавляет новые индексы в уже существующие таблицы
+    for table in Base.metadata.sorted_tables:
+        for index in table.indexes:
+            index.create(sync_conn, checkfirst=True)
+
+
+async def init_db(bind: AsyncEngine | None = None) -> None:
+    async with (bind or engine).begin() as conn:
+        await conn.run_sync(_create_all)
 
 async def get_session() -> AsyncGenerator[AsyncSession, None]:
     async with SessionLocal() as session:
-        yield session
\ No newline at end of file
+        yield session
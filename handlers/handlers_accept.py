@@ -12,11 +12,12 @@ from repo.requests_repo import (
     try_accept_request,
     try_decline_request,
     try_mark_in_progress,
-    get_by_external_id,
+    get_request_snapshot,
     mark_decision,
 )
 from repo.permitted_users_repo import is_user_permitted
 from repo.audit_repo import add_audit_log
+from services.group_routing import request_group_chat_id
 from services.bot_functions import (
     render_executor_confirm_text,
     render_in_progress_text,
@@ -26,11 +27,12 @@ from services.bot_functions import (
     render_request_text,
 )
 
-from config import settings
+from logging_setup import bind_log_context
 from states import DecisionStates
 
 from services.send_onef_in_progress import send_in_progress_to_1f
 from services.send_onef_approved import send_ka_result_to_1f
+from services.sla_scheduler import sla_scheduler
 
 logger = logging.getLogger("ka_bot")
 router = Router()
@@ -52,8 +54,9 @@ async def ka_accept_callback(call: CallbackQuery, state: FSMContext):
 
     user_id = call.from_user.id
 
+    group_chat_id = call.message.chat.id if call.message else None
     async with SessionLocal() as session:
-        permitted = await is_user_permitted(session, user_id)
+        permitted = await is_user_permitted(session, user_id, group_chat_id)
 
     if not permitted:
         await call.answer(
@@ -67,6 +70,7 @@ async def ka_accept_callback(call: CallbackQuery, state: FSMContext):
     if external_id is None:
         await call.answer("Неверный ID", show_alert=True)
         return
+    bind_log_context(external_id=external_id)
 
     executor_username = call.from_user.username
 
@@ -82,6 +86,8 @@ async def ka_accept_callback(call: CallbackQuery, state: FSMContext):
         await call.answer("Эта заявка уже в работе у другого сотрудника.", show_alert=True)
         return
 
+    sla_scheduler.on_assigned(external_id, user_id, req.assigned_at)
+
     async with SessionLocal() as session:
         await add_audit_log(
             session,
@@ -105,23 +111,13 @@ async def ka_accept_callback(call: CallbackQuery, state: FSMContext):
 
     # 2) отправить личку исполнителю
     try:
-        car = {
-            "Brand": req.car_brand,
-            "Model": req.car_model,
-            "Year": req.car_year,
-            "Color": req.car_color,
-            "Motor": req.car_motor,
-            "Price": req.car_price,
-            "Currency": req.car_currency,
-        }
-
         await call.bot.send_message(
             chat_id=user_id,
             text=render_executor_confirm_text(
                 external_id=req.external_id,
                 full_name=req.user_full_name,
                 phone=req.user_phone,
-                car=car,
+                car=req.car,
             ),
             reply_markup=executor_keyboard(req.external_id),
         )
@@ -146,10 +142,11 @@ async def ka_in_progress_callback(call: CallbackQuery, state: FSMContext):
     if external_id is None:
         await call.answer("Неверный ID", show_alert=True)
         return
+    bind_log_context(external_id=external_id)
 
-    # 1) Проверка по БД (истина)
+    # 1) Проверка по срезу (кэш; истина — условный UPDATE ниже)
     async with SessionLocal() as session:
-        req = await get_by_external_id(session, external_id)
+        req = await get_request_snapshot(session, external_id)
 
     if req is None:
         await call.answer("Заявка не найдена", show_alert=True)
@@ -175,6 +172,8 @@ async def ka_in_progress_callback(call: CallbackQuery, state: FSMContext):
         await call.answer("Не удалось перевести в процесс (статус изменён).", show_alert=True)
         return
 
+    sla_scheduler.on_in_progress(external_id, user_id, req2.assigned_at)
+
     async with SessionLocal() as session:
         await add_audit_log(
             session,
@@ -192,19 +191,12 @@ async def ka_in_progress_callback(call: CallbackQuery, state: FSMContext):
             executor = f"@{executor_username}" if executor_username else f"ID:{user_id}"
 
             group_text = (
-                f"🆕 Заявка #{req2.external_id}\n"
-                f"👤 Клиент: {req2.user_full_name}\n"
-                f"📞 Телефон: {req2.user_phone}\n\n"
-                f"🚗 Авто: {req2.car_brand} {req2.car_model}\n"
-                f"📅 Год: {req2.car_year}\n"
-                f"🎨 Цвет: {req2.car_color}\n"
-                f"🛠 Двигатель: {req2.car_motor}\n"
-                f"💰 Цена: {req2.car_price} {req2.car_currency}\n"
-                f"\n⏳ В процессе: {executor}"
+                render_request_text(req2.external_id, req2.user_full_name, req2.user_phone, req2.car)
+                + f"\n⏳ В процессе: {executor}"
             )
 
             await call.bot.edit_message_text(
-                chat_id=int(settings.group_chat_id),
+                chat_id=request_group_chat_id(req2),
                 message_id=req2.group_message_id,
                 text=group_text,
                 reply_markup=None,
@@ -259,9 +251,10 @@ async def ka_decline_callback(call: CallbackQuery, state: FSMContext):
     if external_id is None:
         await call.answer("Неверный ID", show_alert=True)
         return
+    bind_log_context(external_id=external_id)
 
     async with SessionLocal() as session:
-        req = await get_by_external_id(session, external_id)
+        req = await get_request_snapshot(session, external_id)
 
     if req is None:
         await call.answer("Заявка не найдена", show_alert=True)
@@ -280,6 +273,8 @@ async def ka_decline_callback(call: CallbackQuery, state: FSMContext):
             await call.answer("Не удалось отказаться (статус изменён).", show_alert=True)
             return
 
+        sla_scheduler.on_new(external_id)
+
         async with SessionLocal() as session:
             await add_audit_log(
                 session,
@@ -297,18 +292,9 @@ async def ka_decline_callback(call: CallbackQuery, state: FSMContext):
         # вернуть кнопку Accept в группу
         try:
             if req2.group_message_id:
-                text = (
-                    f"🆕 Заявка #{req2.external_id}\n"
-                    f"👤 Клиент: {req2.user_full_name}\n"
-                    f"📞 Телефон: {req2.user_phone}\n\n"
-                    f"🚗 Авто: {req2.car_brand} {req2.car_model}\n"
-                    f"📅 Год: {req2.car_year}\n"
-                    f"🎨 Цвет: {req2.car_color}\n"
-                    f"🛠 Двигатель: {req2.car_motor}\n"
-                    f"💰 Цена: {req2.car_price} {req2.car_currency}\n"
-                )
+                text = render_request_text(req2.external_id, req2.user_full_name, req2.user_phone, req2.car)
                 await call.bot.edit_message_text(
-                    chat_id=int(settings.group_chat_id),
+                    chat_id=request_group_chat_id(req2),
                     message_id=req2.group_message_id,
                     text=text,
                     reply_markup=accept_keyboard(req2.external_id),
@@ -358,9 +344,10 @@ async def ka_send_onef_callback(call: CallbackQuery, state: FSMContext):
     if external_id is None:
         await call.answer("Неверный ID", show_alert=True)
         return
+    bind_log_context(external_id=external_id)
 
     async with SessionLocal() as session:
-        req = await get_by_external_id(session, external_id)
+        req = await get_request_snapshot(session, external_id)
 
     if req is None:
         await call.answer("Заявка не найдена", show_alert=True)
@@ -415,6 +402,8 @@ async def _handle_decision_comment(message: Message, state: FSMContext, expected
     origin_chat_id = data.get("origin_chat_id")
     origin_message_id = data.get("origin_message_id")
 
+    bind_log_context(external_id=external_id)
+
     if external_id <= 0 or decision != expected_decision:
         await message.answer("⚠️ Этап неверный. Нажмите кнопку заново.")
         await state.clear()
@@ -435,9 +424,11 @@ async def _handle_decision_comment(message: Message, state: FSMContext, expected
         await state.clear()
         return
 
+    sla_scheduler.on_closed(external_id)
+
     # 2) Читаем req
     async with SessionLocal() as session:
-        req = await get_by_external_id(session, external_id)
+        req = await get_request_snapshot(session, external_id)
 
     if req is None:
         await message.answer("Заявка не найдена.")
@@ -445,22 +436,16 @@ async def _handle_decision_comment(message: Message, state: FSMContext, expected
         return
 
     # 3) Отправка в 1F (после успешного mark_decision)
-    await send_ka_result_to_1f(
-        request_id=external_id,
-        ka_status=decision,
-        employee_tg_id=user_id,
-        comment=comment,
-    )
-
-    car = {
-        "Brand": req.car_brand,
-        "Model": req.car_model,
-        "Year": req.car_year,
-        "Color": req.car_color,
-        "Motor": req.car_motor,
-        "Price": req.car_price,
-        "Currency": req.car_currency,
-    }
+    # при ошибке заявка уже помечена ERROR_ONEF и уйдёт в retry — сообщение всё равно обновляем
+    try:
+        await send_ka_result_to_1f(
+            request_id=external_id,
+            ka_status=decision,
+            employee_tg_id=user_id,
+            comment=comment,
+        )
+    except Exception:
+        logger.warning("1F send failed after decision, queued for retry external_id=%s", external_id)
 
     executor_username = message.from_user.username
     executor = f"@{executor_username}" if executor_username else f"ID:{user_id}"
@@ -469,7 +454,7 @@ async def _handle_decision_comment(message: Message, state: FSMContext, expected
         external_id=req.external_id,
         full_name=req.user_full_name,
         phone=req.user_phone,
-        car=car,
+        car=req.car,
     )
 
     # 4) audit log
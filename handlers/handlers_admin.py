@@ -1,10 +1,33 @@
+import asyncio
+import os
+import tempfile
+from datetime import datetime, timedelta
+
+import aiofiles
 from aiogram import Router
 from aiogram.filters import Command
-from aiogram.types import Message
+from aiogram.types import BufferedInputFile, FSInputFile, Message
 
 from config import settings
 from db import SessionLocal
-from repo.permitted_users_repo import upsert_permitted_user, deactivate_permitted_user, list_permitted_users
+from repo.permitted_users_repo import (
+    deactivate_permitted_user,
+    get_permitted_group,
+    list_permitted_users,
+    upsert_permitted_user,
+)
+from services.executor_handover import reassign_executor, release_executor
+from services.export import EXPORT_FORMATS, EXPORT_TABLES, iter_export
+from services.loop_profiler import loop_watchdog, profile_loop
+from services.onef_utils import onef_breaker
+from services.pricing import invalidate_rates
+from services.read_replica import read_session, replica_router
+from services.retention import last_runs as retention_runs
+from services.telegram_batch import BatchResult
+from services.status_rollup import STAGE_NAMES, build_report
+from repo.rates_repo import upsert_rate
+from repo.requests_repo import count_executor_active
+from repo.search_repo import search_requests
 
 
 router = Router()
@@ -23,9 +46,16 @@ async def start_cmd(message: Message):
         await message.answer(
             "✅ Admin panel\n\n"
             "Доступные команды:\n"
-            "/add tg_id — добавить/активировать пользователя для Accept\n"
-            "/remove tg_id — отключить пользователя (is_active=false)\n"
+            "/add tg_id [group_chat_id] — добавить/активировать пользователя для Accept (во всех группах или в одной)\n"
+            "/remove tg_id — отключить пользователя (is_active=false), его заявки в работе — в очередь\n"
+            "/reassign from_tg_id to_tg_id — передать все заявки в работе другому сотруднику\n"
             "/list — показать список разрешённых пользователей\n"
+            "/export requests|audit [csv|jsonl] [YYYY-MM-DD] [YYYY-MM-DD] [STATUS] — выгрузка\n"
+            "/metrics — состояние интеграций\n"
+            "/rate CUR rate — курс валюты к базовой (для приоритета по сумме)\n"
+            "/find телефон|ФИО|авто [before:id] — поиск заявок\n"
+            "/sla_report [дней] [tg_id] — время в статусах (p50/p90/p95)\n"
+            "/profile [секунд] — сэмплирующий профиль event loop (файлом)\n"
         )
     else:
         await message.answer("Привет. Доступ к управлению ограничен.")
@@ -41,14 +71,15 @@ async def add_cmd(message: Message):
         return
 
     parts = (message.text or "").split()
-    if len(parts) != 2:
-        await message.answer("Использование: /add tg_id")
+    if len(parts) not in (2, 3):
+        await message.answer("Использование: /add tg_id [group_chat_id]")
         return
 
     try:
         tg_id = int(parts[1])
+        group_chat_id = int(parts[2]) if len(parts) == 3 else None
     except ValueError:
-        await message.answer("tg_id должен быть числом.")
+        await message.answer("tg_id и group_chat_id должны быть числами.")
         return
 
     async with SessionLocal() as session:
@@ -57,9 +88,11 @@ async def add_cmd(message: Message):
             tg_id=tg_id,
             username=None,  # можно обновлять позже, если нужно
             added_by_tg_id=message.from_user.id,
+            group_chat_id=group_chat_id,
         )
 
-    await message.answer(f"✅ Пользователь {tg_id} добавлен/активирован.")
+    scope = f"в группе {group_chat_id}" if group_chat_id is not None else "во всех группах"
+    await message.answer(f"✅ Пользователь {tg_id} добавлен/активирован ({scope}).")
 
 
 @router.message(Command("remove"))
@@ -85,10 +118,73 @@ async def remove_cmd(message: Message):
     async with SessionLocal() as session:
         ok = await deactivate_permitted_user(session, tg_id)
 
-    if ok:
-        await message.answer(f"✅ Пользователь {tg_id} отключён (is_active=false).")
-    else:
+    if not ok:
         await message.answer(f"⚠️ Пользователь {tg_id} не найден.")
+        return
+
+    # его ASSIGNED / IN_PROGRESS заявки возвращаются в очередь
+    released, batch = await release_executor(tg_id, actor_tg_id=message.from_user.id)
+    await message.answer(
+        f"✅ Пользователь {tg_id} отключён (is_active=false).\n"
+        f"Возвращено в очередь заявок: {released}" + _fmt_batch(batch)
+    )
+
+
+def _fmt_batch(batch: BatchResult) -> str:
+    if not batch.ok and not batch.failed:
+        return ""
+    text = f"\nСообщений обновлено: {batch.ok}, ошибок: {batch.failed}"
+    if batch.errors:
+        text += "\n" + "\n".join(f"- {e}" for e in batch.errors[:10])
+    return text
+
+
+@router.message(Command("reassign"))
+async def reassign_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) != 3:
+        await message.answer("Использование: /reassign from_tg_id to_tg_id")
+        return
+
+    try:
+        from_tg_id, to_tg_id = int(parts[1]), int(parts[2])
+    except ValueError:
+        await message.answer("tg_id должны быть числами.")
+        return
+
+    if from_tg_id == to_tg_id:
+        await message.answer("from_tg_id и to_tg_id совпадают.")
+        return
+
+    async with SessionLocal() as session:
+        permitted, group_chat_id = await get_permitted_group(session, to_tg_id)
+
+    if not permitted:
+        await message.answer(f"⚠️ Пользователь {to_tg_id} не активен — сначала /add {to_tg_id}.")
+        return
+
+    # разрешённому в одной группе КА передаём только заявки этой группы
+    moved, batch = await reassign_executor(
+        from_tg_id, to_tg_id, None, actor_tg_id=message.from_user.id, group_chat_id=group_chat_id
+    )
+    left = 0
+    if group_chat_id is not None:
+        async with SessionLocal() as session:
+            left = await count_executor_active(session, from_tg_id)
+    left_note = f"\nНе переданы (у {to_tg_id} доступ только к группе {group_chat_id}): {left}" if left else ""
+
+    if not moved:
+        await message.answer(f"У {from_tg_id} нет заявок в работе, доступных {to_tg_id}." + left_note)
+        return
+
+    await message.answer(f"✅ Передано заявок {from_tg_id} → {to_tg_id}: {moved}" + _fmt_batch(batch) + left_note)
 
 @router.message(Command("list"))
 async def list_cmd(message: Message):
@@ -99,6 +195,7 @@ async def list_cmd(message: Message):
         await message.answer("⛔ Недостаточно прав.")
         return
 
+    # основная БД: список сразу после /add и /remove должен видеть правку
     async with SessionLocal() as session:
         users = await list_permitted_users(session)
 
@@ -109,7 +206,8 @@ async def list_cmd(message: Message):
     lines = ["📋 permitted_users:"]
     for u in users:
         status = "✅ active" if u.is_active else "⛔ inactive"
-        lines.append(f"- {u.tg_id} — {status}")
+        scope = f" — группа {u.group_chat_id}" if u.group_chat_id is not None else ""
+        lines.append(f"- {u.tg_id} — {status}{scope}")
 
     # чтобы не упереться в лимит телеграма, если вдруг список большой
     text = "\n".join(lines)
@@ -117,3 +215,253 @@ async def list_cmd(message: Message):
         text = text[:3800] + "\n...\n(обрезано)"
 
     await message.answer(text)
+
+
+@router.message(Command("export"))
+async def export_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    usage = "Использование: /export requests|audit [csv|jsonl] [YYYY-MM-DD] [YYYY-MM-DD] [STATUS]"
+    parts = (message.text or "").split()
+    if len(parts) < 2 or len(parts) > 6 or parts[1] not in EXPORT_TABLES:
+        await message.answer(usage)
+        return
+
+    table = parts[1]
+    fmt = parts[2] if len(parts) > 2 else "csv"
+    if fmt not in EXPORT_FORMATS:
+        await message.answer(usage)
+        return
+
+    try:
+        date_from = datetime.strptime(parts[3], "%Y-%m-%d") if len(parts) > 3 else None
+        # дата "по" включительно
+        date_to = datetime.strptime(parts[4], "%Y-%m-%d") + timedelta(days=1) if len(parts) > 4 else None
+    except ValueError:
+        await message.answer("Дата должна быть в формате YYYY-MM-DD.")
+        return
+
+    status = parts[5] if len(parts) > 5 else None
+
+    # пишем чанками во временный файл — память не зависит от объёма выгрузки
+    fd, path = tempfile.mkstemp(suffix=f".{fmt}")
+    os.close(fd)
+    try:
+        async with aiofiles.open(path, "wb") as f:
+            async for chunk in iter_export(table, fmt, date_from=date_from, date_to=date_to, status=status):
+                await f.write(chunk)
+
+        filename = f"{table}_{datetime.now():%Y%m%d_%H%M%S}.{fmt}"
+        await message.answer_document(FSInputFile(path, filename=filename))
+    finally:
+        os.remove(path)
+
+
+@router.message(Command("metrics"))
+async def metrics_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    m = onef_breaker.metrics()
+    await message.answer(
+        "📊 Метрики\n\n"
+        f"1F breaker: {m['state']}\n"
+        f"- ошибок подряд: {m['consecutive_failures']}\n"
+        f"- срабатываний (trips): {m['trips']}\n"
+        f"- отклонено вызовов: {m['rejected']}\n"
+        + (
+            f"\nРеплика: отставание {'?' if replica_router.lag is None else f'{replica_router.lag:.1f}'} с, "
+            f"чтение из {'реплики' if replica_router.use_replica else 'основной БД'}\n"
+            if replica_router.enabled else ""
+        )
+        + f"\nБлокировок event loop > {settings.slow_callback_ms} мс: {loop_watchdog.blocked_count}\n"
+        + "".join(
+            f"\nRetention {r.rule}: {r.rows} строк, {r.rows_per_second:.1f} строк/с ({r.finished_at:%Y-%m-%d %H:%M})"
+            for r in retention_runs.values()
+        )
+    )
+
+
+@router.message(Command("rate"))
+async def rate_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    parts = (message.text or "").split()
+    if len(parts) != 3:
+        await message.answer(f"Использование: /rate CUR rate (курс к {settings.base_currency})")
+        return
+
+    currency = parts[1].upper()
+    try:
+        rate = float(parts[2].replace(",", "."))
+    except ValueError:
+        await message.answer("Курс должен быть числом.")
+        return
+
+    if rate <= 0:
+        await message.answer("Курс должен быть больше нуля.")
+        return
+
+    async with SessionLocal() as session:
+        await upsert_rate(session, currency, rate)
+    invalidate_rates()
+
+    await message.answer(f"✅ 1 {currency} = {rate} {settings.base_currency}")
+
+
+FIND_PAGE_SIZE = 20
+
+
+@router.message(Command("find"))
+async def find_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    parts = (message.text or "").split()[1:]
+    before_id = None
+    if parts and parts[-1].startswith("before:"):
+        try:
+            before_id = int(parts.pop()[len("before:"):])
+        except ValueError:
+            await message.answer("before:id должен быть числом.")
+            return
+
+    query = " ".join(parts)
+    if not query:
+        await message.answer("Использование: /find +992XXXXXXXXX | ФИО | марка модель [before:id]")
+        return
+
+    async with read_session() as session:
+        found = await search_requests(session, query, limit=FIND_PAGE_SIZE, before_id=before_id)
+
+    if not found:
+        await message.answer("Ничего не найдено.")
+        return
+
+    lines = [f"🔎 Найдено (до {FIND_PAGE_SIZE}):"]
+    for r in found:
+        lines.append(
+            f"- #{r.external_id} — {r.status} — {r.user_full_name} — {r.user_phone} — "
+            f"{r.car_brand} {r.car_model} — {r.created_at:%Y-%m-%d}"
+        )
+    if len(found) == FIND_PAGE_SIZE:
+        lines.append(f"\nДальше: /find {query} before:{found[-1].id}")
+
+    text = "\n".join(lines)
+    if len(text) > 3800:
+        text = text[:3800] + "\n...\n(обрезано)"
+
+    await message.answer(text)
+
+
+STAGE_TITLES = {
+    "new_to_accept": "NEW → ACCEPT",
+    "accept_to_in_progress": "ACCEPT → IN_PROGRESS",
+    "in_progress_to_decision": "IN_PROGRESS → DECISION",
+}
+
+
+def _fmt_duration(seconds: float | None) -> str:
+    if seconds is None:
+        return "—"
+    minutes = int(seconds // 60)
+    if minutes < 1:
+        return f"{int(seconds)}с"
+    if minutes < 60:
+        return f"{minutes}м"
+    return f"{minutes // 60}ч {minutes % 60}м"
+
+
+def _fmt_stage(summary: dict) -> str:
+    return (
+        f"n={summary['count']}, p50 {_fmt_duration(summary['p50_seconds'])}, "
+        f"p90 {_fmt_duration(summary['p90_seconds'])}, p95 {_fmt_duration(summary['p95_seconds'])}"
+    )
+
+
+@router.message(Command("sla_report"))
+async def sla_report_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    parts = (message.text or "").split()
+    try:
+        days = int(parts[1]) if len(parts) > 1 else 7
+        executor_tg_id = int(parts[2]) if len(parts) > 2 else None
+    except ValueError:
+        await message.answer("Использование: /sla_report [дней=7] [tg_id]")
+        return
+
+    date_to = datetime.now().date()
+    report = await build_report(date_to - timedelta(days=max(days, 1) - 1), date_to, executor_tg_id)
+
+    lines = [f"⏱ Время в статусах за {report['date_from']} — {report['date_to']}\n"]
+    for stage in STAGE_NAMES:
+        lines.append(f"{STAGE_TITLES[stage]}: {_fmt_stage(report['stages'][stage])}")
+
+    for item in report["executors"]:
+        lines.append(f"\n👤 {item['executor_tg_id']}")
+        for stage, summary in item["stages"].items():
+            lines.append(f"- {STAGE_TITLES[stage]}: {_fmt_stage(summary)}")
+
+    text = "\n".join(lines)
+    if len(text) > 3800:
+        text = text[:3800] + "\n...\n(обрезано)"
+
+    await message.answer(text)
+
+
+PROFILE_MAX_SECONDS = 120
+_profile_lock = asyncio.Lock()
+
+
+@router.message(Command("profile"))
+async def profile_cmd(message: Message):
+    if message.from_user is None:
+        return
+
+    if not is_admin(message.from_user.id):
+        await message.answer("⛔ Недостаточно прав.")
+        return
+
+    parts = (message.text or "").split()
+    try:
+        seconds = int(parts[1]) if len(parts) > 1 else 10
+    except ValueError:
+        seconds = 0
+    if not 1 <= seconds <= PROFILE_MAX_SECONDS:
+        await message.answer(f"Использование: /profile [секунд=10], не больше {PROFILE_MAX_SECONDS}")
+        return
+
+    if _profile_lock.locked():
+        await message.answer("Профилирование уже идёт.")
+        return
+
+    async with _profile_lock:
+        await message.answer(f"⏳ Профилирую event loop {seconds} с...")
+        report = await profile_loop(seconds)
+
+    filename = f"profile_{datetime.now():%Y%m%d_%H%M%S}.txt"
+    await message.answer_document(BufferedInputFile(report.encode(), filename=filename))
@@ -0,0 +1,141 @@
+from __future__ import annotations
+
+import asyncio
+import atexit
+import json
+import logging
+import queue
+import sys
+import weakref
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Any
+
+# Поля корреляции: проставляются middleware / хендлерами, попадают в каждую запись
+CORRELATION_FIELDS = ("external_id", "tg_id", "update_id", "callback")
+
+_log_context: ContextVar[dict[str, Any]] = ContextVar("log_context", default={})
+
+# задача -> её поля: чтобы прочитать контекст чужой задачи (Task.get_context() есть только с 3.12)
+_task_contexts: weakref.WeakKeyDictionary[asyncio.Task, dict[str, Any]] = weakref.WeakKeyDictionary()
+
+_listener: QueueListener | None = None
+
+
+def bind_log_context(**fields: Any) -> None:
+    """Добавляет поля корреляции в контекст текущей задачи (asyncio task)."""
+    context = {**_log_context.get(), **{k: v for k, v in fields.items() if v is not None}}
+    _log_context.set(context)
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        _task_contexts[task] = context
+
+
+def get_log_context(task: asyncio.Task | None = None) -> dict[str, Any]:
+    """Поля корреляции текущей задачи или переданной (можно вызывать из другого потока)."""
+    if task is None:
+        return dict(_log_context.get())
+    if hasattr(task, "get_context"):
+        return dict(task.get_context().get(_log_context, {}))
+    return dict(_task_contexts.get(task, {}))
+
+
+class _ContextQueueHandler(QueueHandler):
+    """
+    Кладёт запись в очередь, не форматируя её в event loop.
+    Поля корреляции снимаются здесь — в задаче, которая пишет лог.
+    """
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        for key, value in _log_context.get().items():
+            if not hasattr(record, key):
+                setattr(record, key, value)
+
+        record.message = record.getMessage()
+        if record.exc_info and not record.exc_text:
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+
+        record.msg = record.message
+        record.args = None
+        record.exc_info = None
+        return record
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        data: dict[str, Any] = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key in CORRELATION_FIELDS:
+            value = getattr(record, key, None)
+            if value is not None:
+                data[key] = value
+        if record.exc_text:
+            data["exc"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False, default=str)
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Сэмплинг болтливых строк: пропускает каждую N-ю запись одного шаблона.
+    N берётся из extra={"sample_every": N} или из sample_loggers[record.name]
+    (только для INFO и ниже — предупреждения и ошибки не сэмплируются).
+    """
+    def __init__(self, sample_loggers: dict[str, int] | None = None) -> None:
+        super().__init__()
+        self._sample_loggers = sample_loggers or {}
+        self._counters: dict[tuple[str, str], int] = {}
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno > logging.INFO:
+            return True
+
+        every = getattr(record, "sample_every", None) or self._sample_loggers.get(record.name)
+        if not every or every <= 1:
+            return True
+
+        key = (record.name, str(record.msg))
+        count = self._counters.get(key, 0)
+        self._counters[key] = count + 1
+        return count % every == 0
+
+
+def setup_logging(level: int = logging.INFO) -> None:
+    """
+    Общая настройка логов для main.py и receive_from_1f.py:
+    root -> QueueHandler -> (фоновый поток) QueueListener -> stdout в JSON.
+    Медленный потребитель stdout больше не блокирует event loop.
+    """
+    global _listener
+    if _listener is not None:
+        return
+
+    log_queue: queue.SimpleQueue = queue.SimpleQueue()
+
+    stream_handler = logging.StreamHandler(sys.stdout)
+    stream_handler.setFormatter(JsonFormatter())
+
+    queue_handler = _ContextQueueHandler(log_queue)
+    # aiogram пишет INFO на каждый апдейт
+    queue_handler.addFilter(SamplingFilter({"aiogram.event": 20}))
+
+    root = logging.getLogger()
+    root.handlers[:] = [queue_handler]
+    root.setLevel(level)
+
+    _listener = QueueListener(log_queue, stream_handler, respect_handler_level=True)
+    _listener.start()
+    atexit.register(_stop_listener)
+
+
+def _stop_listener() -> None:
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
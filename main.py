@@ -3,26 +3,39 @@ from __future__ import annotations
 import asyncio
 import logging
 
-from aiogram import Dispatcher
+from aiogram import Bot, Dispatcher
 from aiogram.fsm.storage.memory import MemoryStorage
 from aiogram.utils.chat_action import ChatActionMiddleware
 
 from bot_instance import bot
+from config import settings
 from db import SessionLocal, init_db
 from handlers.handlers_accept import router as handlers_accept_router
 from handlers.handlers_admin import router as handlers_admin_router
 from handlers.handlers_test import router as handlers_test_router
-from middleware import ChatTypeMiddleware
+from logging_setup import setup_logging
+from middleware import (
+    CallbackSingleFlightMiddleware,
+    ChatTypeMiddleware,
+    LogContextMiddleware,
+    UpdateExecutorMiddleware,
+)
 from repo.requests_repo import (
     get_group_error_requests,
+    get_onef_decisions,
     get_onef_error_requests,
     mark_group_failed,
     mark_group_sent,
-    mark_onef_failed,
-    mark_onef_sent_done,
 )
 from services.bot_functions import send_request_to_ka_group
-from services.send_onef_in_progress import send_in_progress_to_1f
+from services.group_routing import route_request
+from services.loop_profiler import loop_watchdog
+from services.onef_utils import onef_breaker
+from services.read_replica import replica_router
+from services.send_onef_approved import send_ka_result_to_1f
+from services.retention import retention_periodically
+from services.sla_scheduler import sla_scheduler
+from services.status_rollup import rollup_periodically
 
 logger = logging.getLogger("ka_bot")
 
@@ -30,36 +43,31 @@ logger = logging.getLogger("ka_bot")
 async def retry_group_errors_periodically() -> None:
     while True:
         await asyncio.sleep(300)
-        logger.info("[Retry-GROUP] checking ERROR_GROUP...")
+        logger.info("[Retry-GROUP] checking ERROR_GROUP...", extra={"sample_every": 12})
 
         async with SessionLocal() as session:
-            items = await get_group_error_requests(session, limit=50)
+            items = await get_group_error_requests(session, limit=50, by_value=settings.retry_by_value_first)
 
         if not items:
             continue
 
         for req in items:
             try:
-                car = {
-                    "Brand": req.car_brand,
-                    "Model": req.car_model,
-                    "Year": req.car_year,
-                    "Color": req.car_color,
-                    "Motor": req.car_motor,
-                    "Price": req.car_price,
-                    "Currency": req.car_currency,
-                }
-
+                car = req.car
+                chat_id = req.group_chat_id or route_request(req.external_id, car)
                 msg_id = await send_request_to_ka_group(
                     bot=bot,
                     external_id=req.external_id,
                     full_name=req.user_full_name,
                     phone=req.user_phone,
                     car=car,
+                    chat_id=chat_id,
                 )
 
                 async with SessionLocal() as session:
-                    await mark_group_sent(session, req.external_id, msg_id)
+                    await mark_group_sent(session, req.external_id, msg_id, chat_id)
+
+                sla_scheduler.on_new(req.external_id)
 
                 logger.info("[Retry-GROUP] sent #%s msg_id=%s", req.external_id, msg_id)
 
@@ -72,54 +80,87 @@ async def retry_group_errors_periodically() -> None:
 async def retry_onef_errors_periodically() -> None:
     while True:
         await asyncio.sleep(300)
-        logger.info("[Retry-1F] checking ERROR_ONEF...")
+        logger.info("[Retry-1F] checking ERROR_ONEF...", extra={"sample_every": 12})
 
         async with SessionLocal() as session:
-            items = await get_onef_error_requests(session, limit=50)
+            items = await get_onef_error_requests(session, limit=50, by_value=settings.retry_by_value_first)
+            decisions = await get_onef_decisions(session, [r.external_id for r in items]) if items else {}
 
         if not items:
             continue
 
         for req in items:
-            try:
+            # 1F недоступен — не тратим таймаут на каждую из оставшихся строк
+            if onef_breaker.is_open():
+                logger.warning("[Retry-1F] circuit open, postponing remaining requests")
+                break
 
-                await send_in_progress_to_1f(
+            decision = decisions.get(req.external_id)
+            if decision is None:
+                logger.error("[Retry-1F] no stored decision for #%s, skipping", req.external_id)
+                continue
+
+            # отправка идёт через onef_breaker.call; успех / ошибку помечает сама функция
+            try:
+                await send_ka_result_to_1f(
                     request_id=req.external_id,
+                    ka_status=decision,
                     employee_tg_id=req.assigned_to_tg_id or 0,
-                    employee_username=req.assigned_to_username,
+                    comment=req.decision_comment,
+                    decided_at=req.decided_at,
                 )
-
-                async with SessionLocal() as session:
-                    await mark_onef_sent_done(session, req.external_id)
-
                 logger.info("[Retry-1F] sent #%s", req.external_id)
-
-            except Exception as e:
-                async with SessionLocal() as session:
-                    await mark_onef_failed(session, req.external_id, str(e))
-                logger.exception("[Retry-1F] failed #%s", req.external_id)
+            except Exception:
+                logger.warning("[Retry-1F] failed #%s", req.external_id)
 
 
-async def main() -> None:
-    logging.basicConfig(
-        level=logging.INFO,
-        format="%(asctime)s - %(name)s - %(levelname)s - %(message)s",
-    )
+def build_dispatcher(bot: Bot) -> Dispatcher:
+    """Dispatcher со всеми middleware и роутерами (используется и в benchmarks/suite.py)."""
+    dp = Dispatcher(storage=MemoryStorage())
 
-    await init_db()
+    dp.update.outer_middleware(LogContextMiddleware())
 
-    dp = Dispatcher(storage=MemoryStorage())
+    # один чат/пользователь — по порядку, разные чаты — параллельно
+    update_executor = UpdateExecutorMiddleware(max_concurrency=64)
+    dp.update.outer_middleware(update_executor)
 
     # message handlers only in private chat
     dp.message.outer_middleware(ChatTypeMiddleware())
     dp.message.middleware(ChatActionMiddleware())
 
+    # дубли нажатий (double-click) не повторяют работу хендлера
+    single_flight = CallbackSingleFlightMiddleware()
+    dp.callback_query.outer_middleware(single_flight)
+    bot.session.middleware(single_flight.answer_recorder)
+
     dp.include_router(handlers_accept_router)
     dp.include_router(handlers_test_router)
     dp.include_router(handlers_admin_router)
+    return dp
+
+
+async def start_background_tasks() -> list[asyncio.Task]:
+    """Retry-циклы, SLA-планировщик, роллап времени в статусах, retention, heartbeat реплики и детектор блокировок loop (таски живут до отмены)."""
+    await sla_scheduler.rebuild()
+    tasks = [loop_watchdog.start()] if settings.slow_callback_ms > 0 else []
+    return tasks + [
+        asyncio.create_task(retry_group_errors_periodically()),
+        asyncio.create_task(retry_onef_errors_periodically()),
+        asyncio.create_task(sla_scheduler.run()),
+        asyncio.create_task(rollup_periodically()),
+        asyncio.create_task(retention_periodically()),
+        asyncio.create_task(replica_router.run()),
+    ]
+
+
+async def main() -> None:
+    setup_logging(logging.INFO)
+
+    await init_db()
+
+    dp = build_dispatcher(bot)
 
-    asyncio.create_task(retry_group_errors_periodically())
-    asyncio.create_task(retry_onef_errors_periodically())
+    await start_background_tasks()
 
     await bot.delete_webhook(drop_pending_updates=True)
     await dp.start_polling(bot)
@@ -1,9 +1,15 @@
 from __future__ import annotations
 
+import asyncio
 from typing import Any, Awaitable, Callable, Dict
 
 from aiogram import BaseMiddleware
-from aiogram.types import Message
+from aiogram.client.session.middlewares.base import BaseRequestMiddleware
+from aiogram.methods import AnswerCallbackQuery
+from aiogram.types import CallbackQuery, Message, TelegramObject, Update
+
+from logging_setup import bind_log_context
+from services.lru_cache import LruCache
 
 
 class ChatTypeMiddleware(BaseMiddleware):
@@ -21,3 +27,144 @@ class ChatTypeMiddleware(BaseMiddleware):
         if event.chat.type != "private":
             return None
         return await handler(event, data)
+
+
+class _CallbackAnswerRecorder(BaseRequestMiddleware):
+    """
+    Middleware сессии бота: запоминает answerCallbackQuery для
+    отслеживаемых callback_query_id (чтобы переиспользовать ответ у дублей).
+    """
+    def __init__(self) -> None:
+        self.watched: Dict[str, Dict[str, Any] | None] = {}
+
+    async def __call__(self, make_request, bot, method):
+        if isinstance(method, AnswerCallbackQuery) and method.callback_query_id in self.watched:
+            self.watched[method.callback_query_id] = {
+                "text": method.text,
+                "show_alert": method.show_alert,
+            }
+        return await make_request(bot, method)
+
+
+class CallbackSingleFlightMiddleware(BaseMiddleware):
+    """
+    Single-flight для кнопок: дубли (user_id, callback_data), пришедшие
+    пока первый клик ещё обрабатывается, ждут его и получают тот же answer,
+    не повторяя проверки в БД и запросы в Telegram.
+    Поздние дубли в течение ttl отвечаются из кэша завершённых.
+
+    Подключение: dp.callback_query.outer_middleware(mw)
+                 bot.session.middleware(mw.answer_recorder)
+    """
+    def __init__(
+        self,
+        prefixes: tuple[str, ...] = ("ka_accept:", "ka_in_progress:", "ka_send_onef:"),
+        ttl_seconds: float = 5.0,
+    ) -> None:
+        self.prefixes = prefixes
+        self.answer_recorder = _CallbackAnswerRecorder()
+        self._in_flight: Dict[tuple[int, str], asyncio.Future] = {}
+        self._completed = LruCache(maxsize=10_000, ttl_seconds=ttl_seconds)
+
+    async def __call__(
+        self,
+        handler: Callable[[CallbackQuery, Dict[str, Any]], Awaitable[Any]],
+        event: CallbackQuery,
+        data: Dict[str, Any],
+    ) -> Any:
+        if event.from_user is None or not event.data or not event.data.startswith(self.prefixes):
+            return await handler(event, data)
+
+        key = (event.from_user.id, event.data)
+
+        answer = self._completed.get(key)
+        if answer is not None:
+            await event.answer(**answer)
+            return None
+
+        leader = self._in_flight.get(key)
+        if leader is not None:
+            answer = await asyncio.shield(leader)
+            await event.answer(**(answer or {}))
+            return None
+
+        future = asyncio.get_running_loop().create_future()
+        self._in_flight[key] = future
+        self.answer_recorder.watched[event.id] = None
+        try:
+            return await handler(event, data)
+        finally:
+            answer = self.answer_recorder.watched.pop(event.id, None)
+            del self._in_flight[key]
+            if answer is not None:
+                self._completed.set(key, answer)
+            future.set_result(answer)
+
+
+class UpdateExecutorMiddleware(BaseMiddleware):
+    """
+    Порядок выполнения апдейтов:
+    - апдейты одного (chat_id, user_id) выполняются строго по очереди
+      (например, клик по кнопке и следующий за ним комментарий не пересекаются
+      в state.update_data / state.get_data);
+    - разные чаты — параллельно, но не более max_concurrency одновременно.
+
+    Слот конкурентности берётся только после своей очереди, поэтому длинная
+    очередь одного чата не занимает слоты остальных.
+
+    Подключение: dp.update.outer_middleware(mw) — после UserContextMiddleware,
+    чтобы в data уже были event_chat / event_from_user.
+    """
+    def __init__(self, max_concurrency: int = 64) -> None:
+        self._slots = asyncio.Semaphore(max_concurrency)
+        self._locks: Dict[tuple[int | None, int | None], asyncio.Lock] = {}
+        self._depth: Dict[tuple[int | None, int | None], int] = {}
+
+    def queue_depth(self, key: tuple[int | None, int | None]) -> int:
+        """Сколько апдейтов ключа сейчас выполняется или ждёт (0 — нет)."""
+        return self._depth.get(key, 0)
+
+    def queue_depths(self) -> Dict[tuple[int | None, int | None], int]:
+        return dict(self._depth)
+
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        chat = data.get("event_chat")
+        user = data.get("event_from_user")
+        key = (chat.id if chat else None, user.id if user else None)
+
+        lock = self._locks.get(key)
+        if lock is None:
+            lock = self._locks[key] = asyncio.Lock()
+        self._depth[key] = self._depth.get(key, 0) + 1
+
+        try:
+            async with lock:
+                async with self._slots:
+                    return await handler(event, data)
+        finally:
+            self._depth[key] -= 1
+            if self._depth[key] == 0:
+                del self._depth[key]
+                del self._locks[key]
+
+
+class LogContextMiddleware(BaseMiddleware):
+    """
+    Проставляет update_id / tg_id (и префикс callback_data) в контекст логов задачи апдейта.
+    Подключение: dp.update.outer_middleware(mw)
+    """
+    async def __call__(
+        self,
+        handler: Callable[[TelegramObject, Dict[str, Any]], Awaitable[Any]],
+        event: Update,
+        data: Dict[str, Any],
+    ) -> Any:
+        user = data.get("event_from_user")
+        callback = event.callback_query.data.split(":", 1)[0] if event.callback_query and event.callback_query.data else None
+        bind_log_context(update_id=event.update_id, tg_id=user.id if user else None, callback=callback)
+        return await handler(event, data)
@@ -1,12 +1,40 @@
-from datetime import datetime
-from sqlalchemy import Integer, String, DateTime, Text, Boolean
+from datetime import date, datetime
+from sqlalchemy import BigInteger, Integer, SmallInteger, String, Date, DateTime, Text, Boolean, Float, Numeric, Index, bindparam, event, insert, select, text, update
 from sqlalchemy.orm import Mapped, mapped_column
 from db import Base
 
 
 
+# колонки авто -> ключи car-dict из payload 1F (render_request_text и др.)
+CAR_FIELDS = {
+    "Brand": "car_brand",
+    "Model": "car_model",
+    "Year": "car_year",
+    "Color": "car_color",
+    "Motor": "car_motor",
+    "Price": "car_price",
+    "Currency": "car_currency",
+}
+
+
+def car_dict(obj) -> dict:
+    """car-dict из Request или RequestSnapshot."""
+    return {key: getattr(obj, attr) for key, attr in CAR_FIELDS.items()}
+
+
+def normalize_phone(phone: str | None) -> str:
+    """'+992 900-12-34-56' -> '992900123456'"""
+    return "".join(ch for ch in (phone or "") if ch.isdigit())
+
+
 class Request(Base):
     __tablename__ = "requests"
+    __table_args__ = (
+        # очереди retry по статусу, дорогие заявки первыми
+        Index("ix_requests_status_price_base", "status", "car_price_base"),
+        # покрывающий для сверки статусов 1F (requests:status): ответ только из индекса
+        Index("ix_requests_status_lookup", "external_id", "status", "decided_at", "is_sent_to_1f", "updated_at"),
+    )
 
     id: Mapped[int] = mapped_column(Integer, primary_key=True, autoincrement=True)
 
@@ -19,6 +47,8 @@ class Request(Base):
     # User info
     user_full_name: Mapped[str] = mapped_column(String(255))
     user_phone: Mapped[str] = mapped_column(String(32))
+    # только цифры (992XXXXXXXXX) — точный и префиксный поиск по B-tree
+    user_phone_norm: Mapped[str | None] = mapped_column(String(32), nullable=True, index=True)
 
     #Car info
     car_brand: Mapped[str] = mapped_column(String(128))
@@ -29,7 +59,12 @@ class Request(Base):
     car_price: Mapped[str] = mapped_column(String(64))
     car_currency: Mapped[str] = mapped_column(String(8))
 
-    # Telegram
+    # Нормализованная цена: число в валюте заявки и в базовой валюте (settings.base_currency)
+    car_price_value: Mapped[float | None] = mapped_column(Numeric(18, 2, asdecimal=False), nullable=True, index=True)
+    car_price_base: Mapped[float | None] = mapped_column(Numeric(18, 2, asdecimal=False), nullable=True, index=True)
+
+    # Telegram: группа КА, куда опубликована заявка (NULL — settings.group_chat_id), и id сообщения в ней
+    group_chat_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True, index=True)
     group_message_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
 
     # Accept (executor) info
@@ -38,8 +73,8 @@ class Request(Base):
     assigned_at: Mapped[datetime | None] = mapped_column(DateTime, nullable=True)
 
     # timestamps
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())
-    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now(), onupdate=datetime.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, index=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
 
     # Telegram group delivery
     is_sent_to_group: Mapped[bool] = mapped_column(Boolean, default=False, index=True)
@@ -55,6 +90,103 @@ class Request(Base):
 
     callback_attempts: Mapped[int] = mapped_column(Integer, default=0, index=True)
 
+    # отпечаток нормализованного payload 1F: повтор с тем же контентом — без записи
+    # (NULL — заявка до отпечатков, сравнивается по колонкам)
+    content_hash: Mapped[str | None] = mapped_column(String(32), nullable=True)
+
+    @property
+    def car(self) -> dict:
+        return car_dict(self)
+
+
+
+# Полнотекстовый поиск по клиенту и авто (см. repo/search_repo.py):
+# SQLite — FTS5 (external content + триггеры), Postgres — pg_trgm GIN по склейке полей.
+SEARCH_TEXT_SQL = "(user_full_name || ' ' || car_brand || ' ' || car_model)"
+
+_SQLITE_SEARCH_DDL = (
+    "CREATE VIRTUAL TABLE requests_fts USING fts5("
+    "user_full_name, car_brand, car_model, content='requests', content_rowid='id')",
+    "CREATE TRIGGER IF NOT EXISTS requests_fts_ai AFTER INSERT ON requests BEGIN "
+    "INSERT INTO requests_fts(rowid, user_full_name, car_brand, car_model) "
+    "VALUES (new.id, new.user_full_name, new.car_brand, new.car_model); END",
+    "CREATE TRIGGER IF NOT EXISTS requests_fts_ad AFTER DELETE ON requests BEGIN "
+    "INSERT INTO requests_fts(requests_fts, rowid, user_full_name, car_brand, car_model) "
+    "VALUES ('delete', old.id, old.user_full_name, old.car_brand, old.car_model); END",
+    "CREATE TRIGGER IF NOT EXISTS requests_fts_au AFTER UPDATE OF user_full_name, car_brand, car_model ON requests BEGIN "
+    "INSERT INTO requests_fts(requests_fts, rowid, user_full_name, car_brand, car_model) "
+    "VALUES ('delete', old.id, old.user_full_name, old.car_brand, old.car_model); "
+    "INSERT INTO requests_fts(rowid, user_full_name, car_brand, car_model) "
+    "VALUES (new.id, new.user_full_name, new.car_brand, new.car_model); END",
+    "INSERT INTO requests_fts(requests_fts) VALUES ('rebuild')",
+)
+
+_POSTGRES_SEARCH_DDL = (
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    f"CREATE INDEX IF NOT EXISTS ix_requests_search_trgm ON requests USING gin ({SEARCH_TEXT_SQL} gin_trgm_ops)",
+)
+
+
+_PHONE_NORM_CHECKPOINT = "phone_norm.backfill"
+_PHONE_NORM_BATCH = 1000
+
+
+def _backfill_phone_norm(connection) -> None:
+    """
+    user_phone_norm старых строк — той же normalize_phone, пачками по id (прежний
+    SQL-backfill убирал только '+', ' ', '-'). Позиция — в job_checkpoints: полный
+    проход один раз, дальше при старте досматриваются только новые строки.
+    """
+    requests_t, checkpoints_t = Request.__table__, JobCheckpoint.__table__
+    start = after = connection.execute(
+        select(checkpoints_t.c.value).where(checkpoints_t.c.name == _PHONE_NORM_CHECKPOINT)
+    ).scalar() or 0
+    fix = (
+        update(requests_t)
+        .where(requests_t.c.id == bindparam("b_id"))
+        # правка данных — не изменение заявки: updated_at не трогаем
+        .values(user_phone_norm=bindparam("b_norm"), updated_at=requests_t.c.updated_at)
+    )
+    while True:
+        rows = connection.execute(
+            select(requests_t.c.id, requests_t.c.user_phone, requests_t.c.user_phone_norm)
+            .where(requests_t.c.id > after)
+            .order_by(requests_t.c.id.asc())
+            .limit(_PHONE_NORM_BATCH)
+        ).all()
+        if not rows:
+            break
+        changed = [
+            {"b_id": r.id, "b_norm": normalize_phone(r.user_phone)}
+            for r in rows
+            if normalize_phone(r.user_phone) != r.user_phone_norm
+        ]
+        if changed:
+            connection.execute(fix, changed)
+        after = rows[-1].id
+
+    if after != start:
+        saved = connection.execute(
+            update(checkpoints_t).where(checkpoints_t.c.name == _PHONE_NORM_CHECKPOINT).values(value=after)
+        )
+        if not saved.rowcount:
+            connection.execute(insert(checkpoints_t).values(name=_PHONE_NORM_CHECKPOINT, value=after))
+
+
+@event.listens_for(Base.metadata, "after_create")
+def _create_search_indexes(target, connection, **kw) -> None:
+    _backfill_phone_norm(connection)
+
+    if connection.dialect.name == "sqlite":
+        exists = connection.execute(
+            text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'requests_fts'")
+        ).first()
+        if not exists:
+            for ddl in _SQLITE_SEARCH_DDL:
+                connection.execute(text(ddl))
+    elif connection.dialect.name == "postgresql":
+        for ddl in _POSTGRES_SEARCH_DDL:
+            connection.execute(text(ddl))
 
 
 class AuditLog(Base):
@@ -66,7 +198,26 @@ class AuditLog(Base):
     entity_id: Mapped[str] = mapped_column(String(64), index=True)
     actor_tg_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
     payload_json: Mapped[str | None] = mapped_column(Text, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, index=True)
+
+
+class RequestEvent(Base):
+    """
+    Append-only журнал жизненного цикла заявки. requests — проекция этих событий,
+    обновляется в той же транзакции; пересборка — services/request_projector.py.
+    type — EventType, data — компактный JSON с колонками, которые меняет событие
+    (см. repo/events_repo.py). Индекс только (external_id, id): вставки дешёвые.
+    """
+    __tablename__ = "request_events"
+    __table_args__ = (Index("ix_request_events_external_id_id", "external_id", "id"),)
+
+    # в SQLite только INTEGER PRIMARY KEY — алиас rowid (последовательные вставки)
+    id: Mapped[int] = mapped_column(BigInteger().with_variant(Integer, "sqlite"), primary_key=True, autoincrement=True)
+    external_id: Mapped[int] = mapped_column(Integer)
+    type: Mapped[int] = mapped_column(SmallInteger)
+    actor_tg_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    data: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
 
 
 class PermittedUser(Base):
@@ -80,5 +231,47 @@ class PermittedUser(Base):
 
     is_active: Mapped[bool] = mapped_column(Boolean, default=True, index=True)
 
+    # Группа КА, в которой пользователь может нажимать Accept (NULL — во всех)
+    group_chat_id: Mapped[int | None] = mapped_column(BigInteger, nullable=True, index=True)
+
     added_by_tg_id: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now())
+    created_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now)
+
+
+class CurrencyRate(Base):
+    """
+    Курс валюты к базовой (settings.base_currency): amount_base = amount * rate_to_base.
+    """
+    __tablename__ = "currency_rates"
+
+    currency: Mapped[str] = mapped_column(String(8), primary_key=True)
+    rate_to_base: Mapped[float] = mapped_column(Numeric(18, 6, asdecimal=False))
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class JobCheckpoint(Base):
+    """
+    Позиция фоновой задачи (high-water mark), например последний
+    обработанный audit_log.id у роллапа времени в статусах.
+    """
+    __tablename__ = "job_checkpoints"
+
+    name: Mapped[str] = mapped_column(String(64), primary_key=True)
+    value: Mapped[int] = mapped_column(BigInteger, default=0)
+    updated_at: Mapped[datetime] = mapped_column(DateTime, default=datetime.now, onupdate=datetime.now)
+
+
+class StatusDurationRollup(Base):
+    """
+    Время в статусах за день по исполнителю и этапу (см. services/status_rollup.py):
+    count / total_seconds и разреженная лог-гистограмма в JSON {bucket: count}.
+    """
+    __tablename__ = "status_duration_rollups"
+
+    day: Mapped[date] = mapped_column(Date, primary_key=True)
+    executor_tg_id: Mapped[int] = mapped_column(BigInteger, primary_key=True)
+    stage: Mapped[str] = mapped_column(String(32), primary_key=True)
+
+    count: Mapped[int] = mapped_column(Integer, default=0)
+    total_seconds: Mapped[float] = mapped_column(Float, default=0.0)
+    histogram: Mapped[str] = mapped_column(Text, default="{}")
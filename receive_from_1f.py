@@ -1,16 +1,62 @@
+import asyncio
+import hashlib
+import hmac
+import logging
 from contextlib import asynccontextmanager
-from fastapi import FastAPI, Header, HTTPException
-from pydantic import BaseModel
-from typing import Optional, Literal, Dict, Any
+from datetime import date, datetime, timedelta, timezone
+from email.utils import format_datetime
+import orjson
+from fastapi import FastAPI, Header, HTTPException, Query
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from pydantic import BaseModel, Field, StrictInt, StringConstraints
+from typing import Annotated, Optional, Literal
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from config import settings
 from db import init_db, SessionLocal
 from bot_instance import bot
-from services.bot_functions import send_request_to_ka_group
-from repo.requests_repo import create_if_not_exists, mark_group_sent, set_group_message_id , mark_sent_to_group,  mark_send_failed, mark_group_failed
+from services.bot_functions import render_group_card, send_request_to_ka_group
+from services.export import iter_export
+from services.group_routing import request_group_chat_id, route_request
+from services.lru_cache import LruCache
+from services.pricing import normalize_price
+from services.read_replica import read_session, replica_router
+from services.status_rollup import build_report
+from logging_setup import bind_log_context, setup_logging
+from repo.search_repo import search_requests
+from repo.requests_repo import content_fingerprint, create_if_not_exists, get_statuses, request_content, update_content_if_changed
+from repo.requests_repo import mark_group_sent, set_group_message_id , mark_sent_to_group,  mark_send_failed, mark_group_failed
 
 Currency = Literal["TJS", "USD", "EUR", "RUB"]
 
+# формат из ТЗ: +992XXXXXXXXX
+Phone = Annotated[str, StringConstraints(strict=True, strip_whitespace=True, pattern=r"^\+992\d{9}$")]
+Text = Annotated[str, StringConstraints(strict=True, strip_whitespace=True)]
+
+PUBLISH_IN_FLIGHT = timedelta(seconds=60)
+
+# максимум ID в одном запросе сверки статусов
+STATUS_LOOKUP_MAX_IDS = 5000
+
+logger = logging.getLogger("ka_bot")
+
+
+class UserIn(BaseModel):
+    FullName: Text
+    DateOfBirth: Optional[date] = None
+    Phonenumber: Phone
+
+
+class CarIn(BaseModel):
+    CarId: Optional[StrictInt] = None
+    Brand: Text
+    Model: Text
+    Motor: Text
+    Price: Text
+    Currency: Currency
+    Year: StrictInt
+    Color: Text
+
 
 class CreateRequestIn(BaseModel):
     """
@@ -29,85 +75,139 @@ class CreateRequestIn(BaseModel):
             "Model": str,
             "Motor": str,
             "Price": str,
-            "Currency": str,    // рекомендуемый enum: TJS|USD|EUR|RUB
+            "Currency": str,    // enum: TJS|USD|EUR|RUB
             "Year": int,
             "Color": str
         }
     }
     """
-    ID: int
-    User: Dict[str, Any]
-    Car: Dict[str, Any]
+    ID: StrictInt
+    User: UserIn
+    Car: CarIn
+
+
+class StatusLookupIn(BaseModel):
+    """Сверка 1F: {"ids": [int, ...]} — до STATUS_LOOKUP_MAX_IDS заявок за раз."""
+    ids: Annotated[list[StrictInt], Field(min_length=1, max_length=STATUS_LOOKUP_MAX_IDS)]
 
 
 @asynccontextmanager
 async def lifespan(app: FastAPI):
+    setup_logging(logging.INFO)
     await init_db()
+    # в run_all.py цикл уже запущен фоновыми тасками — второй run() сразу выходит
+    heartbeat = asyncio.create_task(replica_router.run())
     yield
+    heartbeat.cancel()
 
 
-app = FastAPI(lifespan=lifespan)
+app = FastAPI(lifespan=lifespan, default_response_class=ORJSONResponse)
+
+# external_id -> (отпечаток контента, group_message_id) опубликованных заявок: частый ретрай
+# 1F с тем же контентом обходится одним чтением статуса из покрывающего индекса
+# (статус не кэшируем — заявку могли уже взять в работу)
+recent_requests = LruCache(maxsize=10_000)
+
+
+def _published_result(external_id: int, status: str, group_message_id: int) -> dict:
+    return {
+        "ok": True,
+        "request_id": external_id,
+        "status": status,
+        "group_message_id": group_message_id,
+        "sent_to_group": True,
+    }
 
 
 @app.post("/api/v1/ka-bot/requests")
 async def create_request(payload: CreateRequestIn, authorization: Optional[str] = Header(default=None)):
     # TODO(1F): добавить проверку authorization (Bearer/HMAC) согласно ТЗ
-    print("Received request:", payload)
-    # User - info with verification
-    full_name = str(payload.User.get("FullName", "")).strip()
-    phone = str(payload.User.get("Phonenumber", "")).strip()
+    # Ответ отдаём готовым ORJSONResponse — минуя jsonable_encoder
+    return ORJSONResponse(await _create_request(payload))
+
 
-    if not phone.startswith("+992"):
-        raise HTTPException(status_code=422, detail="Phone number must start with +992")
+async def _create_request(payload: CreateRequestIn) -> dict:
+    bind_log_context(external_id=payload.ID)
+    logger.info("Received request from 1F")
+    # User - info (формат телефона уже проверен моделью)
+    full_name = payload.User.FullName
+    phone = payload.User.Phonenumber
 
     # ID - info
     external_id = payload.ID
 
     # Car - info
-    car_dict = payload.Car
+    car_dict = payload.Car.model_dump()
+    fingerprint = content_fingerprint(request_content(full_name, phone, car_dict))
+
+    cached = recent_requests.get(external_id)
+    if cached is not None and cached[0] == fingerprint:
+        async with SessionLocal() as session:
+            rows = await get_statuses(session, [external_id])
+        if rows:
+            return _published_result(external_id, rows[0].status, cached[1])
+        recent_requests.pop(external_id)
 
     async with SessionLocal() as session:  
+        price_value, price_base = await normalize_price(session, payload.Car.Price, payload.Car.Currency)
         req, created = await create_if_not_exists(
             session=session,
             external_id=external_id,
             user_full_name=full_name,
             user_phone=phone,
             car=car_dict,
+            car_price_value=price_value,
+            car_price_base=price_base,
+            fingerprint=fingerprint,
         )
 
+        # Повтор с исправленными данными — правим строку на месте (тот же контент — без записи)
+        if not created:
+            text_before, _ = render_group_card(req)
+            changes = await update_content_if_changed(
+                session, req, full_name, phone, car_dict, price_value, price_base, fingerprint=fingerprint
+            )
+            if changes:
+                logger.info("Request content updated by 1F: %s", ", ".join(changes))
+                if req.is_sent_to_group and req.group_message_id is not None:
+                    await _refresh_group_card(req, text_before)
+
         # Если уже существует и УЖЕ отправлено в группу — просто вернем текущие данные
         if not created and getattr(req, "is_sent_to_group", False) and req.group_message_id is not None:
+            recent_requests.set(external_id, (fingerprint, req.group_message_id))
+            return _published_result(external_id, req.status, req.group_message_id)
+
+        # Дубль, пока первый вызов ещё публикует — второй раз в группу не шлём
+        # (старую неотправленную NEW считаем зависшей и публикуем заново)
+        if not created and req.status == "NEW" and req.created_at > datetime.now() - PUBLISH_IN_FLIGHT:
             return {
                 "ok": True,
                 "request_id": external_id,
                 "status": req.status,
-                "group_message_id": req.group_message_id,
-                "sent_to_group": True,
+                "group_message_id": None,
+                "sent_to_group": False,
             }
 
         # Пытаемся отправить в группу КА
         try:
+            group_chat_id = route_request(external_id, car_dict)
             group_message_id = await send_request_to_ka_group(
                 bot=bot,
                 external_id=external_id,
                 full_name=full_name,
                 phone=phone,
                 car=car_dict,
+                chat_id=group_chat_id,
             )
 
             # ✅ помечаем, что отправка успешна
-            await mark_group_sent(session, external_id, group_message_id)
+            await mark_group_sent(session, external_id, group_message_id, group_chat_id)
 
-            return {
-                "ok": True,
-                "request_id": external_id,
-                "status": req.status,
-                "group_message_id": group_message_id,
-                "sent_to_group": True,
-            }
+            recent_requests.set(external_id, (fingerprint, group_message_id))
+            return _published_result(external_id, "NEW", group_message_id)
 
         except Exception as e:
-
+            logger.exception("Failed to send request to KA group")
             await mark_group_failed(session, external_id, str(e))
             
             return {
@@ -118,3 +218,155 @@ async def create_request(payload: CreateRequestIn, authorization: Optional[str]
                 "sent_to_group": False,
                 "error": "Failed to send to group. Will retry.",
             }
+
+
+async def _refresh_group_card(req, text_before: str) -> None:
+    """Правит сообщение заявки в группе, только если текст карточки изменился."""
+    text, reply_markup = render_group_card(req)
+    if text == text_before:
+        return
+    try:
+        await bot.edit_message_text(
+            chat_id=request_group_chat_id(req),
+            message_id=req.group_message_id,
+            text=text,
+            reply_markup=reply_markup,
+        )
+    except Exception:
+        logger.warning("Failed to refresh group card after 1F update", exc_info=True)
+
+
+def _check_export_auth(authorization: Optional[str]) -> None:
+    if settings.export_token is None:
+        raise HTTPException(status_code=403, detail="Export is disabled")
+
+    expected = f"Bearer {settings.export_token.get_secret_value()}"
+    if not authorization or not hmac.compare_digest(authorization, expected):
+        raise HTTPException(status_code=401, detail="Unauthorized")
+
+
+@app.get("/api/v1/ka-bot/export/{table}")
+async def export_table(
+    table: Literal["requests", "audit"],
+    format: Literal["csv", "jsonl"] = "csv",
+    date_from: Optional[date] = None,
+    date_to: Optional[date] = None,  # включительно
+    status: Optional[str] = None,  # requests.status / audit_log.action
+    authorization: Optional[str] = Header(default=None),
+):
+    _check_export_auth(authorization)
+
+    stream = iter_export(
+        table,
+        format,
+        date_from=datetime.combine(date_from, datetime.min.time()) if date_from else None,
+        date_to=datetime.combine(date_to + timedelta(days=1), datetime.min.time()) if date_to else None,
+        status=status,
+    )
+    media_type = "text/csv" if format == "csv" else "application/x-ndjson"
+    filename = f"{table}.{format}"
+
+    return StreamingResponse(
+        stream,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+
+@app.get("/api/v1/ka-bot/requests/search")
+async def search_requests_api(
+    q: str,
+    limit: int = Query(default=20, ge=1, le=100),
+    before_id: Optional[int] = None,  # курсор: id последней строки предыдущей страницы
+    authorization: Optional[str] = Header(default=None),
+):
+    _check_export_auth(authorization)
+
+    async with read_session() as session:
+        found = await search_requests(session, q, limit=limit, before_id=before_id)
+
+    return {
+        "items": [
+            {
+                "request_id": r.external_id,
+                "status": r.status,
+                "full_name": r.user_full_name,
+                "phone": r.user_phone,
+                "car_brand": r.car_brand,
+                "car_model": r.car_model,
+                "created_at": r.created_at.isoformat() if r.created_at else None,
+            }
+            for r in found
+        ],
+        "next_before_id": found[-1].id if len(found) == limit else None,
+    }
+
+
+@app.get("/api/v1/ka-bot/reports/time-in-status")
+async def time_in_status_report(
+    date_from: Optional[date] = None,  # по умолчанию — последние 7 дней
+    date_to: Optional[date] = None,  # включительно
+    executor_tg_id: Optional[int] = None,
+    authorization: Optional[str] = Header(default=None),
+):
+    _check_export_auth(authorization)
+
+    date_to = date_to or date.today()
+    date_from = date_from or date_to - timedelta(days=6)
+    return await build_report(date_from, date_to, executor_tg_id)
+
+
+def _not_modified(etag: str, if_none_match: Optional[str]) -> bool:
+    """
+    304 — только по If-None-Match: ETag — хэш всего тела, в т.ч. набора id и not_found.
+    If-Modified-Since не учитываем: дата не знает, для какого набора id её получили.
+    """
+    if if_none_match is None:
+        return False
+    return etag in (tag.strip().removeprefix("W/") for tag in if_none_match.split(","))
+
+
+@app.post("/api/v1/ka-bot/requests:status")
+async def requests_status(
+    payload: StatusLookupIn,
+    authorization: Optional[str] = Header(default=None),
+    if_none_match: Optional[str] = Header(default=None),
+):
+    """
+    Где сейчас заявки 1F (сверка при потерянных callback-ах). Чтение — только из
+    покрывающего индекса, по IN-запросу на пачку id. ETag — хэш тела ответа:
+    повторный опрос с If-None-Match без изменений — 304 без тела. Last-Modified
+    (самый свежий updated_at) — справочно.
+    """
+    _check_export_auth(authorization)
+
+    external_ids = sorted(set(payload.ids))
+    async with read_session() as session:
+        rows = await get_statuses(session, external_ids)
+    rows.sort(key=lambda r: r.external_id)
+
+    found = {r.external_id for r in rows}
+    raw = orjson.dumps({
+        "items": [
+            {
+                "request_id": r.external_id,
+                "status": r.status,
+                "decided_at": r.decided_at,
+                "sent_to_1f": r.is_sent_to_1f,
+                "updated_at": r.updated_at,
+            }
+            for r in rows
+        ],
+        "not_found": [i for i in external_ids if i not in found],
+    })
+
+    headers = {"ETag": f'"{hashlib.blake2b(raw, digest_size=16).hexdigest()}"', "Cache-Control": "no-cache"}
+    # updated_at хранится в локальном времени сервера
+    last_modified = max((r.updated_at for r in rows if r.updated_at), default=None)
+    if last_modified is not None:
+        last_modified = last_modified.astimezone(timezone.utc)
+        headers["Last-Modified"] = format_datetime(last_modified, usegmt=True)
+
+    if _not_modified(headers["ETag"], if_none_match):
+        return Response(status_code=304, headers=headers)
+    return Response(raw, media_type="application/json", headers=headers)
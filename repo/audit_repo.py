@@ -1,4 +1,7 @@
 import json
+from collections.abc import AsyncIterator
+from datetime import datetime
+from sqlalchemy import Row, insert, select
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import AuditLog
 
@@ -20,3 +23,50 @@ async def add_audit_log(
     )
     session.add(row)
     await session.commit()
+
+
+async def add_audit_logs(session: AsyncSession, entries: list[dict], *, commit: bool = True) -> None:
+    """
+    Пачка записей одним executemany. entries — dict с ключами add_audit_log.
+    commit=False — в транзакции вызывающего.
+    """
+    if entries:
+        await session.execute(
+            insert(AuditLog),
+            [
+                {
+                    "action": e["action"],
+                    "entity": e["entity"],
+                    "entity_id": str(e["entity_id"]),
+                    "actor_tg_id": e.get("actor_tg_id"),
+                    "payload_json": json.dumps(e["payload"], ensure_ascii=False) if e.get("payload") is not None else None,
+                }
+                for e in entries
+            ],
+        )
+    if commit:
+        await session.commit()
+
+
+async def stream_audit_log(
+    session: AsyncSession,
+    *,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    action: str | None = None,
+    yield_per: int = 1000,
+) -> AsyncIterator[Row]:
+    """
+    Потоковое чтение audit_log (server-side cursor). date_to — не включительно.
+    """
+    stmt = select(AuditLog.__table__).order_by(AuditLog.id.asc())
+    if date_from is not None:
+        stmt = stmt.where(AuditLog.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(AuditLog.created_at < date_to)
+    if action:
+        stmt = stmt.where(AuditLog.action == action)
+
+    result = await session.stream(stmt.execution_options(yield_per=yield_per))
+    async for row in result:
+        yield row
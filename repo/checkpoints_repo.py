@@ -0,0 +1,18 @@
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import JobCheckpoint
+
+
+async def get_checkpoint(session: AsyncSession, name: str) -> int:
+    row = await session.get(JobCheckpoint, name)
+    return int(row.value) if row is not None else 0
+
+
+async def set_checkpoint(session: AsyncSession, name: str, value: int, *, commit: bool = True) -> None:
+    """commit=False — в транзакции вызывающего (вместе с результатом обработанной пачки)."""
+    row = await session.get(JobCheckpoint, name)
+    if row is None:
+        session.add(JobCheckpoint(name=name, value=value))
+    else:
+        row.value = value
+    if commit:
+        await session.commit()
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import json
+from datetime import datetime
+from enum import IntEnum
+from typing import Any
+
+from sqlalchemy import Row, exists, insert, select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import Request, RequestEvent
+
+
+class EventType(IntEnum):
+    """Код события в request_events.type (значения не менять — они в БД)."""
+    SNAPSHOT = 1               # полный срез строки (backfill заявок, созданных до журнала)
+    CREATED = 2
+    PUBLISHED = 3              # опубликована в группе (mark_group_sent)
+    PUBLISH_FAILED = 4
+    MESSAGE_LINKED = 5         # set_group_message_id
+    GROUP_DELIVERED = 6        # mark_sent_to_group
+    GROUP_DELIVERY_FAILED = 7  # mark_send_failed
+    ACCEPTED = 10
+    DECLINED = 11
+    IN_PROGRESS = 12
+    DECIDED = 13
+    RELEASED = 14              # снятие с отключённого исполнителя
+    REASSIGNED = 15
+    UPDATED = 16               # повтор 1F с изменённым контентом (data — новые значения колонок)
+    ONEF_SENT = 20
+    ONEF_FAILED = 21
+    PII_SCRUBBED = 30
+
+
+# Колонки requests, которые выводятся из событий (id, updated_at, callback_attempts
+# и производный content_hash — нет)
+PROJECTED_COLUMNS = tuple(
+    c.name for c in Request.__table__.columns
+    if c.name not in ("id", "updated_at", "callback_attempts", "content_hash")
+)
+_DATETIME_COLUMNS = {"created_at", "assigned_at", "decided_at"}
+
+# Начальное состояние перед CREATED / SNAPSHOT
+_INITIAL = {
+    "status": "NEW",
+    "group_chat_id": None,
+    "group_message_id": None,
+    "assigned_to_tg_id": None,
+    "assigned_to_username": None,
+    "assigned_at": None,
+    "is_sent_to_group": False,
+    "last_group_error": None,
+    "is_sent_to_1f": False,
+    "last_1f_error": None,
+    "decided_at": None,
+    "decision_comment": None,
+}
+
+_UNASSIGN = {"status": "NEW", "assigned_to_tg_id": None, "assigned_to_username": None, "assigned_at": None}
+
+# Постоянная часть SET каждого события. Те же словари подставляются в UPDATE
+# repo/requests_repo.py — живая запись и пересборка не расходятся. Переменные
+# колонки события лежат в его data, время события — в EVENT_TIME_COLUMN.
+EVENT_SETS: dict[EventType, dict[str, Any]] = {
+    EventType.SNAPSHOT: {},
+    EventType.CREATED: {},
+    EventType.PUBLISHED: {"status": "NEW", "is_sent_to_group": True, "last_group_error": None},
+    EventType.PUBLISH_FAILED: {"status": "ERROR_GROUP", "is_sent_to_group": False},
+    EventType.MESSAGE_LINKED: {},
+    EventType.GROUP_DELIVERED: {"is_sent_to_group": True, "last_group_error": None},
+    EventType.GROUP_DELIVERY_FAILED: {"is_sent_to_group": False},
+    EventType.ACCEPTED: {"status": "ASSIGNED"},
+    EventType.DECLINED: _UNASSIGN,
+    EventType.IN_PROGRESS: {"status": "IN_PROGRESS"},
+    EventType.DECIDED: {"is_sent_to_1f": False, "last_1f_error": None},
+    EventType.RELEASED: _UNASSIGN,
+    EventType.REASSIGNED: {},
+    EventType.UPDATED: {},
+    EventType.ONEF_SENT: {"is_sent_to_1f": True, "last_1f_error": None},
+    EventType.ONEF_FAILED: {"status": "ERROR_ONEF", "is_sent_to_1f": False},
+    EventType.PII_SCRUBBED: {"user_phone": "", "user_phone_norm": None, "decision_comment": None},
+}
+
+EVENT_TIME_COLUMN = {
+    EventType.CREATED: "created_at",
+    EventType.ACCEPTED: "assigned_at",
+    EventType.REASSIGNED: "assigned_at",
+    EventType.DECIDED: "decided_at",
+}
+
+# поля data с персональными данными — их затирает retention
+PII_DATA_KEYS = {"user_phone": "", "user_phone_norm": None, "decision_comment": None}
+
+# Core-insert по таблице: без ORM bulk-пути, на переход — один дешёвый INSERT
+_INSERT_EVENT = insert(RequestEvent.__table__)
+
+
+def _dumps(data: dict[str, Any] | None) -> str | None:
+    if not data:
+        return None
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"), default=str)
+
+
+def event_row(
+    external_id: int,
+    type_: EventType,
+    data: dict[str, Any] | None = None,
+    *,
+    actor_tg_id: int | None = None,
+    at: datetime | None = None,
+) -> dict[str, Any]:
+    return {
+        "external_id": external_id,
+        "type": int(type_),
+        "actor_tg_id": actor_tg_id,
+        "data": _dumps(data),
+        "created_at": at or datetime.now(),
+    }
+
+
+async def append_event(
+    session: AsyncSession,
+    external_id: int,
+    type_: EventType,
+    data: dict[str, Any] | None = None,
+    *,
+    actor_tg_id: int | None = None,
+    at: datetime | None = None,
+) -> None:
+    """Событие в транзакции вызывающего (без commit)."""
+    await session.execute(_INSERT_EVENT, event_row(external_id, type_, data, actor_tg_id=actor_tg_id, at=at))
+
+
+async def append_events(session: AsyncSession, rows: list[dict[str, Any]]) -> None:
+    """Пачка event_row одним executemany (без commit)."""
+    if rows:
+        await session.execute(_INSERT_EVENT, rows)
+
+
+def apply_event(state: dict[str, Any] | None, type_: int, data: dict[str, Any] | None, at: datetime) -> dict[str, Any]:
+    """Проекция: состояние строки requests после события."""
+    event_type = EventType(type_)
+    if event_type in (EventType.CREATED, EventType.SNAPSHOT):
+        state = dict(_INITIAL)
+    elif state is None:
+        raise ValueError(f"{event_type.name} before CREATED")
+
+    state.update(EVENT_SETS[event_type])
+    if data:
+        for key, value in data.items():
+            if key in _DATETIME_COLUMNS and isinstance(value, str):
+                value = datetime.fromisoformat(value)
+            state[key] = value
+    time_column = EVENT_TIME_COLUMN.get(event_type)
+    if time_column is not None:
+        state[time_column] = at
+    state["updated_at"] = at
+    return state
+
+
+# ---------------------- projector ----------------------
+
+async def get_event_batch(session: AsyncSession, after_external_id: int, limit_ids: int) -> list[Row]:
+    """События следующих limit_ids заявок (по external_id), по порядку внутри заявки."""
+    ids = (
+        select(RequestEvent.external_id)
+        .where(RequestEvent.external_id > after_external_id)
+        .group_by(RequestEvent.external_id)
+        .order_by(RequestEvent.external_id.asc())
+        .limit(limit_ids)
+        .scalar_subquery()
+    )
+    res = await session.execute(
+        select(RequestEvent.external_id, RequestEvent.type, RequestEvent.data, RequestEvent.created_at)
+        .where(RequestEvent.external_id.in_(ids))
+        .order_by(RequestEvent.external_id.asc(), RequestEvent.id.asc())
+    )
+    return list(res.all())
+
+
+async def get_projection_rows(session: AsyncSession, external_ids: list[int]) -> dict[int, dict[str, Any]]:
+    """Текущие строки requests: external_id -> {id, колонки проекции}."""
+    columns = [Request.id] + [getattr(Request, c) for c in PROJECTED_COLUMNS]
+    res = await session.execute(select(*columns).where(Request.external_id.in_(external_ids)))
+    return {row.external_id: row._asdict() for row in res}
+
+
+async def write_projection(
+    session: AsyncSession,
+    updates: list[dict[str, Any]],
+    inserts: list[dict[str, Any]],
+) -> None:
+    """updates — с ключом id (bulk UPDATE по PK), inserts — новые строки. Без commit."""
+    if updates:
+        await session.execute(update(Request).execution_options(synchronize_session=False), updates)
+    if inserts:
+        await session.execute(insert(Request), inserts)
+
+
+async def get_requests_without_events(session: AsyncSession, after_id: int, limit: int) -> list[Row]:
+    """Заявки, у которых ещё нет ни одного события (созданы до журнала)."""
+    res = await session.execute(
+        select(Request.id, Request.updated_at, *(getattr(Request, c) for c in PROJECTED_COLUMNS))
+        .where(
+            Request.id > after_id,
+            ~exists().where(RequestEvent.external_id == Request.external_id),
+        )
+        .order_by(Request.id.asc())
+        .limit(limit)
+    )
+    return list(res.all())
+
+
+async def redact_pii(session: AsyncSession, external_ids: list[int]) -> None:
+    """
+    Retention: затирает персональные данные в data событий заявок (без commit).
+    Единственная правка журнала на месте — иначе retention бессмысленна.
+    """
+    res = await session.execute(
+        select(RequestEvent.id, RequestEvent.data)
+        .where(RequestEvent.external_id.in_(external_ids), RequestEvent.data.is_not(None))
+    )
+    changed = []
+    for event_id, raw in res:
+        data = json.loads(raw)
+        if PII_DATA_KEYS.keys() & data.keys():
+            data.update({k: v for k, v in PII_DATA_KEYS.items() if k in data})
+            changed.append({"id": event_id, "data": _dumps(data)})
+    if changed:
+        await session.execute(update(RequestEvent).execution_options(synchronize_session=False), changed)
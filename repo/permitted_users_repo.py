@@ -1,27 +1,50 @@
-from sqlalchemy import select, update
+from sqlalchemy import or_, select, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from models import PermittedUser
 from datetime import datetime
 from config import settings
 
-async def is_user_permitted(session: AsyncSession, tg_id: int) -> bool:
+async def is_user_permitted(session: AsyncSession, tg_id: int, group_chat_id: int | None = None) -> bool:
+    """
+    group_chat_id — группа, где нажали Accept: пользователь должен быть
+    разрешён в ней или во всех группах (group_chat_id IS NULL).
+    """
     if tg_id in settings.admin_id_list():
         return True
-    
-    res = await session.execute(
-        select(PermittedUser).where(
-            PermittedUser.tg_id == tg_id, 
-            PermittedUser.is_active == True
-        )
+
+    stmt = select(PermittedUser).where(
+        PermittedUser.tg_id == tg_id,
+        PermittedUser.is_active == True
     )
+    if group_chat_id is not None:
+        stmt = stmt.where(
+            or_(PermittedUser.group_chat_id.is_(None), PermittedUser.group_chat_id == group_chat_id)
+        )
+
+    res = await session.execute(stmt)
     return res.scalar_one_or_none() is not None
 
 
+async def get_permitted_group(session: AsyncSession, tg_id: int) -> tuple[bool, int | None]:
+    """(активен ли пользователь, его группа КА; None — все группы). Админы — во всех группах."""
+    if tg_id in settings.admin_id_list():
+        return True, None
+
+    res = await session.execute(
+        select(PermittedUser.group_chat_id).where(PermittedUser.tg_id == tg_id, PermittedUser.is_active == True)
+    )
+    row = res.first()
+    if row is None:
+        return False, None
+    return True, row.group_chat_id
+
+
 async def upsert_permitted_user(
     session: AsyncSession,
     tg_id: int,
     username: str | None,
     added_by_tg_id: int | None,
+    group_chat_id: int | None = None,
 ) -> None:
     res = await session.execute(select(PermittedUser).where(PermittedUser.tg_id == tg_id))
     user = res.scalar_one_or_none()
@@ -32,6 +55,7 @@ async def upsert_permitted_user(
                 tg_id=tg_id,
                 username=username,
                 is_active=True,
+                group_chat_id=group_chat_id,
                 added_by_tg_id=added_by_tg_id,
                 created_at=datetime.now(),
             )
@@ -39,6 +63,7 @@ async def upsert_permitted_user(
     else:
         user.username = username
         user.is_active = True
+        user.group_chat_id = group_chat_id
         user.added_by_tg_id = added_by_tg_id
 
     await session.commit()
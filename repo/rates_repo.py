@@ -0,0 +1,17 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import CurrencyRate
+
+
+async def get_rate_table(session: AsyncSession) -> dict[str, float]:
+    res = await session.execute(select(CurrencyRate.currency, CurrencyRate.rate_to_base))
+    return {currency.upper(): float(rate) for currency, rate in res.all()}
+
+
+async def upsert_rate(session: AsyncSession, currency: str, rate_to_base: float) -> None:
+    row = await session.get(CurrencyRate, currency.upper())
+    if row is None:
+        session.add(CurrencyRate(currency=currency.upper(), rate_to_base=rate_to_base))
+    else:
+        row.rate_to_base = rate_to_base
+    await session.commit()
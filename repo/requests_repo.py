@@ -1,59 +1,399 @@
 from __future__ import annotations
 
+import hashlib
+import json
+from collections.abc import AsyncIterator, Callable
 from datetime import datetime
+from typing import Any, NamedTuple
 
-from sqlalchemy import select, update
+from sqlalchemy import Row, bindparam, func, select, text, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 from sqlalchemy.ext.asyncio import AsyncSession
 
-from models import Request
+from config import settings
+from models import AuditLog, Request, RequestEvent, car_dict, normalize_phone
+from repo.audit_repo import add_audit_logs
+from repo.events_repo import EVENT_SETS, EventType, append_event, append_events, event_row
+from services.lru_cache import LruCache
+
+
+class RequestSnapshot(NamedTuple):
+    """
+    Неизменяемый срез заявки для хендлеров: проекция колонок вместо ORM-сущности.
+    Имена полей совпадают с Request — код, читающий атрибуты, работает с обоими.
+    """
+    id: int
+    external_id: int
+    status: str
+    user_full_name: str
+    user_phone: str
+    car_brand: str
+    car_model: str
+    car_year: int
+    car_color: str
+    car_motor: str
+    car_price: str
+    car_currency: str
+    group_chat_id: int | None
+    group_message_id: int | None
+    assigned_to_tg_id: int | None
+    assigned_to_username: str | None
+    assigned_at: datetime | None
+    created_at: datetime
+    decided_at: datetime | None
+
+    @property
+    def car(self) -> dict:
+        return car_dict(self)
+
+
+# external_id -> RequestSnapshot. Write-through: переходы статусов кладут свежий срез,
+# остальные записи этого модуля удаляют ключ. ttl страхует от записей другого процесса
+# (main.py + uvicorn раздельно); проверки по срезу — подсказка, истина — условный UPDATE.
+request_snapshots = LruCache(maxsize=5_000, ttl_seconds=60)
+
+
+# ---------------------- prebuilt hot statements ----------------------
+# Собираются один раз при импорте: на вызов не строится конструкция и не
+# считается её cache key. Значения — через bindparam (p_*, чтобы не пересекаться
+# с именами колонок в SET). synchronize_session=False: сессии короткие,
+# состояние после UPDATE всё равно перечитывается.
+_NO_SYNC = {"synchronize_session": False}
+
+# populate_existing: после UPDATE без синхронизации объект в сессии перечитывается из строки
+_SELECT_BY_EXTERNAL_ID = (
+    select(Request)
+    .where(Request.external_id == bindparam("p_external_id"))
+    .execution_options(populate_existing=True)
+)
+
+_SELECT_SNAPSHOT = select(*(getattr(Request, f) for f in RequestSnapshot._fields)).where(
+    Request.external_id == bindparam("p_external_id")
+)
+
+# колонки ix_requests_status_lookup — запрос не ходит в таблицу
+_STATUS_COLUMNS = (Request.external_id, Request.status, Request.decided_at, Request.is_sent_to_1f, Request.updated_at)
+_SELECT_STATUSES = select(*_STATUS_COLUMNS).where(
+    Request.external_id.in_(bindparam("p_external_ids", expanding=True))
+)
+# SQLite без ANALYZE берёт уникальный ix_requests_external_id и читает строки таблицы
+_SELECT_STATUSES_SQLITE = (
+    text(
+        "SELECT external_id, status, decided_at, is_sent_to_1f, updated_at "
+        "FROM requests INDEXED BY ix_requests_status_lookup WHERE external_id IN :p_external_ids"
+    )
+    .bindparams(bindparam("p_external_ids", expanding=True))
+    .columns(*_STATUS_COLUMNS)
+)
+
+# id на один IN: держимся ниже лимитов параметров SQLite / asyncpg
+STATUS_LOOKUP_CHUNK = 1000
+
+_ACCEPT = (
+    update(Request)
+    .where(Request.external_id == bindparam("p_external_id"), Request.status == "NEW")
+    .values(
+        **EVENT_SETS[EventType.ACCEPTED],
+        assigned_to_tg_id=bindparam("p_executor_tg_id"),
+        assigned_to_username=bindparam("p_executor_username"),
+        assigned_at=bindparam("p_now"),
+    )
+    .execution_options(**_NO_SYNC)
+)
+
+_DECLINE_ASSIGNED = (
+    update(Request)
+    .where(
+        Request.external_id == bindparam("p_external_id"),
+        Request.status == "ASSIGNED",
+        Request.assigned_to_tg_id == bindparam("p_executor_tg_id"),
+    )
+    .values(**EVENT_SETS[EventType.DECLINED])
+    .execution_options(**_NO_SYNC)
+)
+
+_MARK_IN_PROGRESS = (
+    update(Request)
+    .where(
+        Request.external_id == bindparam("p_external_id"),
+        Request.status == "ASSIGNED",
+        Request.assigned_to_tg_id == bindparam("p_executor_tg_id"),
+    )
+    .values(**EVENT_SETS[EventType.IN_PROGRESS])
+    .execution_options(**_NO_SYNC)
+)
+
+_MARK_DECISION = (
+    update(Request)
+    .where(
+        Request.external_id == bindparam("p_external_id"),
+        Request.status == "IN_PROGRESS",
+        Request.assigned_to_tg_id == bindparam("p_executor_tg_id"),
+    )
+    .values(
+        **EVENT_SETS[EventType.DECIDED],
+        status=bindparam("p_decision_status"),
+        decided_at=bindparam("p_now"),
+        decision_comment=bindparam("p_comment"),
+    )
+    .execution_options(**_NO_SYNC)
+)
+
+
+# Снятие / передача всех заявок исполнителя set-based UPDATE ... RETURNING (срез после).
+# Статус до изменения RETURNING не отдаёт (SQLite не пускает FROM-таблицы в RETURNING),
+# поэтому снятие идёт отдельным UPDATE на каждый исходный статус.
+ACTIVE_STATUSES = ("ASSIGNED", "IN_PROGRESS")
+
+_SNAPSHOT_COLUMNS = tuple(getattr(Request, f) for f in RequestSnapshot._fields)
+
+_RELEASE_EXECUTOR = (
+    update(Request)
+    .where(Request.assigned_to_tg_id == bindparam("p_from_tg_id"), Request.status == bindparam("p_status"))
+    .values(**EVENT_SETS[EventType.RELEASED])
+    .returning(*_SNAPSHOT_COLUMNS)
+    .execution_options(**_NO_SYNC)
+)
+
+_REASSIGN_EXECUTOR = (
+    update(Request)
+    .where(Request.assigned_to_tg_id == bindparam("p_from_tg_id"), Request.status.in_(ACTIVE_STATUSES))
+    .values(
+        **EVENT_SETS[EventType.REASSIGNED],
+        assigned_to_tg_id=bindparam("p_to_tg_id"),
+        assigned_to_username=bindparam("p_to_username"),
+        assigned_at=bindparam("p_now"),
+    )
+    .returning(*_SNAPSHOT_COLUMNS)
+    .execution_options(**_NO_SYNC)
+)
+# новый исполнитель разрешён только в одной группе КА (NULL в заявке — группа по умолчанию)
+_REASSIGN_EXECUTOR_IN_GROUP = _REASSIGN_EXECUTOR.where(
+    func.coalesce(Request.group_chat_id, bindparam("p_default_chat_id")) == bindparam("p_group_chat_id")
+)
+
+_COUNT_EXECUTOR_ACTIVE = select(func.count()).where(
+    Request.assigned_to_tg_id == bindparam("p_tg_id"), Request.status.in_(ACTIVE_STATUSES)
+)
+
+
+def _backlog_order(by_value: bool) -> tuple:
+    # by_value: дорогие заявки первыми (индекс ix_requests_status_price_base)
+    if by_value:
+        return Request.car_price_base.desc().nulls_last(), Request.created_at.asc()
+    return (Request.created_at.asc(),)
+
+
+# скан очередей ошибок: (by_value) -> statement; статус и limit — параметры
+_SELECT_BY_STATUS = {
+    by_value: select(Request)
+    .where(Request.status == bindparam("p_status"))
+    .order_by(*_backlog_order(by_value))
+    .limit(bindparam("p_limit"))
+    for by_value in (False, True)
+}
+
+
+async def _select_by_status(session: AsyncSession, status: str, limit: int, by_value: bool) -> list[Request]:
+    res = await session.execute(_SELECT_BY_STATUS[by_value], {"p_status": status, "p_limit": limit})
+    return list(res.scalars().all())
 
 
 async def get_by_external_id(session: AsyncSession, external_id: int) -> Request | None:
-    res = await session.execute(select(Request).where(Request.external_id == external_id))
+    res = await session.execute(_SELECT_BY_EXTERNAL_ID, {"p_external_id": external_id})
     return res.scalar_one_or_none()
 
 
+async def _load_snapshot(session: AsyncSession, external_id: int) -> RequestSnapshot | None:
+    row = (await session.execute(_SELECT_SNAPSHOT, {"p_external_id": external_id})).first()
+    if row is None:
+        request_snapshots.pop(external_id)
+        return None
+    snapshot = RequestSnapshot(*row)
+    request_snapshots.set(external_id, snapshot)
+    return snapshot
+
+
+async def get_request_snapshot(session: AsyncSession, external_id: int) -> RequestSnapshot | None:
+    """Срез из кэша; при промахе — одна проекция из БД."""
+    snapshot = request_snapshots.get(external_id)
+    if snapshot is None:
+        snapshot = await _load_snapshot(session, external_id)
+    return snapshot
+
+
+async def get_statuses(session: AsyncSession, external_ids: list[int]) -> list[Row]:
+    """Статусы заявок для сверки 1F: по одному IN-запросу на STATUS_LOOKUP_CHUNK id."""
+    stmt = _SELECT_STATUSES_SQLITE if session.get_bind().dialect.name == "sqlite" else _SELECT_STATUSES
+    rows: list[Row] = []
+    for i in range(0, len(external_ids), STATUS_LOOKUP_CHUNK):
+        chunk = external_ids[i:i + STATUS_LOOKUP_CHUNK]
+        rows.extend((await session.execute(stmt, {"p_external_ids": chunk})).all())
+    return rows
+
+
+def request_content(user_full_name: str, user_phone: str, car: dict) -> dict[str, Any]:
+    """Нормализованный контент заявки из payload 1F — колонки requests (без производных)."""
+    return dict(
+        user_full_name=user_full_name,
+        user_phone=user_phone,
+        car_brand=car.get("Brand", ""),
+        car_model=car.get("Model", ""),
+        car_year=int(car.get("Year", 0) or 0),
+        car_color=car.get("Color", ""),
+        car_motor=car.get("Motor", ""),
+        car_price=str(car.get("Price", "")),
+        car_currency=str(car.get("Currency", "")),
+    )
+
+
+def content_fingerprint(content: dict[str, Any]) -> str:
+    """Отпечаток request_content (requests.content_hash)."""
+    raw = json.dumps(content, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.blake2b(raw.encode(), digest_size=16).hexdigest()
+
+
 async def create_if_not_exists(
     session: AsyncSession,
     external_id: int,
     user_full_name: str,
     user_phone: str,
     car: dict,
+    car_price_value: float | None = None,
+    car_price_base: float | None = None,
+    *,
+    fingerprint: str | None = None,
 ) -> tuple[Request, bool]:
     """
     Возвращает (request, created_flag)
     created_flag=True если создали, False если уже была (идемпотентность).
-    """
-    existing = await get_by_external_id(session, external_id)
-    if existing:
-        return existing, False
 
-    req = Request(
+    Один INSERT ... ON CONFLICT (external_id) DO NOTHING RETURNING:
+    при параллельных дублях от 1F ровно один вызов получит created=True
+    (и только он пишет событие CREATED в той же транзакции).
+    fingerprint — content_fingerprint, если вызывающий уже посчитал.
+    """
+    now = datetime.now()
+    content = request_content(user_full_name, user_phone, car)
+    data = dict(
+        content,
+        user_phone_norm=normalize_phone(user_phone),
+        car_price_value=car_price_value,
+        car_price_base=car_price_base,
+    )
+    values = dict(
         external_id=external_id,
         status="NEW",
-        user_full_name=user_full_name,
-        user_phone=user_phone,
-        car_brand=car.get("Brand", ""),
-        car_model=car.get("Model", ""),
-        car_year=int(car.get("Year", 0) or 0),
-        car_color=car.get("Color", ""),
-        car_motor=car.get("Motor", ""),
-        car_price=str(car.get("Price", "")),
-        car_currency=str(car.get("Currency", "")),
+        created_at=now,
+        content_hash=fingerprint or content_fingerprint(content),
+        **data,
     )
-    session.add(req)
+
+    dialect = session.get_bind().dialect.name
+    if dialect == "postgresql":
+        stmt = pg_insert(Request).values(**values)
+    elif dialect == "sqlite":
+        stmt = sqlite_insert(Request).values(**values)
+    else:
+        raise RuntimeError(f"create_if_not_exists: unsupported dialect {dialect}")
+
+    stmt = stmt.on_conflict_do_nothing(index_elements=[Request.external_id]).returning(Request)
+    created = (await session.execute(stmt)).scalar_one_or_none()
+    if created is not None:
+        await append_event(session, external_id, EventType.CREATED, data, at=now)
     await session.commit()
-    await session.refresh(req)
-    return req, True
+    request_snapshots.pop(external_id)
 
+    if created is not None:
+        return created, True
 
-async def set_group_message_id(session: AsyncSession, external_id: int, message_id: int) -> None:
-    await session.execute(
+    existing = await get_by_external_id(session, external_id)
+    return existing, False
+
+
+async def update_content_if_changed(
+    session: AsyncSession,
+    req: Request,
+    user_full_name: str,
+    user_phone: str,
+    car: dict,
+    car_price_value: float | None = None,
+    car_price_base: float | None = None,
+    *,
+    fingerprint: str | None = None,
+) -> dict[str, tuple[Any, Any]]:
+    """
+    Повтор заявки от 1F: если контент изменился — правка строки на месте, событие UPDATED
+    и дифф в audit_log одной транзакцией. Возвращает {колонка: (было, стало)};
+    {} — контент тот же (без записи) или строку уже поправил параллельный повтор
+    (тогда req перечитан из БД). req обновляется на месте (synchronize_session).
+    """
+    content = request_content(user_full_name, user_phone, car)
+    fingerprint = fingerprint or content_fingerprint(content)
+    if req.content_hash == fingerprint:
+        return {}
+
+    # отпечатка нет (заявка старше колонки) или он другой — сравниваем колонки
+    changes = {c: (getattr(req, c), v) for c, v in content.items() if getattr(req, c) != v}
+    if not changes:
+        return {}
+
+    values: dict[str, Any] = {c: new for c, (_, new) in changes.items()}
+    if "user_phone" in changes:
+        values["user_phone_norm"] = normalize_phone(user_phone)
+    if changes.keys() & {"car_price", "car_currency"}:
+        values.update(car_price_value=car_price_value, car_price_base=car_price_base)
+
+    result = await session.execute(
+        update(Request)
+        .where(
+            Request.external_id == req.external_id,
+            Request.content_hash.is_not_distinct_from(req.content_hash),
+        )
+        .values(content_hash=fingerprint, **values)
+    )
+    if (result.rowcount or 0) != 1:
+        # rollback экспайрит req — перечитываем, чтобы вызывающий не трогал истёкший объект
+        await session.rollback()
+        await session.refresh(req)
+        return {}
+
+    await append_event(session, req.external_id, EventType.UPDATED, values)
+    await add_audit_logs(session, [dict(
+        action="UPDATE_FROM_1F",
+        entity="request",
+        entity_id=str(req.external_id),
+        actor_tg_id=None,
+        payload={"changes": {c: [old, new] for c, (old, new) in changes.items()}},
+    )], commit=False)
+    await session.commit()
+    request_snapshots.pop(req.external_id)
+    return changes
+
+
+async def _update_with_event(
+    session: AsyncSession,
+    external_id: int,
+    event_type: EventType,
+    data: dict | None = None,
+) -> bool:
+    """Безусловный UPDATE по external_id (SET = EVENT_SETS + data) и событие в той же транзакции."""
+    result = await session.execute(
         update(Request)
         .where(Request.external_id == external_id)
-        .values(group_message_id=message_id)
+        .values(**EVENT_SETS[event_type], **(data or {}))
     )
+    changed = (result.rowcount or 0) == 1
+    if changed:
+        await append_event(session, external_id, event_type, data)
     await session.commit()
+    request_snapshots.pop(external_id)
+    return changed
+
+
+async def set_group_message_id(session: AsyncSession, external_id: int, message_id: int) -> None:
+    await _update_with_event(session, external_id, EventType.MESSAGE_LINKED, {"group_message_id": message_id})
 
 
 async def try_accept_request(
@@ -61,184 +401,158 @@ async def try_accept_request(
     external_id: int,
     executor_tg_id: int,
     executor_username: str | None,
-) -> tuple[bool, Request | None]:
+) -> tuple[bool, RequestSnapshot | None]:
     """
     Атомарный accept:
     - срабатывает только если status == NEW
-    - возвращает (accepted, request)
+    - возвращает (accepted, срез заявки после операции)
     """
     now = datetime.now()
     result = await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id, Request.status == "NEW")
-        .values(
-            status="ASSIGNED",
-            assigned_to_tg_id=executor_tg_id,
-            assigned_to_username=executor_username,
-            assigned_at=now,
-        )
+        _ACCEPT,
+        {
+            "p_external_id": external_id,
+            "p_executor_tg_id": executor_tg_id,
+            "p_executor_username": executor_username,
+            "p_now": now,
+        },
     )
+    accepted = (result.rowcount or 0) == 1
+    if accepted:
+        await append_event(
+            session,
+            external_id,
+            EventType.ACCEPTED,
+            {"assigned_to_tg_id": executor_tg_id, "assigned_to_username": executor_username},
+            actor_tg_id=executor_tg_id,
+            at=now,
+        )
     await session.commit()
 
-    accepted = (result.rowcount or 0) == 1
-    req = await get_by_external_id(session, external_id)
-    return accepted, req
+    return accepted, await _load_snapshot(session, external_id)
 
 
-async def try_decline_request(session: AsyncSession, external_id: int, executor_tg_id: int) -> tuple[bool, Request | None]:
+async def try_decline_request(session: AsyncSession, external_id: int, executor_tg_id: int) -> tuple[bool, RequestSnapshot | None]:
     """
     Сброс заявки обратно в NEW.
     Разрешаем decline только тому, кто сейчас назначен.
     """
     result = await session.execute(
-        update(Request)
-        .where(
-            Request.external_id == external_id,
-            Request.status == "ASSIGNED",
-            Request.assigned_to_tg_id == executor_tg_id,
-        )
-        .values(
-            status="NEW",
-            assigned_to_tg_id=None,
-            assigned_to_username=None,
-            assigned_at=None,
-        )
+        _DECLINE_ASSIGNED, {"p_external_id": external_id, "p_executor_tg_id": executor_tg_id}
     )
+    changed = (result.rowcount or 0) == 1
+    if changed:
+        await append_event(session, external_id, EventType.DECLINED, actor_tg_id=executor_tg_id)
     await session.commit()
 
-    changed = (result.rowcount or 0) == 1
-    req = await get_by_external_id(session, external_id)
-    return changed, req
+    return changed, await _load_snapshot(session, external_id)
 
 
-async def try_mark_in_progress(session: AsyncSession, external_id: int, executor_tg_id: int) -> tuple[bool, Request | None]:
+async def try_mark_in_progress(session: AsyncSession, external_id: int, executor_tg_id: int) -> tuple[bool, RequestSnapshot | None]:
     """
     Текущий внутренний шаг (не из ТЗ): перевод ASSIGNED -> IN_PROGRESS.
     """
     result = await session.execute(
-        update(Request)
-        .where(
-            Request.external_id == external_id,
-            Request.status == "ASSIGNED",
-            Request.assigned_to_tg_id == executor_tg_id,
-        )
-        .values(status="IN_PROGRESS")
+        _MARK_IN_PROGRESS, {"p_external_id": external_id, "p_executor_tg_id": executor_tg_id}
     )
+    changed = (result.rowcount or 0) == 1
+    if changed:
+        await append_event(session, external_id, EventType.IN_PROGRESS, actor_tg_id=executor_tg_id)
     await session.commit()
 
-    changed = (result.rowcount or 0) == 1
-    req = await get_by_external_id(session, external_id)
-    return changed, req
+    return changed, await _load_snapshot(session, external_id)
 
 
-async def get_unsent_requests(session: AsyncSession, limit: int = 50) -> list[Request]:
+async def get_unsent_requests(session: AsyncSession, limit: int = 50, by_value: bool = False) -> list[Request]:
     res = await session.execute(
         select(Request)
         .where(Request.is_sent_to_group == False)
-        .order_by(Request.created_at.asc())
+        .order_by(*_backlog_order(by_value))
         .limit(limit)
     )
     return list(res.scalars().all())
 
 
 async def mark_sent_to_group(session: AsyncSession, external_id: int) -> None:
-    await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id)
-        .values(is_sent_to_group=True, last_group_error=None)
-    )
-    await session.commit()
+    await _update_with_event(session, external_id, EventType.GROUP_DELIVERED)
 
 
 async def mark_send_failed(session: AsyncSession, external_id: int, error: str) -> None:
-    await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id)
-        .values(is_sent_to_group=False, last_group_error=error[:255])
-    )
-    await session.commit()
+    await _update_with_event(session, external_id, EventType.GROUP_DELIVERY_FAILED, {"last_group_error": error[:255]})
 
 
 async def get_error_requests(session: AsyncSession, limit: int = 50) -> list[Request]:
-    res = await session.execute(
-        select(Request)
-        .where(Request.status == "ERROR_GROUP")
-        .order_by(Request.created_at.asc())
-        .limit(limit)
-    )
-    return list(res.scalars().all())
+    return await _select_by_status(session, "ERROR_GROUP", limit, by_value=False)
 
 
-async def mark_group_sent(session: AsyncSession, external_id: int, message_id: int) -> None:
-    await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id)
-        .values(
-            group_message_id=message_id,
-            is_sent_to_group=True,
-            last_group_error=None,
-            status="NEW",
-        )
+async def mark_group_sent(
+    session: AsyncSession,
+    external_id: int,
+    message_id: int,
+    group_chat_id: int | None = None,
+) -> None:
+    await _update_with_event(
+        session,
+        external_id,
+        EventType.PUBLISHED,
+        {"group_chat_id": group_chat_id, "group_message_id": message_id},
     )
-    await session.commit()
 
 
 async def mark_group_failed(session: AsyncSession, external_id: int, error: str) -> None:
-    await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id)
-        .values(
-            is_sent_to_group=False,
-            last_group_error=error[:255],
-            status="ERROR_GROUP",
-        )
-    )
-    await session.commit()
+    await _update_with_event(session, external_id, EventType.PUBLISH_FAILED, {"last_group_error": error[:255]})
 
 
-async def get_group_error_requests(session: AsyncSession, limit: int = 50) -> list[Request]:
-    res = await session.execute(
-        select(Request)
-        .where(Request.status == "ERROR_GROUP")
-        .order_by(Request.created_at.asc())
-        .limit(limit)
-    )
-    return list(res.scalars().all())
+async def get_group_error_requests(session: AsyncSession, limit: int = 50, by_value: bool = False) -> list[Request]:
+    return await _select_by_status(session, "ERROR_GROUP", limit, by_value)
 
 
-async def mark_onef_sent_done(session: AsyncSession, external_id: int) -> None:
-    await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id)
-        .values(
-            is_sent_to_1f=True,
-            last_1f_error=None,
-        )
+async def mark_onef_sent_done(session: AsyncSession, external_id: int, decision_status: str | None = None) -> None:
+    """decision_status — вернуть решение в status после ERROR_ONEF (иначе retry повторял бы отправку)."""
+    await _update_with_event(
+        session, external_id, EventType.ONEF_SENT, {"status": decision_status} if decision_status else None
     )
-    await session.commit()
 
 
 async def mark_onef_failed(session: AsyncSession, external_id: int, error: str) -> None:
-    await session.execute(
-        update(Request)
-        .where(Request.external_id == external_id)
-        .values(
-            is_sent_to_1f=False,
-            last_1f_error=error[:255],
-            status="ERROR_ONEF",
-        )
-    )
-    await session.commit()
+    await _update_with_event(session, external_id, EventType.ONEF_FAILED, {"last_1f_error": error[:255]})
+
+
+async def get_onef_error_requests(session: AsyncSession, limit: int = 50, by_value: bool = False) -> list[Request]:
+    return await _select_by_status(session, "ERROR_ONEF", limit, by_value)
 
 
-async def get_onef_error_requests(session: AsyncSession, limit: int = 50) -> list[Request]:
+async def get_onef_decisions(session: AsyncSession, external_ids: list[int]) -> dict[int, str]:
+    """
+    Решение KA (APPROVED / REJECTED) для заявок в ERROR_ONEF — status его уже затёр.
+    Последнее событие DECIDED; для заявок старше журнала — последний DECISION в audit_log.
+    """
+    decisions: dict[int, str] = {}
     res = await session.execute(
-        select(Request)
-        .where(Request.status == "ERROR_ONEF")
-        .order_by(Request.created_at.asc())
-        .limit(limit)
+        select(RequestEvent.external_id, RequestEvent.data)
+        .where(RequestEvent.external_id.in_(external_ids), RequestEvent.type == int(EventType.DECIDED))
+        .order_by(RequestEvent.id.asc())
     )
-    return list(res.scalars().all())
+    for external_id, data in res:
+        decisions[external_id] = json.loads(data)["status"]
+
+    missing = [str(i) for i in external_ids if i not in decisions]
+    if missing:
+        res = await session.execute(
+            select(AuditLog.entity_id, AuditLog.payload_json)
+            .where(
+                AuditLog.action == "DECISION",
+                AuditLog.entity == "request",
+                AuditLog.entity_id.in_(missing),
+                AuditLog.payload_json.is_not(None),
+            )
+            .order_by(AuditLog.id.asc())
+        )
+        for entity_id, payload in res:
+            decision = json.loads(payload).get("decision")
+            if decision:
+                decisions[int(entity_id)] = decision
+    return decisions
 
 
 async def mark_decision(
@@ -249,20 +563,188 @@ async def mark_decision(
     comment: str,
 ) -> bool:
     # Решение только назначенному исполнителю и только из IN_PROGRESS
+    now = datetime.now()
     result = await session.execute(
-        update(Request)
-        .where(
-            Request.external_id == external_id,
-            Request.status == "IN_PROGRESS",
-            Request.assigned_to_tg_id == executor_tg_id,
+        _MARK_DECISION,
+        {
+            "p_external_id": external_id,
+            "p_executor_tg_id": executor_tg_id,
+            "p_decision_status": decision_status,
+            "p_now": now,
+            "p_comment": comment,
+        },
+    )
+    decided = (result.rowcount or 0) == 1
+    if decided:
+        await append_event(
+            session,
+            external_id,
+            EventType.DECIDED,
+            {"status": decision_status, "decision_comment": comment},
+            actor_tg_id=executor_tg_id,
+            at=now,
+        )
+    await session.commit()
+    request_snapshots.pop(external_id)
+    return decided
+
+
+async def _finish_handover(
+    session: AsyncSession,
+    moved: list[tuple[RequestSnapshot, str]],
+    event: Callable[[RequestSnapshot], dict],
+    audit: Callable[[RequestSnapshot, str], dict],
+) -> list[tuple[RequestSnapshot, str]]:
+    # события и аудит — в той же транзакции, каждое одним executemany
+    await append_events(session, [event(snapshot) for snapshot, _ in moved])
+    await add_audit_logs(session, [audit(snapshot, prev) for snapshot, prev in moved], commit=False)
+    await session.commit()
+    for snapshot, _ in moved:
+        request_snapshots.set(snapshot.external_id, snapshot)
+    return moved
+
+
+async def release_executor_requests(
+    session: AsyncSession,
+    executor_tg_id: int,
+    *,
+    actor_tg_id: int | None,
+    action: str = "RELEASE_DEACTIVATED",
+) -> list[tuple[RequestSnapshot, str]]:
+    """
+    Все ASSIGNED / IN_PROGRESS заявки исполнителя -> NEW (без исполнителя), одна транзакция.
+    Возвращает [(срез после, статус до)].
+    """
+    released = []
+    for status in ACTIVE_STATUSES:
+        rows = await session.execute(_RELEASE_EXECUTOR, {"p_from_tg_id": executor_tg_id, "p_status": status})
+        released += [(RequestSnapshot(*row), status) for row in rows]
+
+    return await _finish_handover(
+        session,
+        released,
+        lambda req: event_row(req.external_id, EventType.RELEASED, actor_tg_id=actor_tg_id),
+        lambda req, prev: {
+            "action": action,
+            "entity": "request",
+            "entity_id": req.external_id,
+            "actor_tg_id": actor_tg_id,
+            "payload": {
+                "prev_status": prev,
+                "new_status": "NEW",
+                "released_tg_id": executor_tg_id,
+                "group_message_id": req.group_message_id,
+            },
+        },
+    )
+
+
+async def reassign_executor_requests(
+    session: AsyncSession,
+    from_tg_id: int,
+    to_tg_id: int,
+    to_username: str | None,
+    *,
+    actor_tg_id: int | None,
+    group_chat_id: int | None = None,
+) -> list[tuple[RequestSnapshot, str]]:
+    """
+    Все ASSIGNED / IN_PROGRESS заявки from_tg_id -> to_tg_id одним UPDATE
+    (статус тот же, assigned_at — сейчас). Возвращает [(срез после, статус)].
+    group_chat_id — передаются только заявки этой группы КА (None — всех групп).
+    """
+    params = {"p_from_tg_id": from_tg_id, "p_to_tg_id": to_tg_id, "p_to_username": to_username, "p_now": datetime.now()}
+    if group_chat_id is None:
+        rows = await session.execute(_REASSIGN_EXECUTOR, params)
+    else:
+        rows = await session.execute(
+            _REASSIGN_EXECUTOR_IN_GROUP,
+            {**params, "p_group_chat_id": group_chat_id, "p_default_chat_id": settings.group_chat_id},
         )
-        .values(
-            status=decision_status,            
-            decided_at=datetime.now(),
-            decision_comment=comment,
-            is_sent_to_1f=False,
-            last_1f_error=None,
+    moved = [(snapshot, snapshot.status) for snapshot in (RequestSnapshot(*row) for row in rows)]
+
+    return await _finish_handover(
+        session,
+        moved,
+        lambda req: event_row(
+            req.external_id,
+            EventType.REASSIGNED,
+            {"assigned_to_tg_id": to_tg_id, "assigned_to_username": to_username},
+            actor_tg_id=actor_tg_id,
+            at=req.assigned_at,
+        ),
+        lambda req, status: {
+            "action": "REASSIGN",
+            "entity": "request",
+            "entity_id": req.external_id,
+            "actor_tg_id": actor_tg_id,
+            "payload": {
+                "status": status,
+                "from_tg_id": from_tg_id,
+                "to_tg_id": to_tg_id,
+                "group_message_id": req.group_message_id,
+            },
+        },
+    )
+
+
+async def count_executor_active(session: AsyncSession, tg_id: int) -> int:
+    """Сколько ASSIGNED / IN_PROGRESS заявок на исполнителе."""
+    return (await session.execute(_COUNT_EXECUTOR_ACTIVE, {"p_tg_id": tg_id})).scalar_one()
+
+
+SLA_STATUSES = ("NEW", "ASSIGNED", "IN_PROGRESS")
+
+
+async def get_sla_candidates(session: AsyncSession, after_id: int = 0, up_to_id: int | None = None) -> list:
+    """
+    Лёгкая проекция (без ORM-сущностей) для SLA-планировщика:
+    активные заявки с after_id < id <= up_to_id.
+    """
+    stmt = (
+        select(
+            Request.id,
+            Request.external_id,
+            Request.status,
+            Request.created_at,
+            Request.assigned_at,
+            Request.assigned_to_tg_id,
         )
+        .where(Request.id > after_id, Request.status.in_(SLA_STATUSES))
+        .order_by(Request.id.asc())
     )
-    await session.commit()
-    return (result.rowcount or 0) == 1
+    if up_to_id is not None:
+        stmt = stmt.where(Request.id <= up_to_id)
+
+    res = await session.execute(stmt)
+    return list(res.all())
+
+
+async def get_max_request_id(session: AsyncSession) -> int:
+    res = await session.execute(select(func.max(Request.id)))
+    return res.scalar_one_or_none() or 0
+
+
+async def stream_requests(
+    session: AsyncSession,
+    *,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    status: str | None = None,
+    yield_per: int = 1000,
+) -> AsyncIterator[Row]:
+    """
+    Потоковое чтение заявок (server-side cursor, без ORM-сущностей).
+    Память постоянна независимо от числа строк. date_to — не включительно.
+    """
+    stmt = select(Request.__table__).order_by(Request.id.asc())
+    if date_from is not None:
+        stmt = stmt.where(Request.created_at >= date_from)
+    if date_to is not None:
+        stmt = stmt.where(Request.created_at < date_to)
+    if status:
+        stmt = stmt.where(Request.status == status)
+
+    result = await session.stream(stmt.execution_options(yield_per=yield_per))
+    async for row in result:
+        yield row
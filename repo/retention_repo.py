@@ -0,0 +1,77 @@
+from datetime import datetime
+from sqlalchemy import select, update
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import AuditLog, Request
+from repo.events_repo import EVENT_SETS, EventType, append_events, event_row, redact_pii
+from repo.requests_repo import request_snapshots
+
+# Функции чистят одну пачку и НЕ коммитят: вызывающий коммитит её вместе с checkpoint.
+# Возвращают (сколько строк изменено, последний id пачки | None, если строк не осталось).
+
+
+async def scrub_request_pii_chunk(
+    session: AsyncSession,
+    after_id: int,
+    decided_before: datetime,
+    limit: int,
+) -> tuple[int, int | None]:
+    rows = (await session.execute(
+        select(Request.id, Request.external_id)
+        .where(
+            Request.id > after_id,
+            # по решению, а не по статусу: ERROR_ONEF после решения тоже чистится
+            Request.decided_at.is_not(None),
+            Request.decided_at < decided_before,
+            # но только после доставки: retry 1F шлёт decision_comment из строки
+            # (проход повторяется — такие строки дочистятся после отправки)
+            Request.is_sent_to_1f.is_(True),
+            (Request.user_phone != "") | Request.decision_comment.is_not(None),
+        )
+        .order_by(Request.id.asc())
+        .limit(limit)
+    )).all()
+    if not rows:
+        return 0, None
+
+    ids = [r.id for r in rows]
+    external_ids = [r.external_id for r in rows]
+    result = await session.execute(
+        update(Request)
+        .where(Request.id.in_(ids))
+        .values(**EVENT_SETS[EventType.PII_SCRUBBED])
+        .execution_options(synchronize_session=False)
+    )
+    # журнал: телефон / комментарий затираются и в data прошлых событий, плюс событие чистки
+    await redact_pii(session, external_ids)
+    await append_events(session, [event_row(e, EventType.PII_SCRUBBED) for e in external_ids])
+    # чистка редкая — сбрасываем срезы целиком
+    request_snapshots.clear()
+    return result.rowcount or 0, ids[-1]
+
+
+async def purge_audit_payload_chunk(
+    session: AsyncSession,
+    after_id: int,
+    created_before: datetime,
+    limit: int,
+) -> tuple[int, int | None]:
+    ids = (await session.execute(
+        select(AuditLog.id)
+        .where(
+            AuditLog.id > after_id,
+            AuditLog.created_at < created_before,
+            AuditLog.payload_json.is_not(None),
+        )
+        .order_by(AuditLog.id.asc())
+        .limit(limit)
+    )).scalars().all()
+    if not ids:
+        return 0, None
+
+    result = await session.execute(
+        update(AuditLog)
+        .where(AuditLog.id.in_(ids))
+        .values(payload_json=None)
+        .execution_options(synchronize_session=False)
+    )
+    return result.rowcount or 0, ids[-1]
@@ -0,0 +1,89 @@
+from collections.abc import Iterable
+from datetime import date, datetime
+from sqlalchemy import Row, func, select, tuple_
+from sqlalchemy.ext.asyncio import AsyncSession
+from models import AuditLog, Request, StatusDurationRollup
+
+
+async def get_audit_batch(
+    session: AsyncSession,
+    after_id: int,
+    actions: Iterable[str],
+    created_before: datetime,
+    limit: int = 1000,
+) -> list[Row]:
+    """Строки audit_log по заявкам после high-water mark, по возрастанию id."""
+    res = await session.execute(
+        select(AuditLog.id, AuditLog.action, AuditLog.entity_id, AuditLog.actor_tg_id, AuditLog.created_at)
+        .where(
+            AuditLog.id > after_id,
+            AuditLog.entity == "request",
+            AuditLog.action.in_(list(actions)),
+            AuditLog.created_at < created_before,
+        )
+        .order_by(AuditLog.id.asc())
+        .limit(limit)
+    )
+    return list(res.all())
+
+
+async def get_last_marks(
+    session: AsyncSession,
+    entity_ids: Iterable[str],
+    actions: Iterable[str],
+    up_to_id: int,
+) -> dict[str, dict[str, datetime]]:
+    """entity_id -> {action: время последнего такого события с id <= up_to_id}."""
+    res = await session.execute(
+        select(AuditLog.entity_id, AuditLog.action, func.max(AuditLog.created_at))
+        .where(
+            AuditLog.entity == "request",
+            AuditLog.entity_id.in_(list(entity_ids)),
+            AuditLog.action.in_(list(actions)),
+            AuditLog.id <= up_to_id,
+        )
+        .group_by(AuditLog.entity_id, AuditLog.action)
+    )
+    marks: dict[str, dict[str, datetime]] = {}
+    for entity_id, action, created_at in res.all():
+        marks.setdefault(entity_id, {})[action] = created_at
+    return marks
+
+
+async def get_request_created_at(session: AsyncSession, external_ids: Iterable[int]) -> dict[int, datetime]:
+    res = await session.execute(
+        select(Request.external_id, Request.created_at).where(Request.external_id.in_(list(external_ids)))
+    )
+    return dict(res.all())
+
+
+async def get_rollups_for_keys(
+    session: AsyncSession,
+    keys: Iterable[tuple[date, int, str]],
+) -> dict[tuple[date, int, str], StatusDurationRollup]:
+    keys = list(keys)
+    if not keys:
+        return {}
+    res = await session.execute(
+        select(StatusDurationRollup).where(
+            tuple_(StatusDurationRollup.day, StatusDurationRollup.executor_tg_id, StatusDurationRollup.stage).in_(keys)
+        )
+    )
+    return {(r.day, r.executor_tg_id, r.stage): r for r in res.scalars().all()}
+
+
+async def get_rollups(
+    session: AsyncSession,
+    date_from: date,
+    date_to: date,
+    executor_tg_id: int | None = None,
+) -> list[StatusDurationRollup]:
+    """Роллапы за [date_from, date_to] включительно."""
+    stmt = select(StatusDurationRollup).where(
+        StatusDurationRollup.day >= date_from,
+        StatusDurationRollup.day <= date_to,
+    )
+    if executor_tg_id is not None:
+        stmt = stmt.where(StatusDurationRollup.executor_tg_id == executor_tg_id)
+    res = await session.execute(stmt)
+    return list(res.scalars().all())
@@ -0,0 +1,66 @@
+from __future__ import annotations
+
+import re
+
+from sqlalchemy import Integer, literal_column, select, text
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from models import SEARCH_TEXT_SQL, Request, normalize_phone
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+_PHONE_QUERY_RE = re.compile(r"^\+?[\d\s\-()]{3,}$")
+# "---" / "( )" проходят регулярку, но дают пустой префикс — он совпал бы со всеми строками
+_MIN_PHONE_DIGITS = 3
+
+
+def _phone_prefix_range(prefix: str) -> tuple[str, str]:
+    # префикс по B-tree: prefix <= x < prefix + ':' (':' идёт сразу после '9')
+    return prefix, prefix + ":"
+
+
+async def search_requests(
+    session: AsyncSession,
+    query: str,
+    *,
+    limit: int = 20,
+    before_id: int | None = None,
+) -> list[Request]:
+    """
+    Поиск заявок (новые первыми, keyset-пагинация по id: before_id = id последней
+    строки предыдущей страницы):
+    - запрос из цифр (+992…) — префикс нормализованного телефона;
+    - иначе — все слова должны встретиться в ФИО / марке / модели
+      (SQLite FTS5, Postgres pg_trgm ILIKE).
+    """
+    stmt = select(Request).order_by(Request.id.desc()).limit(limit)
+    if before_id is not None:
+        stmt = stmt.where(Request.id < before_id)
+
+    query = (query or "").strip()
+    digits = normalize_phone(query)
+    if _PHONE_QUERY_RE.match(query) and len(digits) >= _MIN_PHONE_DIGITS:
+        lo, hi = _phone_prefix_range(digits)
+        stmt = stmt.where(Request.user_phone_norm >= lo, Request.user_phone_norm < hi)
+    else:
+        tokens = _TOKEN_RE.findall(query)
+        if not tokens:
+            return []
+
+        dialect = session.get_bind().dialect.name
+        if dialect == "sqlite":
+            match = " ".join(f'"{t}"*' for t in tokens)
+            fts_ids = (
+                text("SELECT rowid FROM requests_fts WHERE requests_fts MATCH :match")
+                .bindparams(match=match)
+                .columns(rowid=Integer)
+            )
+            stmt = stmt.where(Request.id.in_(fts_ids))
+        else:
+            haystack = literal_column(SEARCH_TEXT_SQL)
+            for t in tokens:
+                # токены — \w+, из спецсимволов LIKE остаётся только "_"
+                escaped = t.replace("_", "!_")
+                stmt = stmt.where(haystack.ilike(f"%{escaped}%", escape="!"))
+
+    res = await session.execute(stmt)
+    return list(res.scalars().all())
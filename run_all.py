@@ -0,0 +1,107 @@
+"""
+Единая точка запуска для продакшена: FastAPI (приём заявок от 1F) и polling
+бота в одном процессе на одном uvloop event loop.
+
+Общие на весь процесс: сессия bot_instance.bot, пул соединений db.engine,
+кэши (recent_requests, курсы валют) и один набор retry/SLA-тасков.
+
+Порядок:
+    старт  — init_db -> HTTP API (lifespan) -> фоновые таски -> polling
+    стоп   — polling -> HTTP API -> фоновые таски -> сессия бота -> пул БД
+
+Запуск:
+    python run_all.py
+"""
+from __future__ import annotations
+
+import asyncio
+import contextlib
+import logging
+import signal
+
+import uvicorn
+import uvloop
+
+from bot_instance import bot
+from config import settings
+from db import engine, init_db
+from logging_setup import setup_logging
+from main import build_dispatcher, start_background_tasks
+from receive_from_1f import app
+
+logger = logging.getLogger("ka_bot")
+
+
+class _EmbeddedServer(uvicorn.Server):
+    """uvicorn внутри чужого event loop: сигналы обрабатывает runner, а не сервер."""
+
+    @contextlib.contextmanager
+    def capture_signals(self):
+        yield
+
+
+async def run() -> None:
+    setup_logging(logging.INFO)
+    await init_db()
+
+    stop = asyncio.Event()
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, stop.set)
+
+    server = _EmbeddedServer(uvicorn.Config(
+        app,
+        host=settings.api_host,
+        port=settings.api_port,
+        loop="none",
+        http="httptools",
+        log_config=None,  # логи идут через общий setup_logging
+    ))
+    server_task = asyncio.create_task(server.serve())
+    while not server.started:
+        if server_task.done():
+            # порт занят / ошибка lifespan — дальше не стартуем
+            await server_task
+            raise RuntimeError("HTTP API failed to start")
+        await asyncio.sleep(0.05)
+
+    background: list[asyncio.Task] = []
+    polling_task: asyncio.Task | None = None
+    dp = build_dispatcher(bot)
+    try:
+        background = await start_background_tasks()
+
+        await bot.delete_webhook(drop_pending_updates=True)
+        polling_task = asyncio.create_task(
+            dp.start_polling(bot, handle_signals=False, close_bot_session=False)
+        )
+        logger.info("[Runner] started: api=%s:%s + polling", settings.api_host, settings.api_port)
+
+        stop_task = asyncio.create_task(stop.wait())
+        background.append(stop_task)
+        await asyncio.wait({stop_task, server_task, polling_task}, return_when=asyncio.FIRST_COMPLETED)
+        logger.info("[Runner] shutting down")
+    finally:
+        # новые апдейты больше не берём, текущие хендлеры дорабатывают
+        if polling_task is not None:
+            if not polling_task.done():
+                with contextlib.suppress(RuntimeError):  # polling ещё не успел запуститься
+                    await dp.stop_polling()
+                await asyncio.wait({polling_task}, timeout=10)
+                polling_task.cancel()
+            await asyncio.gather(polling_task, return_exceptions=True)
+
+        server.should_exit = True
+        await asyncio.gather(server_task, return_exceptions=True)
+
+        for task in background:
+            task.cancel()
+        await asyncio.gather(*background, return_exceptions=True)
+
+        await bot.session.close()
+        await engine.dispose()
+        logger.info("[Runner] stopped")
+
+
+if __name__ == "__main__":
+    uvloop.run(run())
@@ -1,6 +1,7 @@
 from aiogram import Bot
 from aiogram.types import InlineKeyboardMarkup, InlineKeyboardButton
 from config import settings
+from models import car_dict
 
 def accept_keyboard(external_id: int) -> InlineKeyboardMarkup:
     return InlineKeyboardMarkup(inline_keyboard=[
@@ -24,10 +25,11 @@ async def send_request_to_ka_group(
     external_id: int,
     full_name: str,
     phone: str,
-    car: dict
+    car: dict,
+    chat_id: int | None = None,
 ) -> int:
-    
-    chat_id = int(settings.group_chat_id)
+    """chat_id — группа КА по маршрутизации (по умолчанию settings.group_chat_id)."""
+    chat_id = int(chat_id if chat_id is not None else settings.group_chat_id)
 
     if chat_id == 0:
         raise RuntimeError("KA_GROUP_CHAT_ID / ka_group_chat_id is not set in .env")
@@ -82,3 +84,14 @@ def after_in_progress_keyboard(external_id: int) -> InlineKeyboardMarkup:
             InlineKeyboardButton(text="Отклонить", callback_data=f"ka_decline:{external_id}"),
         ]
     ])
+
+
+def render_group_card(req) -> tuple[str, InlineKeyboardMarkup | None]:
+    """Текущий вид сообщения заявки в группе КА (Request или RequestSnapshot)."""
+    base = render_request_text(req.external_id, req.user_full_name, req.user_phone, car_dict(req))
+    if req.assigned_to_tg_id is None:
+        return base, accept_keyboard(req.external_id)
+    if req.status == "ASSIGNED":
+        return render_in_progress_text(base, req.assigned_to_username, req.assigned_to_tg_id), None
+    # IN_PROGRESS и дальше: после решения сообщение в группе остаётся «В процессе»
+    return render_in_progress_stage_text(base, req.assigned_to_username, req.assigned_to_tg_id), None
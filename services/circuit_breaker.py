@@ -0,0 +1,110 @@
+from __future__ import annotations
+
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from typing import Any, TypeVar
+
+logger = logging.getLogger("ka_bot")
+
+T = TypeVar("T")
+
+CLOSED = "CLOSED"
+OPEN = "OPEN"
+HALF_OPEN = "HALF_OPEN"
+
+
+class CircuitOpenError(Exception):
+    """Вызов не выполнялся: внешний сервис считается недоступным."""
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker для внешних вызовов:
+    - CLOSED: вызовы идут, подряд failure_threshold ошибок -> OPEN
+    - OPEN: вызовы сразу падают с CircuitOpenError (миллисекунды вместо таймаута)
+    - HALF_OPEN: через reset_timeout пропускается ровно один пробный вызов;
+      успех -> CLOSED, ошибка -> снова OPEN
+    """
+
+    def __init__(
+        self,
+        name: str,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+        exceptions: tuple[type[BaseException], ...] = (Exception,),
+    ) -> None:
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.exceptions = exceptions
+
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+
+        self.trips = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == OPEN and time.monotonic() - self._opened_at >= self.reset_timeout:
+            return HALF_OPEN
+        return self._state
+
+    def is_open(self) -> bool:
+        """True, если вызов сейчас точно будет отклонён (не занимает пробу)."""
+        state = self.state
+        return state == OPEN or (state == HALF_OPEN and self._probe_in_flight)
+
+    async def call(self, fn: Callable[..., Awaitable[T]], *args: Any, **kwargs: Any) -> T:
+        self._before_call()
+        try:
+            result = await fn(*args, **kwargs)
+        except self.exceptions:
+            self._on_failure()
+            raise
+        except BaseException:
+            # не «наша» ошибка (например, отмена) — пробу просто освобождаем
+            self._probe_in_flight = False
+            raise
+        self._on_success()
+        return result
+
+    def metrics(self) -> dict[str, Any]:
+        return {
+            "name": self.name,
+            "state": self.state,
+            "consecutive_failures": self._failures,
+            "trips": self.trips,
+            "rejected": self.rejected,
+        }
+
+    def _before_call(self) -> None:
+        state = self.state
+        if state == CLOSED:
+            return
+        if state == HALF_OPEN and not self._probe_in_flight:
+            self._state = HALF_OPEN
+            self._probe_in_flight = True
+            return
+
+        self.rejected += 1
+        raise CircuitOpenError(f"{self.name}: circuit is open")
+
+    def _on_success(self) -> None:
+        if self._state != CLOSED:
+            logger.warning("[Breaker:%s] recovered -> CLOSED", self.name)
+        self._state = CLOSED
+        self._failures = 0
+        self._probe_in_flight = False
+
+    def _on_failure(self) -> None:
+        self._failures += 1
+        if self._state == HALF_OPEN or self._failures >= self.failure_threshold:
+            self._state = OPEN
+            self._opened_at = time.monotonic()
+            self.trips += 1
+            logger.warning("[Breaker:%s] tripped -> OPEN (failures=%s)", self.name, self._failures)
+        self._probe_in_flight = False
@@ -0,0 +1,112 @@
+from __future__ import annotations
+
+import logging
+
+from bot_instance import bot
+from db import SessionLocal
+from repo.requests_repo import RequestSnapshot, reassign_executor_requests, release_executor_requests
+from services.bot_functions import (
+    accept_keyboard,
+    after_in_progress_keyboard,
+    executor_keyboard,
+    render_executor_confirm_text,
+    render_in_progress_stage_text,
+    render_in_progress_text,
+    render_request_text,
+)
+from services.group_routing import request_group_chat_id
+from services.sla_scheduler import sla_scheduler
+from services.telegram_batch import BatchResult, Job, run_paced
+
+logger = logging.getLogger("ka_bot")
+
+
+def _base_text(req: RequestSnapshot) -> str:
+    return render_request_text(req.external_id, req.user_full_name, req.user_phone, req.car)
+
+
+def _edit_group(req: RequestSnapshot, text: str, reply_markup=None) -> tuple[str, Job]:
+    return (
+        f"edit #{req.external_id}",
+        lambda: bot.edit_message_text(
+            chat_id=request_group_chat_id(req),
+            message_id=req.group_message_id,
+            text=text,
+            reply_markup=reply_markup,
+        ),
+    )
+
+
+async def release_executor(executor_tg_id: int, actor_tg_id: int | None) -> tuple[int, BatchResult]:
+    """
+    Снимает все ASSIGNED / IN_PROGRESS заявки исполнителя (отключение): один UPDATE
+    и аудит пачкой, затем в группах возвращается кнопка Accept (пачкой с темпом).
+    """
+    async with SessionLocal() as session:
+        released = await release_executor_requests(session, executor_tg_id, actor_tg_id=actor_tg_id)
+
+    jobs = []
+    for req, _ in released:
+        sla_scheduler.on_new(req.external_id)
+        if req.group_message_id:
+            jobs.append(_edit_group(req, _base_text(req), accept_keyboard(req.external_id)))
+
+    batch = await run_paced(jobs)
+    logger.info(
+        "[Handover] released %s requests of tg_id=%s, group edits ok=%s failed=%s",
+        len(released), executor_tg_id, batch.ok, batch.failed,
+    )
+    return len(released), batch
+
+
+async def reassign_executor(
+    from_tg_id: int,
+    to_tg_id: int,
+    to_username: str | None,
+    actor_tg_id: int | None,
+    group_chat_id: int | None = None,
+) -> tuple[int, BatchResult]:
+    """
+    Передаёт все ASSIGNED / IN_PROGRESS заявки from_tg_id -> to_tg_id одним UPDATE
+    (group_chat_id — только заявки этой группы КА); затем пачкой правятся сообщения
+    в группах и новому исполнителю уходят заявки с кнопками.
+    """
+    async with SessionLocal() as session:
+        moved = await reassign_executor_requests(
+            session, from_tg_id, to_tg_id, to_username, actor_tg_id=actor_tg_id, group_chat_id=group_chat_id
+        )
+
+    jobs = []
+    for req, status in moved:
+        base = _base_text(req)
+        if status == "ASSIGNED":
+            sla_scheduler.on_assigned(req.external_id, to_tg_id, req.assigned_at)
+            group_text = render_in_progress_text(base, to_username, to_tg_id)
+            private_text = "🔁 Вам передана заявка.\n\n" + render_executor_confirm_text(
+                req.external_id, req.user_full_name, req.user_phone, req.car
+            )
+            keyboard = executor_keyboard(req.external_id)
+        else:
+            sla_scheduler.on_in_progress(req.external_id, to_tg_id, req.assigned_at)
+            group_text = render_in_progress_stage_text(base, to_username, to_tg_id)
+            private_text = (
+                "🔁 Вам передана заявка в статусе «В процессе».\n\n" + base
+                + "\nПосле завершения нажмите 'Передать АЛ' или 'Отклонить'."
+            )
+            keyboard = after_in_progress_keyboard(req.external_id)
+
+        if req.group_message_id:
+            jobs.append(_edit_group(req, group_text))
+        jobs.append((
+            f"notify #{req.external_id}",
+            lambda text=private_text, markup=keyboard: bot.send_message(
+                chat_id=to_tg_id, text=text, reply_markup=markup
+            ),
+        ))
+
+    batch = await run_paced(jobs)
+    logger.info(
+        "[Handover] reassigned %s requests tg_id=%s -> %s, messages ok=%s failed=%s",
+        len(moved), from_tg_id, to_tg_id, batch.ok, batch.failed,
+    )
+    return len(moved), batch
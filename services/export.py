@@ -0,0 +1,69 @@
+from __future__ import annotations
+
+import csv
+import io
+import json
+from collections.abc import AsyncIterator
+from datetime import datetime
+
+from models import AuditLog, Request
+from repo.audit_repo import stream_audit_log
+from repo.requests_repo import stream_requests
+from services.read_replica import read_session
+
+EXPORT_FORMATS = ("csv", "jsonl")
+EXPORT_TABLES = ("requests", "audit")
+
+# сколько строк копим в буфере перед отдачей чанка
+_CHUNK_ROWS = 500
+
+
+async def iter_export(
+    table: str,
+    fmt: str,
+    *,
+    date_from: datetime | None = None,
+    date_to: datetime | None = None,
+    status: str | None = None,
+) -> AsyncIterator[bytes]:
+    """
+    Потоковая выгрузка requests / audit_log в CSV или JSONL чанками.
+    status — фильтр по requests.status или audit_log.action.
+    Сессия живёт ровно столько, сколько читается поток.
+    """
+    if table not in EXPORT_TABLES:
+        raise ValueError(f"Unknown export table: {table}")
+    if fmt not in EXPORT_FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+
+    columns = [c.name for c in (Request if table == "requests" else AuditLog).__table__.columns]
+
+    buf = io.StringIO()
+    writer = csv.writer(buf) if fmt == "csv" else None
+    if writer is not None:
+        writer.writerow(columns)
+
+    async with read_session() as session:
+        if table == "requests":
+            rows = stream_requests(session, date_from=date_from, date_to=date_to, status=status)
+        else:
+            rows = stream_audit_log(session, date_from=date_from, date_to=date_to, action=status)
+
+        pending = 0
+        async for row in rows:
+            if writer is not None:
+                writer.writerow(row)
+            else:
+                buf.write(json.dumps(dict(zip(columns, row)), ensure_ascii=False, default=str))
+                buf.write("\n")
+
+            pending += 1
+            if pending >= _CHUNK_ROWS:
+                yield buf.getvalue().encode("utf-8")
+                buf.seek(0)
+                buf.truncate()
+                pending = 0
+
+    tail = buf.getvalue()
+    if tail:
+        yield tail.encode("utf-8")
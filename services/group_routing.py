@@ -0,0 +1,52 @@
+from __future__ import annotations
+
+from config import KaRoute, settings
+from services.pricing import parse_price
+
+
+def _matches(route: KaRoute, car: dict) -> bool:
+    if route.brands and str(car.get("Brand", "")).strip().lower() not in {b.lower() for b in route.brands}:
+        return False
+    if route.currencies and str(car.get("Currency", "")).upper() not in {c.upper() for c in route.currencies}:
+        return False
+
+    if route.price_min is not None or route.price_max is not None:
+        price = parse_price(car.get("Price"))
+        if price is None:
+            return False
+        if route.price_min is not None and price < route.price_min:
+            return False
+        if route.price_max is not None and price >= route.price_max:
+            return False
+    return True
+
+
+def _is_pool(route: KaRoute) -> bool:
+    return not (route.brands or route.currencies or route.price_min is not None or route.price_max is not None)
+
+
+def route_request(external_id: int, car: dict) -> int:
+    """
+    Выбирает chat_id группы КА для заявки:
+    1) первое правило с критериями, которому заявка соответствует;
+    2) иначе — пул правил без критериев по external_id % len(pool);
+    3) иначе — settings.group_chat_id.
+    """
+    routes = settings.ka_routes
+    if not routes:
+        return int(settings.group_chat_id)
+
+    for route in routes:
+        if not _is_pool(route) and _matches(route, car):
+            return route.chat_id
+
+    pool = [r for r in routes if _is_pool(r)]
+    if pool:
+        return pool[external_id % len(pool)].chat_id
+
+    return int(settings.group_chat_id)
+
+
+def request_group_chat_id(req) -> int:
+    """Группа, в которой опубликована заявка (старые строки — в group_chat_id)."""
+    return int(req.group_chat_id or settings.group_chat_id)
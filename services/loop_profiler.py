@@ -0,0 +1,211 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from types import FrameType
+from typing import Any
+
+from config import settings
+from logging_setup import get_log_context
+
+logger = logging.getLogger("ka_bot")
+
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) + os.sep
+
+# кадры, в которых стоит event loop, когда ему нечего делать: у asyncio — select,
+# у uvloop цикл целиком в C, и самым внутренним Python-кадром остаётся точка запуска loop
+_IDLE_FUNCS = {"select", "poll", "epoll", "_run_once", "run_forever", "run_until_complete"}
+_IDLE_FILES = (os.path.join("asyncio", "runners.py"), os.path.join("uvloop", "__init__.py"))
+
+
+def _is_idle(frame: FrameType) -> bool:
+    return frame.f_code.co_name in _IDLE_FUNCS or frame.f_code.co_filename.endswith(_IDLE_FILES)
+
+
+def _frame_key(frame: FrameType) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    if filename.startswith(_ROOT):
+        filename = filename[len(_ROOT):]
+    else:
+        filename = os.sep.join(filename.split(os.sep)[-2:])
+    return f"{getattr(code, 'co_qualname', code.co_name)} ({filename}:{code.co_firstlineno})"
+
+
+def _stack(frame: FrameType | None, limit: int = 64) -> list[FrameType]:
+    """Кадры от внешнего к внутреннему."""
+    frames = []
+    while frame is not None and len(frames) < limit:
+        frames.append(frame)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _is_project_frame(frame: FrameType) -> bool:
+    filename = frame.f_code.co_filename
+    return filename.startswith(_ROOT) and os.sep + ".venv" + os.sep not in filename
+
+
+def _classify(frames: list[FrameType]) -> str:
+    """Что держит loop: telegram / repo / handler / other — по самому внутреннему узнаваемому кадру."""
+    for frame in reversed(frames):
+        filename = frame.f_code.co_filename
+        if f"{os.sep}aiogram{os.sep}" in filename or f"{os.sep}aiohttp{os.sep}" in filename:
+            return "telegram"
+        if not _is_project_frame(frame):
+            continue
+        rel = filename[len(_ROOT):]
+        if rel.startswith("repo" + os.sep):
+            return "repo"
+        if rel.startswith("handlers" + os.sep):
+            return "handler"
+    return "other"
+
+
+class LoopSampler:
+    """
+    Сэмплирующий профайлер потока event loop: фоновый поток раз в interval
+    снимает стек loop-потока (sys._current_frames) и считает self / cumulative
+    попадания по функциям. Loop не инструментируется — накладные расходы
+    ограничены одним снятием стека на сэмпл. Поток сэмплера получает GIL в
+    основном когда loop ждёт I/O, поэтому доля "loop busy" занижена; значимо
+    распределение между функциями.
+    """
+
+    def __init__(self, loop_thread_id: int, interval: float = 0.005) -> None:
+        self.loop_thread_id = loop_thread_id
+        self.interval = interval
+        self.samples = 0
+        self.idle = 0
+        self.self_counts: Counter[str] = Counter()
+        self.cum_counts: Counter[str] = Counter()
+
+    def sample_for(self, seconds: float) -> None:
+        """Блокирующий цикл сэмплирования — запускать в отдельном потоке."""
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline:
+            frame = sys._current_frames().get(self.loop_thread_id)
+            if frame is not None:
+                self._add(_stack(frame))
+            time.sleep(self.interval)
+
+    def _add(self, frames: list[FrameType]) -> None:
+        self.samples += 1
+        if _is_idle(frames[-1]):
+            self.idle += 1
+            return
+        self.self_counts[_frame_key(frames[-1])] += 1
+        for key in {_frame_key(f) for f in frames}:
+            self.cum_counts[key] += 1
+
+    def report(self, top: int = 40) -> str:
+        busy = self.samples - self.idle
+        lines = [
+            f"samples: {self.samples} (interval {self.interval * 1000:.0f} ms)",
+            f"loop busy: {busy} ({busy / self.samples:.1%})" if self.samples else "loop busy: -",
+            "",
+            f"== top {top} by self time (% of busy samples) ==",
+        ]
+        for key, n in self.self_counts.most_common(top):
+            lines.append(f"{n / busy:7.1%}  {n:6d}  {key}")
+        lines += ["", f"== top {top} by cumulative time ==" ]
+        for key, n in self.cum_counts.most_common(top):
+            lines.append(f"{n / busy:7.1%}  {n:6d}  {key}")
+        return "\n".join(lines) + "\n"
+
+
+async def profile_loop(seconds: float, interval: float = 0.005) -> str:
+    """Профилирует текущий event loop seconds секунд, не блокируя его; возвращает текстовый отчёт."""
+    sampler = LoopSampler(threading.get_ident(), interval)
+    await asyncio.to_thread(sampler.sample_for, seconds)
+    return sampler.report()
+
+
+class LoopWatchdog:
+    """
+    Детектор блокировок event loop: корутина-heartbeat отмечается каждые
+    threshold/4, фоновый поток проверяет отметку. Если loop не отвечает дольше
+    threshold — снимается стек loop-потока и контекст текущей задачи
+    (external_id / callback / update_id из bind_log_context), а после
+    разблокировки пишется warning с полной длительностью.
+    """
+
+    def __init__(self, threshold_ms: int = 200) -> None:
+        self.threshold = threshold_ms / 1000
+        self.blocked_count = 0
+        self._beat = time.monotonic()
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._loop_thread_id = 0
+        self._stop = threading.Event()
+
+    def start(self) -> asyncio.Task:
+        self._loop = asyncio.get_running_loop()
+        self._loop_thread_id = threading.get_ident()
+        self._beat = time.monotonic()
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        return asyncio.create_task(self._heartbeat())
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    async def _heartbeat(self) -> None:
+        try:
+            while True:
+                self._beat = time.monotonic()
+                await asyncio.sleep(self.threshold / 4)
+        finally:
+            self._stop.set()
+
+    def _watch(self) -> None:
+        captured: dict[str, Any] | None = None
+        blocked_since = 0.0
+        while not self._stop.wait(self.threshold / 4):
+            beat = self._beat
+            lag = time.monotonic() - beat
+            if lag > self.threshold:
+                if captured is None:
+                    captured = self._capture()
+                    blocked_since = beat
+            elif captured is not None:
+                self._report(captured, beat - blocked_since)
+                captured = None
+
+    def _capture(self) -> dict[str, Any]:
+        frames = _stack(sys._current_frames().get(self._loop_thread_id))
+        context: dict[str, Any] = {}
+        task = None
+        try:
+            task = asyncio.current_task(self._loop)
+        except RuntimeError:
+            pass
+        if task is not None:
+            context = get_log_context(task)
+        project = [f for f in frames if _is_project_frame(f)] or frames
+        return {
+            "kind": _classify(frames),
+            "where": _frame_key(project[-1]) if project else "?",
+            "stack": " <- ".join(_frame_key(f) for f in reversed(frames[-6:])),
+            "task": task.get_name() if task is not None else None,
+            "context": context,
+        }
+
+    def _report(self, captured: dict[str, Any], blocked: float) -> None:
+        self.blocked_count += 1
+        logger.warning(
+            "[SlowLoop] event loop blocked %.0f ms by %s in %s (task=%s); stack: %s",
+            blocked * 1000,
+            captured["kind"],
+            captured["where"],
+            captured["task"],
+            captured["stack"],
+            extra=captured["context"],
+        )
+
+
+loop_watchdog = LoopWatchdog(settings.slow_callback_ms)
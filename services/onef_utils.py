@@ -2,6 +2,13 @@ from __future__ import annotations
 
 from datetime import datetime, timedelta, timezone
 
+import requests
+
+from services.circuit_breaker import CircuitBreaker
+
+# Общий breaker для всех вызовов 1F
+onef_breaker = CircuitBreaker("1F", failure_threshold=3, reset_timeout=30.0, exceptions=(requests.RequestException,))
+
 
 def decision_at_iso_plus5(dt: datetime | None = None) -> str:
     """
@@ -0,0 +1,65 @@
+from __future__ import annotations
+
+import math
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from repo.rates_repo import get_rate_table
+from services.lru_cache import LruCache
+
+# таблица курсов целиком, перечитывается из БД не чаще раза в 5 минут
+_rates_cache = LruCache(maxsize=1, ttl_seconds=300)
+
+# car_price_value / car_price_base — Numeric(18, 2): всё, что >= 1e16, не влезет
+MAX_PRICE = 1e16
+
+
+def _fits(price: float) -> bool:
+    return math.isfinite(price) and 0 <= price < MAX_PRICE
+
+
+def parse_price(value) -> float | None:
+    """'250 000', '250000.50', '1,5' -> float; мусор, 'inf', '1e30', отрицательные -> None."""
+    try:
+        price = float(str(value).replace(" ", "").replace("\u00a0", "").replace(",", "."))
+    except (TypeError, ValueError):
+        return None
+    return price if _fits(price) else None
+
+
+def invalidate_rates() -> None:
+    """
+    Сбрасывает кэш курсов только своего процесса. При раздельном запуске
+    (main.py + uvicorn) API увидит новый курс по истечении TTL — до 5 минут.
+    """
+    _rates_cache.clear()
+
+
+async def get_rates(session: AsyncSession) -> dict[str, float]:
+    rates = _rates_cache.get("rates")
+    if rates is None:
+        rates = await get_rate_table(session)
+        _rates_cache.set("rates", rates)
+    return rates
+
+
+async def normalize_price(session: AsyncSession, price, currency) -> tuple[float | None, float | None]:
+    """
+    Возвращает (цена числом, цена в базовой валюте).
+    Если курса валюты нет (или сумма не влезает в Numeric(18, 2)) — базовая сумма None
+    (заявка уйдёт в конец приоритета).
+    """
+    value = parse_price(price)
+    if value is None:
+        return None, None
+
+    currency = str(currency or "").upper()
+    if currency == settings.base_currency.upper():
+        return value, value
+
+    rate = (await get_rates(session)).get(currency)
+    if rate is None:
+        return value, None
+    base = round(value * rate, 2)
+    return value, base if _fits(base) else None
@@ -0,0 +1,109 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections import deque
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db import ReadSessionLocal, SessionLocal, engine, read_engine
+from repo.checkpoints_repo import get_checkpoint, set_checkpoint
+
+logger = logging.getLogger("ka_bot")
+
+HEARTBEAT = "replica.heartbeat"
+
+
+class ReplicaRouter:
+    """
+    Куда идут читающие запросы отчётов / выгрузок / поиска: в реплику, пока её
+    отставание в пределах read_replica_max_lag_seconds, иначе в основную БД.
+
+    Отставание меряется heartbeat-ом: раз в interval в основную БД пишется
+    время (job_checkpoints), из реплики читается последнее доехавшее значение.
+    Если это не последний наш heartbeat — реплика отстаёт как минимум на время
+    с момента записи следующего за ним. Работает для любой репликации
+    (Postgres streaming, копия SQLite-файла), точность — interval.
+    """
+
+    def __init__(self, interval_seconds: float = 5.0) -> None:
+        self._interval = interval_seconds
+        # наши heartbeat-ы (мс), ещё не увиденные в реплике
+        self._written: deque[int] = deque(maxlen=10_000)
+        self._last_written = 0
+        self._running = False
+        self.lag: float | None = None  # секунды; None — неизвестно / реплика недоступна
+
+    @property
+    def enabled(self) -> bool:
+        return read_engine is not engine
+
+    @property
+    def use_replica(self) -> bool:
+        if not self.enabled or self.lag is None:
+            return False
+        max_lag = settings.read_replica_max_lag_seconds
+        return max_lag <= 0 or self.lag <= max_lag
+
+    async def check_once(self) -> None:
+        was_used = self.use_replica
+        now_ms = int(time.time() * 1000)
+        try:
+            async with ReadSessionLocal() as session:
+                seen = await get_checkpoint(session, HEARTBEAT)
+        except Exception as e:
+            self.lag = None
+            if was_used:
+                logger.warning("[Replica] read replica unavailable, reads go to primary: %s", e)
+        else:
+            while self._written and self._written[0] <= seen:
+                self._written.popleft()
+            if self._written:
+                self.lag = (now_ms - self._written[0]) / 1000
+            elif self._last_written:
+                # реплика видит наш последний heartbeat; до первого — отставание неизвестно
+                self.lag = 0.0
+            if was_used != self.use_replica:
+                logger.warning(
+                    "[Replica] lag %s s, reads go to %s",
+                    f"{self.lag:.1f}" if self.lag is not None else "?",
+                    "replica" if self.use_replica else "primary",
+                )
+
+        async with SessionLocal() as session:
+            await set_checkpoint(session, HEARTBEAT, now_ms)
+        self._written.append(now_ms)
+        self._last_written = now_ms
+
+    async def run(self) -> None:
+        """Heartbeat-цикл; второй вызов в том же процессе (run_all: lifespan + фоновые таски) ничего не делает."""
+        if not self.enabled or self._running:
+            return
+        self._running = True
+        try:
+            while True:
+                try:
+                    await self.check_once()
+                except Exception:
+                    logger.exception("[Replica] heartbeat failed")
+                await asyncio.sleep(self._interval)
+        finally:
+            self._running = False
+
+
+replica_router = ReplicaRouter()
+
+
+@asynccontextmanager
+async def read_session() -> AsyncIterator[AsyncSession]:
+    """
+    Сессия для отчётов и списков, которым не нужна свежесть до миллисекунды.
+    Переходы статусов и чтение сразу после них (read-your-writes) — только SessionLocal.
+    """
+    maker = ReadSessionLocal if replica_router.use_replica else SessionLocal
+    async with maker() as session:
+        yield session
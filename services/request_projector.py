@@ -0,0 +1,160 @@
+"""
+Проекция requests из журнала request_events.
+
+Запуск из корня репозитория:
+    python -m services.request_projector backfill  # SNAPSHOT-события для заявок, созданных до журнала
+    python -m services.request_projector verify    # сравнить проекцию с requests, ничего не меняя
+    python -m services.request_projector rebuild   # переписать разошедшиеся и недостающие строки
+    [--batch 2000]                                 # заявок на пачку (одна транзакция)
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import logging
+import time
+from dataclasses import dataclass, field
+from typing import Any
+
+from db import SessionLocal, engine, init_db
+from repo.events_repo import (
+    PROJECTED_COLUMNS,
+    EventType,
+    append_events,
+    apply_event,
+    event_row,
+    get_event_batch,
+    get_projection_rows,
+    get_requests_without_events,
+    write_projection,
+)
+from repo.requests_repo import request_snapshots
+
+logger = logging.getLogger("ka_bot")
+
+_COMPARED = tuple(c for c in PROJECTED_COLUMNS if c != "external_id")
+
+
+@dataclass
+class ProjectionStats:
+    requests: int = 0
+    events: int = 0
+    mismatched: int = 0
+    missing: int = 0
+    seconds: float = 0.0
+    samples: list[str] = field(default_factory=list)
+
+    @property
+    def events_per_second(self) -> float:
+        return self.events / self.seconds if self.seconds > 0 else 0.0
+
+
+def _diff(row: dict[str, Any], state: dict[str, Any]) -> list[str]:
+    return [c for c in _COMPARED if row.get(c) != state.get(c)]
+
+
+async def backfill(batch: int = 2000) -> int:
+    """Заявкам без событий — одно SNAPSHOT-событие с текущей строкой (по пачкам, идемпотентно)."""
+    after_id = total = 0
+    while True:
+        async with SessionLocal() as session:
+            rows = await get_requests_without_events(session, after_id, batch)
+            if not rows:
+                break
+            await append_events(session, [
+                event_row(
+                    r.external_id,
+                    EventType.SNAPSHOT,
+                    {c: getattr(r, c) for c in _COMPARED},
+                    at=r.updated_at or r.created_at,
+                )
+                for r in rows
+            ])
+            await session.commit()
+        after_id = rows[-1].id
+        total += len(rows)
+    return total
+
+
+async def project(apply: bool, batch: int = 2000, max_samples: int = 20) -> ProjectionStats:
+    """
+    Сворачивает журнал пачками по external_id и сравнивает с requests.
+    apply=True — разошедшиеся строки переписываются, отсутствующие вставляются
+    (каждая пачка — одна транзакция: bulk UPDATE по PK + executemany INSERT).
+    """
+    stats = ProjectionStats()
+    started = time.perf_counter()
+    after = 0
+    while True:
+        async with SessionLocal() as session:
+            events = await get_event_batch(session, after, batch)
+            if not events:
+                break
+
+            states: dict[int, dict[str, Any]] = {}
+            for e in events:
+                states[e.external_id] = apply_event(
+                    states.get(e.external_id), e.type, json.loads(e.data) if e.data else None, e.created_at
+                )
+
+            current = await get_projection_rows(session, list(states))
+            updates, inserts = [], []
+            for external_id, state in states.items():
+                row = current.get(external_id)
+                if row is None:
+                    stats.missing += 1
+                    inserts.append({"external_id": external_id, **state})
+                    continue
+                diff = _diff(row, state)
+                if diff:
+                    stats.mismatched += 1
+                    if len(stats.samples) < max_samples:
+                        stats.samples.append(
+                            f"#{external_id}: " + ", ".join(f"{c} {row.get(c)!r} -> {state.get(c)!r}" for c in diff)
+                        )
+                    updates.append({"id": row["id"], **state})
+
+            if apply and (updates or inserts):
+                await write_projection(session, updates, inserts)
+                await session.commit()
+
+        stats.requests += len(states)
+        stats.events += len(events)
+        after = events[-1].external_id
+
+    if apply and (stats.mismatched or stats.missing):
+        request_snapshots.clear()
+    stats.seconds = time.perf_counter() - started
+    return stats
+
+
+async def main_async(args: argparse.Namespace) -> None:
+    await init_db()
+    try:
+        if args.command == "backfill":
+            started = time.perf_counter()
+            n = await backfill(args.batch)
+            print(f"backfill: {n} SNAPSHOT events in {time.perf_counter() - started:.1f}s")
+            return
+
+        stats = await project(apply=args.command == "rebuild", batch=args.batch)
+        print(
+            f"{args.command}: {stats.requests} requests, {stats.events} events in {stats.seconds:.1f}s "
+            f"({stats.events_per_second:,.0f} events/s); mismatched={stats.mismatched} missing={stats.missing}"
+        )
+        for line in stats.samples:
+            print("  " + line)
+    finally:
+        await engine.dispose()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("command", choices=("backfill", "verify", "rebuild"))
+    parser.add_argument("--batch", type=int, default=2000)
+    asyncio.run(main_async(parser.parse_args()))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from config import settings
+from db import SessionLocal
+from repo.checkpoints_repo import get_checkpoint, set_checkpoint
+from repo.retention_repo import purge_audit_payload_chunk, scrub_request_pii_chunk
+
+logger = logging.getLogger("ka_bot")
+
+ChunkFn = Callable[[AsyncSession, int, datetime, int], Awaitable[tuple[int, int | None]]]
+
+
+@dataclass
+class RetentionRun:
+    rule: str
+    rows: int
+    chunks: int
+    seconds: float
+    finished_at: datetime
+
+    @property
+    def rows_per_second(self) -> float:
+        return self.rows / self.seconds if self.seconds > 0 else 0.0
+
+
+# последний прогон каждого правила (для /metrics)
+last_runs: dict[str, RetentionRun] = {}
+
+
+async def _run_rule(rule: str, chunk_fn: ChunkFn, cutoff: datetime, restart_pass: bool) -> RetentionRun:
+    """
+    Пачки по PK от checkpoint: каждая пачка и новый checkpoint — одна короткая
+    транзакция, между пачками пауза. После рестарта продолжаем с checkpoint.
+    restart_pass — по окончании прохода checkpoint сбрасывается в 0
+    (под правило могут попадать и старые id, а не только новые).
+    """
+    name = f"retention.{rule}"
+    rows = chunks = 0
+    started = time.perf_counter()
+    paused = 0.0
+
+    while True:
+        async with SessionLocal() as session:
+            after_id = await get_checkpoint(session, name)
+            count, last_id = await chunk_fn(session, after_id, cutoff, settings.retention_chunk_rows)
+            if last_id is None:
+                if restart_pass and after_id:
+                    await set_checkpoint(session, name, 0)
+                break
+            await set_checkpoint(session, name, last_id, commit=False)
+            await session.commit()
+
+        rows += count
+        chunks += 1
+        await asyncio.sleep(settings.retention_chunk_pause_seconds)
+        paused += settings.retention_chunk_pause_seconds
+
+    run = RetentionRun(rule, rows, chunks, time.perf_counter() - started, datetime.now())
+    last_runs[rule] = run
+    if rows:
+        # rows/s — с учётом пауз, т.е. реальный темп чистки
+        logger.info(
+            "[Retention] %s: %s rows in %s chunks, %.1fs (%.1f rows/s, paused %.1fs)",
+            rule, rows, chunks, run.seconds, run.rows_per_second, paused,
+        )
+    return run
+
+
+async def run_retention_once() -> list[RetentionRun]:
+    runs = []
+    now = datetime.now()
+    if settings.retention_pii_days > 0:
+        runs.append(await _run_rule(
+            "requests_pii",
+            scrub_request_pii_chunk,
+            now - timedelta(days=settings.retention_pii_days),
+            restart_pass=True,
+        ))
+    if settings.retention_audit_payload_days > 0:
+        # audit_log append-only: created_at растёт вместе с id, проход не повторяем
+        runs.append(await _run_rule(
+            "audit_payload",
+            purge_audit_payload_chunk,
+            now - timedelta(days=settings.retention_audit_payload_days),
+            restart_pass=False,
+        ))
+    return runs
+
+
+async def retention_periodically(interval_seconds: float = 3600.0) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            await run_retention_once()
+        except Exception:
+            logger.exception("[Retention] purge failed")
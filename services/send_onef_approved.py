@@ -1,9 +1,11 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from datetime import datetime
 from typing import Literal, Optional
 
-from services.onef_utils import decision_at_iso_plus5
+from services.circuit_breaker import CircuitOpenError
+from services.onef_utils import decision_at_iso_plus5, onef_breaker
 import requests
 import logging
 import asyncio
@@ -30,10 +32,12 @@ async def send_ka_result_to_1f(
     ka_status: KAStatus,
     employee_tg_id: int,
     comment: str | None = None,
+    decided_at: datetime | None = None,
 ) -> None:
     """
     Отправка результата KA в 1F.
     По ТЗ вызывается после Approve/Reject, не после Accept.
+    Retry ERROR_ONEF передаёт decided_at — в 1F уходит время решения, а не повтора.
     """
     
     payload = {
@@ -43,30 +47,31 @@ async def send_ka_result_to_1f(
             "TelegramUserId": employee_tg_id
         },
         "Comment": comment or "",
-        "DecisionAt": decision_at_iso_plus5(),
+        "DecisionAt": decision_at_iso_plus5(decided_at),
     }
 
     url = "http://192.168.1.47/app/v1.2/api/publications/action/asrpoststatus" # dev
     # url = "http://192.168.1.38//app/v1.2/api/publications/action/asrpoststatus"  # main
 
     def _do_post():
-        return requests.post(url, json=payload, timeout=10)
-    
-    try:
-        resp = await asyncio.to_thread(_do_post)
+        resp = requests.post(url, json=payload, timeout=10)
         resp.raise_for_status()
+        return resp
+
+    try:
+        # при недоступном 1F breaker отвечает сразу, строка остаётся ERROR_ONEF для retry
+        await onef_breaker.call(asyncio.to_thread, _do_post)
         async with SessionLocal() as session:
-            await mark_onef_sent_done(session, request_id)
+            await mark_onef_sent_done(session, request_id, ka_status)
 
-        logger.info("TODO(1F) send_ka_result_to_1f payload=%s", payload)
+        logger.info("KA result sent to 1F status=%s", ka_status, extra={"external_id": request_id})
 
-    except requests.RequestException as e:
-        logger.error("Failed to send KA result to 1F: %s", e)
-        
+    except (requests.RequestException, CircuitOpenError) as e:
         async with SessionLocal() as session:
             await mark_onef_failed(session, request_id, str(e))
-        
-        logger.exception("Exception in send_ka_result_to_1f function request_id=%s", request_id)
-        raise
 
-    print("TODO(1F) send_ka_result_to_1f payload:", payload)
+        if isinstance(e, CircuitOpenError):
+            logger.warning("1F circuit open, KA result queued for retry", extra={"external_id": request_id})
+        else:
+            logger.exception("Failed to send KA result to 1F", extra={"external_id": request_id})
+        raise
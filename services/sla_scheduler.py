@@ -0,0 +1,227 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+from datetime import datetime, timedelta
+
+from bot_instance import bot
+from config import settings
+from db import SessionLocal
+from repo.audit_repo import add_audit_log
+from repo.requests_repo import (
+    get_max_request_id,
+    get_request_snapshot,
+    get_sla_candidates,
+    try_decline_request,
+)
+from services.bot_functions import accept_keyboard, render_request_text
+from services.group_routing import request_group_chat_id
+from services.timer_wheel import TimerWheel
+
+logger = logging.getLogger("ka_bot")
+
+# Виды дедлайнов (один активный дедлайн на заявку — ключ колеса = external_id)
+REMIND_NEW = "REMIND_NEW"
+RELEASE_ASSIGNED = "RELEASE_ASSIGNED"
+ESCALATE_IN_PROGRESS = "ESCALATE_IN_PROGRESS"
+
+
+class SlaScheduler:
+    """
+    SLA-таймеры заявок поверх TimerWheel:
+    - NEW дольше sla_new_remind_minutes -> повторный пинг группы
+    - ASSIGNED дольше sla_assigned_release_minutes -> возврат в NEW (как decline)
+    - IN_PROGRESS дольше sla_in_progress_escalate_minutes -> эскалация админам
+
+    При старте колесо восстанавливается из БД, далее обновляется хуками
+    из хендлеров и дочитывает новые заявки (id > последнего) от 1F.
+    Перед действием состояние всегда перепроверяется по БД.
+    """
+
+    def __init__(self, tick_seconds: float = 1.0, poll_seconds: float = 30.0) -> None:
+        self._tick = tick_seconds
+        self._poll = poll_seconds
+        self._wheel = TimerWheel()
+        self._last_request_id = 0
+
+    # ---------------------- hooks ----------------------
+    def on_new(self, external_id: int, since: datetime | None = None) -> None:
+        self._schedule_at(external_id, since, settings.sla_new_remind_minutes, (REMIND_NEW, None))
+
+    def on_assigned(self, external_id: int, executor_tg_id: int, since: datetime | None = None) -> None:
+        self._schedule_at(
+            external_id, since, settings.sla_assigned_release_minutes, (RELEASE_ASSIGNED, executor_tg_id)
+        )
+
+    def on_in_progress(self, external_id: int, executor_tg_id: int, since: datetime | None = None) -> None:
+        self._schedule_at(
+            external_id, since, settings.sla_in_progress_escalate_minutes, (ESCALATE_IN_PROGRESS, executor_tg_id)
+        )
+
+    def on_closed(self, external_id: int) -> None:
+        self._wheel.cancel(external_id)
+
+    def _schedule_at(self, external_id: int, since: datetime | None, minutes: int, payload: tuple) -> None:
+        if minutes <= 0:
+            self._wheel.cancel(external_id)
+            return
+        deadline = (since or datetime.now()) + timedelta(minutes=minutes)
+        delay = (deadline - datetime.now()).total_seconds()
+        self._wheel.schedule(external_id, max(1, int(delay / self._tick)), payload)
+
+    # ---------------------- DB sync ----------------------
+    async def rebuild(self) -> None:
+        self._last_request_id = 0
+        await self._load_new_rows()
+        logger.info("[SLA] rebuilt from DB: %s timers", len(self._wheel))
+
+    async def _load_new_rows(self) -> None:
+        async with SessionLocal() as session:
+            up_to_id = await get_max_request_id(session)
+            if up_to_id <= self._last_request_id:
+                return
+            rows = await get_sla_candidates(session, after_id=self._last_request_id, up_to_id=up_to_id)
+
+        for row in rows:
+            if row.status == "NEW":
+                self.on_new(row.external_id, row.created_at)
+            elif row.status == "ASSIGNED":
+                self.on_assigned(row.external_id, row.assigned_to_tg_id, row.assigned_at)
+            elif row.status == "IN_PROGRESS":
+                # отдельного времени перехода в IN_PROGRESS нет — считаем от assigned_at
+                self.on_in_progress(row.external_id, row.assigned_to_tg_id, row.assigned_at)
+
+        self._last_request_id = up_to_id
+
+    # ---------------------- loop ----------------------
+    async def run(self) -> None:
+        loop = asyncio.get_running_loop()
+        started = loop.time() - self._wheel.now * self._tick
+        next_poll = loop.time() + self._poll
+
+        while True:
+            await asyncio.sleep(self._tick)
+
+            if loop.time() >= next_poll:
+                next_poll = loop.time() + self._poll
+                try:
+                    await self._load_new_rows()
+                except Exception:
+                    logger.exception("[SLA] failed to load new requests")
+
+            for external_id, payload in self._wheel.advance(int((loop.time() - started) / self._tick)):
+                asyncio.create_task(self._fire(external_id, payload))
+
+    async def _fire(self, external_id: int, payload: tuple) -> None:
+        kind, executor_tg_id = payload
+        try:
+            if kind == REMIND_NEW:
+                await self._remind_new(external_id)
+            elif kind == RELEASE_ASSIGNED:
+                await self._release_assigned(external_id, executor_tg_id)
+            elif kind == ESCALATE_IN_PROGRESS:
+                await self._escalate_in_progress(external_id, executor_tg_id)
+        except Exception:
+            logger.exception("[SLA] %s failed external_id=%s", kind, external_id)
+
+    async def _remind_new(self, external_id: int) -> None:
+        async with SessionLocal() as session:
+            req = await get_request_snapshot(session, external_id)
+
+        if req is None or req.status != "NEW":
+            return
+
+        # повторяем напоминание, пока заявку не примут
+        self.on_new(external_id)
+
+        if not req.group_message_id:
+            return
+
+        await bot.send_message(
+            chat_id=request_group_chat_id(req),
+            text=f"⏰ Заявка #{external_id} ожидает принятия.",
+            reply_to_message_id=req.group_message_id,
+        )
+        logger.info("[SLA] reminded NEW #%s", external_id)
+
+    async def _release_assigned(self, external_id: int, executor_tg_id: int) -> None:
+        async with SessionLocal() as session:
+            released, req = await try_decline_request(session, external_id, executor_tg_id)
+
+        if not released or req is None:
+            return
+
+        async with SessionLocal() as session:
+            await add_audit_log(
+                session,
+                action="SLA_RELEASE_ASSIGNED",
+                entity="request",
+                entity_id=str(external_id),
+                actor_tg_id=None,
+                payload={
+                    "prev_status": "ASSIGNED",
+                    "new_status": "NEW",
+                    "released_tg_id": executor_tg_id,
+                    "group_message_id": req.group_message_id,
+                },
+            )
+
+        self.on_new(external_id)
+        logger.info("[SLA] released ASSIGNED #%s from tg_id=%s", external_id, executor_tg_id)
+
+        # вернуть кнопку Accept в группу
+        try:
+            if req.group_message_id:
+                await bot.edit_message_text(
+                    chat_id=request_group_chat_id(req),
+                    message_id=req.group_message_id,
+                    text=render_request_text(req.external_id, req.user_full_name, req.user_phone, req.car),
+                    reply_markup=accept_keyboard(req.external_id),
+                )
+        except Exception:
+            logger.exception("[SLA] failed to edit group message after release external_id=%s", external_id)
+
+        try:
+            await bot.send_message(
+                chat_id=executor_tg_id,
+                text=(
+                    f"⏰ Заявка #{external_id} не была взята в работу вовремя "
+                    "и возвращена в очередь."
+                ),
+            )
+        except Exception:
+            logger.exception("[SLA] failed to notify executor after release external_id=%s", external_id)
+
+    async def _escalate_in_progress(self, external_id: int, executor_tg_id: int) -> None:
+        async with SessionLocal() as session:
+            req = await get_request_snapshot(session, external_id)
+
+        if req is None or req.status != "IN_PROGRESS":
+            return
+
+        executor = f"@{req.assigned_to_username}" if req.assigned_to_username else f"ID:{executor_tg_id}"
+        text = (
+            f"🚨 Заявка #{external_id} в работе дольше "
+            f"{settings.sla_in_progress_escalate_minutes} мин.\n"
+            f"Исполнитель: {executor}"
+        )
+
+        for admin_id in settings.admin_id_list():
+            try:
+                await bot.send_message(chat_id=admin_id, text=text)
+            except Exception:
+                logger.exception("[SLA] failed to escalate to admin=%s external_id=%s", admin_id, external_id)
+
+        async with SessionLocal() as session:
+            await add_audit_log(
+                session,
+                action="SLA_ESCALATE_IN_PROGRESS",
+                entity="request",
+                entity_id=str(external_id),
+                actor_tg_id=None,
+                payload={"assigned_to_tg_id": executor_tg_id},
+            )
+        logger.info("[SLA] escalated IN_PROGRESS #%s", external_id)
+
+
+sla_scheduler = SlaScheduler()
@@ -0,0 +1,207 @@
+from __future__ import annotations
+
+import asyncio
+import json
+import logging
+import math
+from collections import defaultdict
+from datetime import date, datetime, timedelta
+from typing import Any
+
+from db import SessionLocal
+from models import StatusDurationRollup
+from repo.checkpoints_repo import get_checkpoint, set_checkpoint
+from repo.rollup_repo import (
+    get_audit_batch,
+    get_last_marks,
+    get_request_created_at,
+    get_rollups,
+    get_rollups_for_keys,
+)
+from services.read_replica import read_session
+
+logger = logging.getLogger("ka_bot")
+
+CHECKPOINT = "status_rollup.audit_id"
+
+# Этапы: событие-конец -> события, от последнего из которых считается начало
+# (для ACCEPT ещё и created_at заявки: заявка снова NEW после отказа / SLA-снятия / отключения исполнителя)
+STAGES = {
+    "ACCEPT": ("new_to_accept", ("DECLINE_ASSIGNED", "SLA_RELEASE_ASSIGNED", "RELEASE_DEACTIVATED")),
+    "IN_PROGRESS": ("accept_to_in_progress", ("ACCEPT",)),
+    "DECISION": ("in_progress_to_decision", ("IN_PROGRESS",)),
+}
+STAGE_NAMES = tuple(stage for stage, _ in STAGES.values())
+_MARK_ACTIONS = ("ACCEPT", "IN_PROGRESS", "DECLINE_ASSIGNED", "SLA_RELEASE_ASSIGNED", "RELEASE_DEACTIVATED")
+_ALL_ACTIONS = tuple(set(STAGES) | set(_MARK_ACTIONS))
+
+# запись audit_log видна чуть позже, чем получила id (конкурентные транзакции) —
+# свежие строки не берём, чтобы high-water mark их не перепрыгнул
+_SETTLE = timedelta(seconds=10)
+
+# лог-бакеты: 4 на каждое удвоение (~19% ширина), < 1 с — в нулевой
+_BUCKETS_PER_DOUBLING = 4
+
+
+def bucket_of(seconds: float) -> int:
+    return max(0, math.floor(_BUCKETS_PER_DOUBLING * math.log2(max(seconds, 1.0))))
+
+
+def bucket_value(bucket: int) -> float:
+    """Середина бакета (геометрическая), секунды."""
+    return 2 ** ((bucket + 0.5) / _BUCKETS_PER_DOUBLING)
+
+
+class Histogram:
+    """Разреженная лог-гистограмма длительностей (секунды)."""
+
+    __slots__ = ("count", "total", "buckets")
+
+    def __init__(self, count: int = 0, total: float = 0.0, buckets: dict[int, int] | None = None) -> None:
+        self.count = count
+        self.total = total
+        self.buckets = buckets or {}
+
+    @classmethod
+    def from_row(cls, row: StatusDurationRollup) -> Histogram:
+        return cls(row.count, row.total_seconds, {int(k): v for k, v in json.loads(row.histogram or "{}").items()})
+
+    def add(self, seconds: float) -> None:
+        b = bucket_of(seconds)
+        self.buckets[b] = self.buckets.get(b, 0) + 1
+        self.count += 1
+        self.total += seconds
+
+    def merge(self, other: Histogram) -> None:
+        for b, n in other.buckets.items():
+            self.buckets[b] = self.buckets.get(b, 0) + n
+        self.count += other.count
+        self.total += other.total
+
+    def percentile(self, p: float) -> float | None:
+        if not self.count:
+            return None
+        rank = p / 100 * self.count
+        seen = 0
+        for b in sorted(self.buckets):
+            seen += self.buckets[b]
+            if seen >= rank:
+                return bucket_value(b)
+        return bucket_value(max(self.buckets))
+
+    def to_json(self) -> str:
+        return json.dumps({str(b): n for b, n in sorted(self.buckets.items())}, separators=(",", ":"))
+
+    def summary(self) -> dict[str, Any]:
+        return {
+            "count": self.count,
+            "avg_seconds": round(self.total / self.count, 1) if self.count else None,
+            "p50_seconds": _round(self.percentile(50)),
+            "p90_seconds": _round(self.percentile(90)),
+            "p95_seconds": _round(self.percentile(95)),
+        }
+
+
+def _round(value: float | None) -> float | None:
+    return round(value, 1) if value is not None else None
+
+
+async def run_rollup_once(batch_size: int = 1000) -> int:
+    """
+    Обрабатывает одну пачку новых строк audit_log (id > high-water mark).
+    Роллапы и новый high-water mark пишутся одной транзакцией.
+    Возвращает число обработанных строк.
+    """
+    async with SessionLocal() as session:
+        after_id = await get_checkpoint(session, CHECKPOINT)
+        rows = await get_audit_batch(
+            session, after_id, _ALL_ACTIONS, created_before=datetime.now() - _SETTLE, limit=batch_size
+        )
+        if not rows:
+            return 0
+
+        entity_ids = {r.entity_id for r in rows}
+        marks = await get_last_marks(session, entity_ids, _MARK_ACTIONS, up_to_id=after_id)
+        created_at = await get_request_created_at(
+            session, [int(e) for e in entity_ids if e.lstrip("-").isdigit()]
+        )
+
+        deltas: dict[tuple[date, int, str], Histogram] = defaultdict(Histogram)
+        for row in rows:
+            entity_marks = marks.setdefault(row.entity_id, {})
+            stage = STAGES.get(row.action)
+            if stage is not None:
+                name, start_actions = stage
+                starts = [entity_marks[a] for a in start_actions if a in entity_marks]
+                if row.action == "ACCEPT" and row.entity_id.lstrip("-").isdigit():
+                    req_created = created_at.get(int(row.entity_id))
+                    if req_created is not None:
+                        starts.append(req_created)
+                if starts:
+                    seconds = max(0.0, (row.created_at - max(starts)).total_seconds())
+                    deltas[(row.created_at.date(), row.actor_tg_id or 0, name)].add(seconds)
+            if row.action in _MARK_ACTIONS:
+                entity_marks[row.action] = row.created_at
+
+        existing = await get_rollups_for_keys(session, deltas.keys())
+        for key, delta in deltas.items():
+            row = existing.get(key)
+            if row is None:
+                row = StatusDurationRollup(day=key[0], executor_tg_id=key[1], stage=key[2])
+                session.add(row)
+                hist = delta
+            else:
+                hist = Histogram.from_row(row)
+                hist.merge(delta)
+            row.count = hist.count
+            row.total_seconds = hist.total
+            row.histogram = hist.to_json()
+
+        await set_checkpoint(session, CHECKPOINT, rows[-1].id, commit=False)
+        await session.commit()
+
+    return len(rows)
+
+
+async def rollup_periodically(interval_seconds: float = 60.0) -> None:
+    while True:
+        await asyncio.sleep(interval_seconds)
+        try:
+            # догоняем отставание пачками, не дожидаясь следующего тика
+            while await run_rollup_once() > 0:
+                await asyncio.sleep(0)
+        except Exception:
+            logger.exception("[Rollup] time-in-status rollup failed")
+
+
+async def build_report(
+    date_from: date,
+    date_to: date,
+    executor_tg_id: int | None = None,
+) -> dict[str, Any]:
+    """
+    Перцентили времени по этапам за период: всего и по исполнителям
+    (дневные гистограммы сливаются).
+    """
+    async with read_session() as session:
+        rows = await get_rollups(session, date_from, date_to, executor_tg_id)
+
+    total: dict[str, Histogram] = defaultdict(Histogram)
+    by_executor: dict[int, dict[str, Histogram]] = defaultdict(lambda: defaultdict(Histogram))
+    for row in rows:
+        hist = Histogram.from_row(row)
+        total[row.stage].merge(hist)
+        by_executor[row.executor_tg_id][row.stage].merge(hist)
+
+    return {
+        "date_from": date_from.isoformat(),
+        "date_to": date_to.isoformat(),
+        "stages": {stage: total[stage].summary() for stage in STAGE_NAMES},
+        "executors": [
+            {
+                "executor_tg_id": tg_id,
+                "stages": {stage: stages[stage].summary() for stage in STAGE_NAMES if stage in stages},
+            }
+            for tg_id, stages in sorted(by_executor.items())
+        ],
+    }
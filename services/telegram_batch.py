@@ -0,0 +1,85 @@
+from __future__ import annotations
+
+import asyncio
+import logging
+import time
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import dataclass, field
+from typing import Any
+
+from aiogram.exceptions import TelegramBadRequest, TelegramRetryAfter
+
+logger = logging.getLogger("ka_bot")
+
+Job = Callable[[], Awaitable[Any]]
+
+
+@dataclass
+class BatchResult:
+    ok: int = 0
+    failed: int = 0
+    retried: int = 0
+    errors: list[str] = field(default_factory=list)
+
+
+async def run_paced(
+    jobs: Sequence[tuple[str, Job]],
+    *,
+    concurrency: int = 4,
+    per_second: float = 3.0,
+    max_retries: int = 3,
+) -> BatchResult:
+    """
+    Пачка вызовов Bot API: не больше concurrency одновременно и per_second стартов
+    в секунду (общий темп — лимиты Telegram на группу). TelegramRetryAfter
+    сдвигает темп всей пачки на retry_after и повторяет вызов.
+    jobs — [(метка для лога, фабрика корутины)].
+    """
+    result = BatchResult()
+    slots = asyncio.Semaphore(concurrency)
+    pace = asyncio.Lock()
+    interval = 1 / per_second
+    next_start = time.monotonic()
+
+    async def wait_turn() -> None:
+        nonlocal next_start
+        async with pace:
+            delay = next_start - time.monotonic()
+            next_start = max(next_start, time.monotonic()) + interval
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+    async def one(label: str, job: Job) -> None:
+        nonlocal next_start
+        async with slots:
+            for attempt in range(max_retries + 1):
+                await wait_turn()
+                try:
+                    await job()
+                except TelegramRetryAfter as e:
+                    if attempt == max_retries:
+                        result.failed += 1
+                        result.errors.append(f"{label}: flood control")
+                        return
+                    result.retried += 1
+                    async with pace:
+                        next_start = max(next_start, time.monotonic() + e.retry_after)
+                    continue
+                except TelegramBadRequest as e:
+                    # повторная правка тем же текстом — уже в нужном виде
+                    if "message is not modified" in str(e):
+                        result.ok += 1
+                    else:
+                        result.failed += 1
+                        result.errors.append(f"{label}: {e}")
+                    return
+                except Exception as e:
+                    logger.exception("[Batch] %s failed", label)
+                    result.failed += 1
+                    result.errors.append(f"{label}: {e}")
+                    return
+                result.ok += 1
+                return
+
+    await asyncio.gather(*(one(label, job) for label, job in jobs))
+    return result
@@ -0,0 +1,114 @@
+from __future__ import annotations
+
+from typing import Any, Hashable
+
+
+class _Timer:
+    __slots__ = ("key", "expires", "payload", "level", "slot")
+
+    def __init__(self, key: Hashable, expires: int, payload: Any) -> None:
+        self.key = key
+        self.expires = expires
+        self.payload = payload
+        self.level = 0
+        self.slot = 0
+
+
+class TimerWheel:
+    """
+    Иерархическое колесо таймеров (как в ядре Linux / Kafka).
+    - schedule / cancel / reschedule — O(1)
+    - один таймер на ключ: повторный schedule заменяет предыдущий
+    - advance(tick) двигает колесо и возвращает сработавшие таймеры
+
+    Время — в целых тиках. Диапазон без переполнения: slots ** levels тиков,
+    более дальние таймеры «паркуются» на верхнем уровне и перекладываются.
+    """
+
+    def __init__(self, slots: int = 64, levels: int = 4) -> None:
+        self._slots = slots
+        self._levels = levels
+        self._span = slots ** levels
+        self._wheels: list[list[dict[Hashable, _Timer]]] = [
+            [{} for _ in range(slots)] for _ in range(levels)
+        ]
+        self._timers: dict[Hashable, _Timer] = {}
+        self._now = 0
+
+    @property
+    def now(self) -> int:
+        return self._now
+
+    def __len__(self) -> int:
+        return len(self._timers)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._timers
+
+    def schedule(self, key: Hashable, delay_ticks: int, payload: Any = None) -> None:
+        self.cancel(key)
+        timer = _Timer(key, self._now + max(1, int(delay_ticks)), payload)
+        self._timers[key] = timer
+        self._place(timer)
+
+    def cancel(self, key: Hashable) -> Any:
+        timer = self._timers.pop(key, None)
+        if timer is None:
+            return None
+        del self._wheels[timer.level][timer.slot][key]
+        return timer.payload
+
+    def advance(self, until_tick: int) -> list[tuple[Hashable, Any]]:
+        """Прокручивает колесо до until_tick включительно."""
+        fired: list[tuple[Hashable, Any]] = []
+        while self._now < until_tick:
+            self._now += 1
+            self._cascade(1)
+
+            bucket = self._wheels[0][self._now % self._slots]
+            if not bucket:
+                continue
+            self._wheels[0][self._now % self._slots] = {}
+            for key, timer in bucket.items():
+                del self._timers[key]
+                fired.append((key, timer.payload))
+        return fired
+
+    def _cascade(self, level: int) -> None:
+        # уровень `level` перекладывается, когда все нижние уровни сделали полный оборот
+        if level >= self._levels:
+            return
+        unit = self._slots ** level
+        if self._now % unit:
+            return
+        self._cascade(level + 1)
+
+        slot = (self._now // unit) % self._slots
+        bucket = self._wheels[level][slot]
+        if not bucket:
+            return
+        self._wheels[level][slot] = {}
+        for timer in bucket.values():
+            self._place(timer)
+
+    def _place(self, timer: _Timer) -> None:
+        delta = timer.expires - self._now
+        if delta < 0:
+            # просроченный — сработает на ближайшем тике
+            timer.expires = self._now + 1
+            delta = 1
+
+        target = timer.expires
+        if delta >= self._span:
+            target = self._now + self._span - 1
+            delta = self._span - 1
+
+        level = 0
+        unit = 1
+        while delta >= unit * self._slots:
+            unit *= self._slots
+            level += 1
+
+        timer.level = level
+        timer.slot = (target // unit) % self._slots
+        self._wheels[level][timer.slot][timer.key] = timer
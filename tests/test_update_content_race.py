@@ -0,0 +1,56 @@
+"""
+Повтор 1F проигрывает гонку параллельному повтору: UPDATE по старому content_hash
+не находит строку, сессия откатывается — req должен остаться читаемым.
+
+Запуск из корня репозитория:
+    python -m pytest -q tests
+"""
+from __future__ import annotations
+
+import asyncio
+import tempfile
+
+from sqlalchemy import update
+
+# свой движок на временном файле: от порядка импорта и DATABASE_URL тест не зависит
+from db import init_db, make_engine, make_sessionmaker
+from models import Request
+from repo.requests_repo import create_if_not_exists, get_by_external_id, update_content_if_changed
+
+CAR = {"Brand": "Toyota", "Model": "Camry", "Motor": "2.5", "Price": "25000", "Currency": "USD", "Year": 2020, "Color": "White"}
+
+
+def test_lost_race_returns_fresh_row() -> None:
+    async def scenario() -> None:
+        engine = make_engine(f"sqlite+aiosqlite:///{tempfile.mkdtemp(prefix='ka_bot_test_')}/test.db")
+        SessionLocal = make_sessionmaker(engine)
+        try:
+            await init_db(engine)
+            async with SessionLocal() as session:
+                await create_if_not_exists(session, 1, "Ivan", "+992900000001", CAR)
+
+            async with SessionLocal() as session:
+                req = await get_by_external_id(session, 1)
+
+                # параллельный повтор успел поменять строку между чтением и UPDATE
+                async with SessionLocal() as other:
+                    await other.execute(
+                        update(Request)
+                        .where(Request.external_id == 1)
+                        .values(car_color="Red", content_hash="winner", is_sent_to_group=True)
+                    )
+                    await other.commit()
+
+                changes = await update_content_if_changed(
+                    session, req, "Ivan", "+992900000001", {**CAR, "Color": "Black"}
+                )
+
+                assert changes == {}
+                # после rollback объект перечитан: атрибуты доступны и свежие
+                assert req.is_sent_to_group is True
+                assert req.content_hash == "winner"
+                assert req.car_color == "Red"
+        finally:
+            await engine.dispose()
+
+    asyncio.run(scenario())